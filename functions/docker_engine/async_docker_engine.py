@@ -0,0 +1,347 @@
+from functions.docker_engine.pull_progress import *
+from threading import Thread
+from urllib.parse import quote, urlencode
+from docker.utils import convert_filters
+import asyncio, codecs, json, os, sys
+
+
+class DockerAPIError(Exception):
+
+    def __init__(self, status_code, explanation):
+        Exception.__init__(self, str(status_code) + " " + str(explanation))
+        self.status_code = status_code
+        self.explanation = explanation
+
+
+class AsyncDockerFunctions:
+
+    # an asyncio docker engine client talking HTTP over the docker unix socket, request\response calls share a pool of
+    # up to max_connections keep-alive connections while streaming calls (events, streamed stats & pulls) each get a
+    # dedicated connection, the event loop runs in a daemon thread of it's own so sync code can use run() to wait on it
+    def __init__(self, socket_path="/var/run/docker.sock", api_version=None, max_connections=32,
+                 pull_progress_interval=5):
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self.max_connections = max_connections
+        self.pull_progress_interval = pull_progress_interval
+        self.idle_connections = []
+        self.connection_semaphore = None
+        self.loop = None
+
+    # start the event loop thread & negotiate the api version with the docker engine
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        Thread(target=self.loop.run_forever, daemon=True).start()
+        self.run(self.connect())
+        return self
+
+    # close the pooled connections & stop the event loop thread
+    def stop(self):
+        self.run(self.close_idle_connections())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def close_idle_connections(self):
+        while len(self.idle_connections) > 0:
+            reader, writer = self.idle_connections.pop()
+            writer.close()
+
+    # run a coroutine on the event loop thread and block until it's done, this is how the sync code uses the backend
+    def run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    # iterate an async generator from sync code, each item is awaited on the event loop thread & closing the returned
+    # generator closes the async generator along with it's connection
+    def iterate(self, async_generator):
+        try:
+            while True:
+                try:
+                    yield self.run(async_generator.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            if self.loop.is_running():
+                self.run(async_generator.aclose())
+
+    async def connect(self):
+        self.connection_semaphore = asyncio.Semaphore(self.max_connections)
+        if self.api_version is None:
+            status_code, version = await self.request("GET", "/version", versioned=False)
+            self.api_version = version["ApiVersion"]
+
+    def url(self, path, params=None, versioned=True):
+        if versioned is True:
+            path = "/v" + str(self.api_version) + path
+        if params:
+            path = path + "?" + urlencode(params)
+        return path
+
+    async def acquire_connection(self):
+        while len(self.idle_connections) > 0:
+            reader, writer = self.idle_connections.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        return reader, writer, False
+
+    def release_connection(self, reader, writer, reusable):
+        if reusable is True and len(self.idle_connections) < self.max_connections:
+            self.idle_connections.append((reader, writer))
+        else:
+            writer.close()
+
+    @staticmethod
+    async def send_request(writer, method, url, body=None, headers=None):
+        request_head = method + " " + url + " HTTP/1.1\r\nHost: docker\r\n"
+        for header_name, header_value in (headers or {}).items():
+            request_head += header_name + ": " + header_value + "\r\n"
+        body_bytes = b""
+        if body is not None:
+            body_bytes = json.dumps(body).encode("utf-8")
+            request_head += "Content-Type: application/json\r\n"
+        request_head += "Content-Length: " + str(len(body_bytes)) + "\r\n\r\n"
+        writer.write(request_head.encode("latin-1") + body_bytes)
+        await writer.drain()
+
+    # read the status line & headers of a response, header names are lower cased
+    @staticmethod
+    async def read_response_head(reader):
+        response_head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status_code = int(response_head[0].split(" ")[1])
+        response_headers = {}
+        for header_line in response_head[1:]:
+            if ":" in header_line:
+                header_name, header_value = header_line.split(":", 1)
+                response_headers[header_name.strip().lower()] = header_value.strip()
+        return status_code, response_headers
+
+    # yield the body of a response as it arrives, supports chunked, content-length & read until closed bodies
+    @staticmethod
+    async def iter_response_body(reader, status_code, response_headers):
+        if status_code in (204, 304) or response_headers.get("content-length") == "0":
+            return
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                chunk_size = int((await reader.readuntil(b"\r\n")).split(b";")[0].strip(), 16)
+                if chunk_size == 0:
+                    while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                        pass
+                    return
+                chunk = await reader.readexactly(chunk_size + 2)
+                yield chunk[:-2]
+        elif "content-length" in response_headers:
+            yield await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                yield chunk
+
+    @staticmethod
+    def connection_reusable(response_headers):
+        if response_headers.get("connection", "").lower() == "close":
+            return False
+        return "content-length" in response_headers or \
+            response_headers.get("transfer-encoding", "").lower() == "chunked"
+
+    @staticmethod
+    def decode_body(body_bytes):
+        if not body_bytes:
+            return None
+        try:
+            return json.loads(body_bytes)
+        except ValueError:
+            return body_bytes.decode("utf-8", "replace")
+
+    # make a request\response call over a pooled connection, a reused connection the engine already closed is retried
+    # once over a fresh connection, returns the status code & the decoded body & raises DockerAPIError on errors
+    async def request(self, method, path, params=None, body=None, headers=None, versioned=True):
+        url = self.url(path, params=params, versioned=versioned)
+        async with self.connection_semaphore:
+            for attempt in range(2):
+                reader, writer, reused = await self.acquire_connection()
+                try:
+                    await self.send_request(writer, method, url, body=body, headers=headers)
+                    status_code, response_headers = await self.read_response_head(reader)
+                    body_chunks = []
+                    async for chunk in self.iter_response_body(reader, status_code, response_headers):
+                        body_chunks.append(chunk)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    writer.close()
+                    if reused is True and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                self.release_connection(reader, writer, self.connection_reusable(response_headers))
+                break
+        response_body = self.decode_body(b"".join(body_chunks))
+        if status_code >= 400:
+            if isinstance(response_body, dict):
+                response_body = response_body.get("message", response_body)
+            raise DockerAPIError(status_code, response_body)
+        return status_code, response_body
+
+    # make a streaming call over a dedicated connection and yield each json object the engine sends as it arrives, the
+    # body is decoded incrementally as a chunk can end in the middle of a multi byte character
+    async def stream(self, method, path, params=None, body=None, headers=None):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            await self.send_request(writer, method, self.url(path, params=params), body=body, headers=headers)
+            status_code, response_headers = await self.read_response_head(reader)
+            if status_code >= 400:
+                body_chunks = []
+                async for chunk in self.iter_response_body(reader, status_code, response_headers):
+                    body_chunks.append(chunk)
+                response_body = self.decode_body(b"".join(body_chunks))
+                if isinstance(response_body, dict):
+                    response_body = response_body.get("message", response_body)
+                raise DockerAPIError(status_code, response_body)
+            json_decoder = json.JSONDecoder()
+            utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+            buffered = ""
+            async for chunk in self.iter_response_body(reader, status_code, response_headers):
+                buffered += utf8_decoder.decode(chunk)
+                while True:
+                    buffered = buffered.lstrip()
+                    if buffered == "":
+                        break
+                    try:
+                        decoded_object, decoded_end = json_decoder.raw_decode(buffered)
+                    except ValueError:
+                        break
+                    buffered = buffered[decoded_end:]
+                    yield decoded_object
+        finally:
+            writer.close()
+
+    # list containers matching the filters (in the docker-py filters format), if show_all_containers=True will also show
+    # containers that have exited
+    async def list_containers(self, filters=None, show_all_containers=False):
+        params = {"all": "1" if show_all_containers is True else "0"}
+        if filters:
+            params["filters"] = convert_filters(filters)
+        status_code, containers = await self.request("GET", "/containers/json", params=params)
+        return containers
+
+    async def inspect_container(self, container_name):
+        status_code, container_inspection = await self.request("GET", "/containers/" + quote(container_name) + "/json")
+        return container_inspection
+
+    # get a single stats sample of a container or if stream=True an async generator of samples
+    async def stats(self, container_name, stream=False):
+        if stream is True:
+            return self.stream("GET", "/containers/" + quote(container_name) + "/stats", params={"stream": "1"})
+        status_code, container_stats = await self.request("GET", "/containers/" + quote(container_name) + "/stats",
+                                                          params={"stream": "0"})
+        return container_stats
+
+    # an async generator of decoded docker events matching the filters (in the docker-py filters format)
+    def events(self, filters=None, since=None):
+        params = {}
+        if filters:
+            params["filters"] = convert_filters(filters)
+        if since is not None:
+            params["since"] = str(since)
+        return self.stream("GET", "/events", params=params)
+
+    # create a container from a container config built by DockerFunctions.create_container_config
+    async def create_container(self, container_name, container_config):
+        print("creating container " + container_name)
+        try:
+            status_code, container_created = await self.request("POST", "/containers/create",
+                                                                params={"name": container_name}, body=container_config)
+            print(("successfully created container " + container_name))
+            return container_created
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed creating container " + container_name)
+            os._exit(2)
+
+    # start container, returns False if docker refused to start it
+    async def start_container(self, container_name):
+        print(("starting container " + container_name))
+        try:
+            await self.request("POST", "/containers/" + quote(container_name) + "/start")
+            return True
+        except DockerAPIError as e:
+            print(e, file=sys.stderr)
+            print("problem starting container - most likely port bind already taken")
+            return False
+
+    # stop container, default timeout set to 5 seconds, will try to kill if stop failed
+    async def stop_container(self, container_name, stop_timout=5):
+        print(("stopping container " + container_name))
+        try:
+            await self.request("POST", "/containers/" + quote(container_name) + "/stop",
+                               params={"t": str(stop_timout)})
+        except Exception:
+            try:
+                await self.request("POST", "/containers/" + quote(container_name) + "/kill", params={"signal": "9"})
+                await asyncio.sleep(3)
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("problem stopping container " + container_name)
+                os._exit(2)
+
+    async def remove_container(self, container_name):
+        print(("removing container " + container_name))
+        try:
+            await self.request("DELETE", "/containers/" + quote(container_name))
+        except Exception:
+            try:
+                await self.request("DELETE", "/containers/" + quote(container_name), params={"force": "1"})
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("problem removing container " + container_name)
+                os._exit(2)
+
+    async def stop_and_remove_container(self, container_name):
+        await self.stop_container(container_name)
+        await self.remove_container(container_name)
+
+    async def stop_and_remove_containers(self, container_names):
+        await asyncio.gather(*[self.stop_and_remove_container(container_name) for container_name in container_names])
+
+    async def connect_to_network(self, container_name, net_id):
+        try:
+            await self.request("POST", "/networks/" + quote(net_id) + "/connect", body={"Container": container_name})
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem connecting to network " + net_id)
+            os._exit(2)
+
+    # create, start & connect a container to it's extra networks, container_run is built by
+    # DockerFunctions.create_container_run, returns False if the container didn't start
+    async def run_container(self, container_run):
+        await self.create_container(container_run["name"], container_run["config"])
+        if await self.start_container(container_run["name"]) is False:
+            return False
+        for net_id in container_run["network_ids"]:
+            await self.connect_to_network(container_run["name"], net_id)
+        return True
+
+    # returns whether each of the containers started, in the order they were given
+    async def run_containers(self, container_runs):
+        return await asyncio.gather(*[self.run_container(container_run) for container_run in container_runs])
+
+    # pull image with optional version tag, registry_auth_header is the X-Registry-Auth header value as returned by
+    # DockerFunctions.registry_auth_header, returns the final record of the pull
+    async def pull_image(self, image_name, version_tag="latest", registry_auth_header=None):
+        pull_progress = PullProgressTracker(image_name + ":" + str(version_tag),
+                                            summary_interval=self.pull_progress_interval)
+        headers = {}
+        if registry_auth_header:
+            headers["X-Registry-Auth"] = registry_auth_header
+        try:
+            async for progress_event in self.stream("POST", "/images/create",
+                                                    params={"fromImage": image_name, "tag": str(version_tag)},
+                                                    headers=headers):
+                pull_progress.update(progress_event)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem pulling image " + image_name + ":" + str(version_tag))
+            os._exit(2)
+        return pull_progress.finish()
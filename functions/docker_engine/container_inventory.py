@@ -0,0 +1,251 @@
+from threading import Thread, Lock, Event
+import os, sys, time
+
+# docker event actions which leave a container running\not running
+RUNNING_ACTIONS = ("start", "restart", "unpause")
+NOT_RUNNING_ACTIONS = {"die": "exited", "pause": "paused"}
+
+
+def container_name(container):
+    return container["Names"][0].lstrip("/")
+
+
+# the (container_type, app_name\cron_job_name) a container is indexed under, read from it's nebula labels
+def container_index_key(container):
+    labels = container.get("Labels") or {}
+    container_type = labels.get("container_type", "app")
+    return container_type, labels.get(container_type + "_name", "")
+
+
+# read the health of a container from the status docker lists it with, e.g. "Up 2 minutes (unhealthy)"
+def container_health(container):
+    for health in ("unhealthy", "healthy", "starting"):
+        if "(" + health in (container.get("Status") or ""):
+            return health
+    return None
+
+
+class ContainerInventory:
+
+    # an in memory copy of the nebula managed containers built with a single list call & then kept fresh from the
+    # docker events stream & from the worker own container changes, so listing the containers of an app doesn't cost a
+    # docker API call no matter how many apps there are, it's fully resynced every resync_interval seconds & whenever
+    # the events stream reconnects in case an event was missed
+    def __init__(self, docker_connection_object, resync_interval=300, reconnect_wait=5):
+        self.docker_connection = docker_connection_object
+        self.resync_interval = resync_interval
+        self.reconnect_wait = reconnect_wait
+        self.lock = Lock()
+        self.refresh_lock = Lock()
+        self.containers = {}
+        self.container_ids_by_key = {}
+        self.stale_container_names = set()
+        self.changes = 0
+        self.synced = False
+        self.synced_time = None
+        self.stop_event = Event()
+
+    # build the inventory & start keeping it fresh, exits the worker if docker couldn't be listed to begin with
+    def start(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed building the containers inventory")
+            os._exit(2)
+        Thread(target=self.watch_container_events, daemon=True).start()
+        Thread(target=self.resync_loop, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def list_all_containers(self, filters=None):
+        label_filters = {"label": ["orchestrator=nebula"]}
+        label_filters.update(filters or {})
+        return self.docker_connection.cli.containers(filters=label_filters, all=True)
+
+    # replace the whole inventory with a fresh list of the containers, if the inventory was changed while the list call
+    # was in flight the list might already be outdated so it's retried
+    def sync(self, attempts=3):
+        for attempt in range(attempts):
+            with self.lock:
+                changes = self.changes
+            synced_time = time.time()
+            containers_list = self.list_all_containers()
+            with self.lock:
+                if self.changes != changes and attempt < attempts - 1:
+                    continue
+                self.containers = {}
+                self.container_ids_by_key = {}
+                for container in containers_list:
+                    self.add_container(container)
+                self.synced = True
+                self.synced_time = synced_time
+                return
+
+    # the inventory methods below expect the caller to hold the lock
+    def add_container(self, container):
+        self.remove_container(container["Id"])
+        container = dict(container, Health=container_health(container))
+        self.containers[container["Id"]] = container
+        self.container_ids_by_key.setdefault(container_index_key(container), set()).add(container["Id"])
+
+    def remove_container(self, container_id):
+        container = self.containers.pop(container_id, None)
+        if container is not None:
+            self.container_ids_by_key.get(container_index_key(container), set()).discard(container_id)
+        return container
+
+    def find_container(self, container):
+        if container in self.containers:
+            return self.containers[container]
+        for inventory_container in self.containers.values():
+            if container_name(inventory_container) == container:
+                return inventory_container
+        return None
+
+    # refresh the containers which were created since the last read with a single list call, the worker creates
+    # containers in batches so this costs a call per batch rather then per container, concurrent reads wait for the
+    # refresh in flight rather then reading the inventory without the containers it's refreshing
+    def refresh_stale_containers(self):
+        with self.refresh_lock:
+            with self.lock:
+                stale_container_names = self.stale_container_names
+                self.stale_container_names = set()
+            if len(stale_container_names) == 0:
+                return
+            try:
+                # the name filter matches partial names so only exact matches are kept
+                containers_list = [container for container in self.list_all_containers(
+                    filters={"name": sorted(stale_container_names)})
+                                   if container_name(container) in stale_container_names]
+            except Exception:
+                with self.lock:
+                    self.stale_container_names.update(stale_container_names)
+                raise
+            with self.lock:
+                for container in list(self.containers.values()):
+                    if container_name(container) in stale_container_names:
+                        self.remove_container(container["Id"])
+                for container in containers_list:
+                    self.add_container(container)
+                self.changes += 1
+
+    # mark a container to be refreshed on the next read, used when a container is created
+    def container_created(self, container_name_to_refresh):
+        with self.lock:
+            self.stale_container_names.add(container_name_to_refresh)
+            self.changes += 1
+
+    def container_state_changed(self, container, state):
+        with self.lock:
+            inventory_container = self.find_container(container)
+            if inventory_container is not None:
+                inventory_container["State"] = state
+                inventory_container["Status"] = state
+                if state != "running":
+                    inventory_container["Health"] = None
+            self.changes += 1
+
+    def container_health_changed(self, container, health):
+        with self.lock:
+            inventory_container = self.find_container(container)
+            if inventory_container is not None:
+                inventory_container["Health"] = health
+            self.changes += 1
+
+    def container_renamed(self, container, new_container_name):
+        with self.lock:
+            inventory_container = self.find_container(container)
+            if inventory_container is not None:
+                inventory_container["Names"] = ["/" + new_container_name]
+            else:
+                # a container which wasn't refreshed since it was created is refreshed under it's new name
+                self.stale_container_names.discard(container)
+                self.stale_container_names.add(new_container_name)
+            self.changes += 1
+
+    def container_removed(self, container):
+        with self.lock:
+            inventory_container = self.find_container(container)
+            if inventory_container is not None:
+                self.remove_container(inventory_container["Id"])
+            self.stale_container_names.discard(container)
+            self.changes += 1
+
+    # apply a single docker event to the inventory
+    def apply_event(self, event):
+        action = event.get("Action", event.get("status", ""))
+        actor = event.get("Actor") or {}
+        container_id = actor.get("ID", event.get("id"))
+        attributes = actor.get("Attributes") or {}
+        if action == "create":
+            with self.lock:
+                known_container = container_id in self.containers
+            if known_container is False:
+                self.container_created(attributes.get("name", container_id))
+        elif action in RUNNING_ACTIONS:
+            self.container_state_changed(container_id, "running")
+        elif action in NOT_RUNNING_ACTIONS:
+            self.container_state_changed(container_id, NOT_RUNNING_ACTIONS[action])
+        elif action == "rename" and "name" in attributes:
+            self.container_renamed(container_id, attributes["name"])
+        elif action == "destroy":
+            self.container_removed(container_id)
+        elif action.startswith("health_status: "):
+            self.container_health_changed(container_id, action[len("health_status: "):])
+
+    def events_filters(self):
+        return {"type": "container", "label": ["orchestrator=nebula"]}
+
+    # block on the docker events stream applying every event to the inventory, events are read from the time of the
+    # last sync so nothing which happened in between is missed & if the stream breaks the inventory is resynced
+    def watch_container_events(self):
+        while self.stop_event.is_set() is False:
+            try:
+                for event in self.docker_connection.container_events(filters=self.events_filters(),
+                                                                     since=int(self.synced_time)):
+                    if self.stop_event.is_set() is True:
+                        return
+                    self.apply_event(event)
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("lost connection to the docker events stream, resyncing the containers inventory")
+            if self.stop_event.wait(self.reconnect_wait) is True:
+                return
+            self.resync()
+
+    def resync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed resyncing the containers inventory")
+
+    def resync_loop(self):
+        while self.stop_event.wait(self.resync_interval) is False:
+            self.resync()
+
+    # same as DockerFunctions.list_containers but read from the inventory, returns None if the inventory can't be
+    # trusted so the caller lists the containers from docker instead
+    def list_containers(self, app_name="", show_all_containers=True, container_type="app"):
+        if self.synced is False:
+            return None
+        try:
+            self.refresh_stale_containers()
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed refreshing the containers inventory")
+            return None
+        with self.lock:
+            if app_name != "":
+                container_ids = self.container_ids_by_key.get((container_type, app_name), set())
+            elif container_type == "all":
+                container_ids = self.containers.keys()
+            else:
+                container_ids = [container_id for index_key, index_container_ids in self.container_ids_by_key.items()
+                                 if index_key[0] == container_type for container_id in index_container_ids]
+            containers_list = [dict(self.containers[container_id]) for container_id in container_ids]
+        if show_all_containers is False:
+            containers_list = [container for container in containers_list if container["State"] == "running"]
+        return sorted(containers_list, key=lambda container: container["Names"][0])
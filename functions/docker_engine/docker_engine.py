@@ -1,10 +1,66 @@
-import json, os, time, sys, docker
+from functions.docker_engine.pull_progress import *
+from functions.misc.metrics import metrics, InstrumentedProxy
+from functions.misc.tracing import tracer, trace_methods
+from functions.misc.record_replay import RecordingProxy
+from collections import deque
+from threading import Thread
+import os, time, sys, docker
 
+# the label containers are marked with the fingerprint of the app spec they were created from
+SPEC_HASH_LABEL = "nebula_spec_hash"
 
+# the docker client methods which call the docker engine API & are timed, the client's create_*_config helpers only
+# build request bodies locally & events is always a never ending stream so they're left out
+DOCKER_API_METHODS = ("containers", "inspect_container", "create_container", "start", "stop", "kill", "restart",
+                      "rename", "remove_container", "prune_containers", "stats", "connect_container_to_network",
+                      "networks", "create_network", "images", "inspect_image", "remove_image", "prune_images",
+                      "inspect_distribution", "pull", "login")
+
+
+@trace_methods
 class DockerFunctions:
 
-    def __init__(self):
-        self.cli = docker.APIClient(base_url='unix://var/run/docker.sock', version="auto")
+    # if an asyncio backend (AsyncDockerFunctions) is given batches of containers are started\stopped & images are
+    # pulled on it's event loop rather then with a thread per container\pull, base_url is the docker engine to work
+    # against, docker_client replaces the docker API client (used to replay recorded traffic) & if traffic_recorder is
+    # given every docker API call is recorded to it, once a container_inventory (ContainerInventory) is set containers
+    # are listed from it rather then from docker & every container change the worker makes is written through to it,
+    # max_pool_size is the number of connections to the docker engine which are kept open for reuse
+    def __init__(self, pull_progress_interval=5, pull_records_to_keep=50, async_backend=None,
+                 base_url="unix://var/run/docker.sock", docker_client=None, traffic_recorder=None, max_pool_size=10):
+        if docker_client is None:
+            docker_client = docker.APIClient(base_url=base_url, version="auto", max_pool_size=max_pool_size)
+        if traffic_recorder is not None:
+            docker_client = RecordingProxy(docker_client, traffic_recorder, "docker")
+        # every docker API call is timed into a per operation latency histogram
+        self.cli = InstrumentedProxy(docker_client,
+                                     metrics.histogram("nebula_worker_docker_api_duration_seconds",
+                                                       "Docker engine API call latency per operation",
+                                                       label_names=("operation",)),
+                                     DOCKER_API_METHODS)
+        self.async_backend = async_backend
+        self.container_inventory = None
+        self.pull_progress_interval = pull_progress_interval
+        self.pull_records = deque(maxlen=pull_records_to_keep)
+
+    # list containers straight from the docker engine (on the asyncio backend if one is given) in the docker-py filters
+    # format, unlike list_containers this never reads from the containers inventory
+    def engine_list_containers(self, filters=None, show_all_containers=False):
+        if self.async_backend is not None:
+            return self.async_backend.run(self.async_backend.list_containers(filters=filters,
+                                                                             show_all_containers=show_all_containers))
+        return self.cli.containers(filters=filters, all=show_all_containers)
+
+    def engine_inspect_container(self, container_name):
+        if self.async_backend is not None:
+            return self.async_backend.run(self.async_backend.inspect_container(container_name))
+        return self.cli.inspect_container(container_name)
+
+    # get a single stats sample of a container
+    def engine_container_stats(self, container_name):
+        if self.async_backend is not None:
+            return self.async_backend.run(self.async_backend.stats(container_name))
+        return self.cli.stats(container_name, stream=False)
 
     # check network exists:
     def check_network_exists(self, net_name):
@@ -24,17 +80,25 @@ class DockerFunctions:
     # list containers based on said image, if no app_name provided gets all of nebula managed apps, if all=True will
     # also show containers that have exited
     def list_containers(self, app_name="", show_all_containers=True, container_type="app"):
+        if self.container_inventory is not None:
+            containers_list = self.container_inventory.list_containers(app_name,
+                                                                       show_all_containers=show_all_containers,
+                                                                       container_type=container_type)
+            if containers_list is not None:
+                return containers_list
         if app_name == "" and container_type == "all":
             try:
-                return self.cli.containers(filters={"label": "orchestrator=nebula"}, all=show_all_containers)
+                return self.engine_list_containers(filters={"label": "orchestrator=nebula"},
+                                                   show_all_containers=show_all_containers)
             except Exception as e:
                 print(e, file=sys.stderr)
                 print("failed getting list of all containers")
                 os._exit(2)
         elif app_name == "" and container_type != "all":
             try:
-                return self.cli.containers(filters={"label": ["orchestrator=nebula", "container_type=" + container_type]},
-                                           all=show_all_containers)
+                return self.engine_list_containers(filters={"label": ["orchestrator=nebula",
+                                                                      "container_type=" + container_type]},
+                                                   show_all_containers=show_all_containers)
             except Exception as e:
                 print(e, file=sys.stderr)
                 print("failed getting list of all containers from type " + container_type)
@@ -42,8 +106,8 @@ class DockerFunctions:
         else:
             try:
                 app_label = container_type + "_name=" + app_name
-                return self.cli.containers(filters={"label": [app_label, "orchestrator=nebula"]},
-                                           all=show_all_containers)
+                return self.engine_list_containers(filters={"label": [app_label, "orchestrator=nebula"]},
+                                                   show_all_containers=show_all_containers)
             except Exception as e:
                 print(e, file=sys.stderr)
                 print("failed getting list of containers where label is app_name=" + app_name)
@@ -57,18 +121,26 @@ class DockerFunctions:
                                                    container_type=container_type)
             containers_stats = []
             for container in containers_list:
-                containers_stats.append(self.cli.stats(container['Id'], stream=False))
+                containers_stats.append(self.engine_container_stats(container['Id']))
             return containers_stats
         except Exception as e:
             print(e, file=sys.stderr)
             print("failed getting stats of containers where label is " + container_type + "_name=" + app_name)
             os._exit(2)
 
+    # return a blocking generator of decoded stats samples of a container, docker pushes a new sample roughly every
+    # second for as long as the container is running
+    def stream_container_stats(self, container_id):
+        if self.async_backend is not None:
+            container_stats = self.async_backend.run(self.async_backend.stats(container_id, stream=True))
+            return self.async_backend.iterate(container_stats)
+        return self.cli.stats(container_id, stream=True, decode=True)
+
     # check if a container is healthy by examining the result of the dockerfile healthcheck, if no healthcheck is
     # configured assumes the container to always be healthy.
     def check_container_healthy(self, container_id):
         try:
-            container_inspection = self.cli.inspect_container(container_id)
+            container_inspection = self.engine_inspect_container(container_id)
             if "Health" in container_inspection["State"]:
                 # check if the container is unhealthy and for a bunch of edge cases so it won't try to restart a
                 # container that's in the process of being removed\replaced
@@ -91,6 +163,45 @@ class DockerFunctions:
             container_healthy = True
         return container_healthy
 
+    # list the running nebula managed containers which docker currently reports as unhealthy, done in a single filtered
+    # call rather then inspecting each container in turn, always asked from docker rather then the containers inventory
+    # as this is the backstop for health events the events stream missed
+    def list_unhealthy_containers(self, container_type="app"):
+        try:
+            return self.engine_list_containers(filters={"label": ["orchestrator=nebula",
+                                                                  "container_type=" + container_type],
+                                                        "health": "unhealthy"})
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed getting list of unhealthy containers from type " + container_type)
+            return []
+
+    # return a blocking generator of decoded docker events matching the given filters
+    def container_events(self, filters=None, since=None):
+        if self.async_backend is not None:
+            return self.async_backend.iterate(self.async_backend.events(filters=filters, since=since))
+        return self.cli.events(filters=filters, since=since, decode=True)
+
+    # wait until a container is ready - healthy if it has a healthcheck or running if it doesn't, returns False if it
+    # wasn't ready before the timeout passed
+    def wait_for_container_ready(self, container_name, timeout=60, poll_interval=0.5):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                container_state = self.engine_inspect_container(container_name)["State"]
+                if "Health" in container_state:
+                    if container_state["Health"]["Status"] == "healthy":
+                        return True
+                elif container_state["Running"] is True:
+                    return True
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed getting state of container " + container_name)
+            if time.monotonic() >= deadline:
+                print("container " + container_name + " wasn't ready after " + str(timeout) + " seconds")
+                return False
+            time.sleep(poll_interval)
+
     # login to docker registry
     def registry_login(self, registry_user=None, registry_pass=None, registry_host=""):
         if registry_user is not None and registry_user != "skip" and registry_pass is not None and \
@@ -105,17 +216,100 @@ class DockerFunctions:
         else:
             print("no registry user pass combo defined, skipping registry login")
 
-    # pull image with optional version tag and registry auth
+    # pull image with optional version tag and registry auth, the progress events are aggregated per layer with a
+    # summary printed every pull_progress_interval seconds and a final record of the pull kept in pull_records
     def pull_image(self, image_name, version_tag="latest"):
         print("pulling image " + image_name + ":" + str(version_tag))
+        if self.async_backend is not None:
+            pull_record = self.async_backend.run(self.async_backend.pull_image(
+                image_name, version_tag=version_tag, registry_auth_header=self.registry_auth_header(image_name)))
+        else:
+            pull_progress = PullProgressTracker(image_name + ":" + str(version_tag),
+                                                summary_interval=self.pull_progress_interval)
+            try:
+                for progress_event in self.cli.pull(image_name, str(version_tag), stream=True, decode=True):
+                    pull_progress.update(progress_event)
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("problem pulling image " + image_name + ":" + str(version_tag))
+                os._exit(2)
+            pull_record = pull_progress.finish()
+        self.pull_records.append(pull_record)
+        if pull_record["error"] is not None:
+            print("problem pulling image " + image_name + ":" + str(version_tag) + " - " + str(pull_record["error"]))
+        else:
+            print("pulled image " + pull_record["image"] + " in " + str(pull_record["duration_seconds"]) +
+                  " seconds, " + str(pull_record["fresh_layers"]) + " fresh & " + str(pull_record["cached_layers"]) +
+                  " cached layers, " + str(pull_record["bytes_downloaded"]) + " bytes downloaded")
+        return pull_record
+
+    # return the records of the pulls done since the last time this was called
+    def pop_pull_records(self):
+        pull_records = []
+        while len(self.pull_records) > 0:
+            pull_records.append(self.pull_records.popleft())
+        return pull_records
+
+    # return the repo digests of a local image, an empty list if the image isn't present locally
+    def get_local_image_digests(self, image_reference):
         try:
-            print(image_name)
-            for line in self.cli.pull(image_name, str(version_tag), stream=True):
-                print(json.dumps(json.loads(line), indent=4))
+            return self.cli.inspect_image(image_reference).get("RepoDigests") or []
+        except docker.errors.ImageNotFound:
+            return []
         except Exception as e:
             print(e, file=sys.stderr)
-            print("problem pulling image " + image_name + ":" + str(version_tag))
-            os._exit(2)
+            print("problem inspecting local image " + image_reference)
+            return []
+
+    # return the id of a local image, None if the image isn't present locally
+    def get_local_image_id(self, image_reference):
+        try:
+            return self.cli.inspect_image(image_reference)["Id"]
+        except docker.errors.ImageNotFound:
+            return None
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem inspecting local image " + image_reference)
+            return None
+
+    # return the local images, None if they couldn't be listed
+    def list_images(self):
+        try:
+            return self.cli.images()
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem listing local images")
+            return None
+
+    # return the ids of the images all containers (nebula managed or not, running or not) were created from, None if
+    # the containers couldn't be listed
+    def list_container_image_ids(self):
+        try:
+            return set(container["ImageID"] for container in self.engine_list_containers(show_all_containers=True))
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem listing the images of containers")
+            return None
+
+    # remove a local image tag (or an untagged image by it's id), returns False if docker refused removing it
+    def remove_image(self, image_reference):
+        print("removing image " + image_reference)
+        try:
+            self.cli.remove_image(image_reference)
+            return True
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem removing image " + image_reference)
+            return False
+
+    # return the digest the registry currently holds for an image tag, None if it couldn't be checked
+    def get_registry_image_digest(self, image_reference):
+        try:
+            return self.cli.inspect_distribution(image_reference)["Descriptor"]["digest"]
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem getting registry digest of image " + image_reference)
+            return None
 
     # prune unused images
     def prune_images(self):
@@ -127,24 +321,49 @@ class DockerFunctions:
             print("problem pruning unused image")
             os._exit(2)
 
+    # the labels nebula uses to track the containers it manages
+    def container_labels(self, app_name, container_type="app", spec_hash=None):
+        labels = {
+            container_type + "_name": app_name,
+            "orchestrator": "nebula",
+            "container_type": container_type
+        }
+        if spec_hash is not None:
+            labels[SPEC_HASH_LABEL] = spec_hash
+        return labels
+
+    # build the config a container is created from without creating it, used to create containers on the asyncio
+    # backend from the same config the sync create_container would use
+    def create_container_config(self, app_name, image_name, host_configuration, container_ports=[], env_vars=[],
+                                volume_mounts=[], default_network="nebula", container_type="app", spec_hash=None):
+        return self.cli.create_container_config(image_name, None, ports=container_ports, environment=env_vars,
+                                                host_config=host_configuration,
+                                                labels=self.container_labels(app_name, container_type, spec_hash),
+                                                volumes=volume_mounts,
+                                                networking_config=self.create_networking_config(default_network))
+
     # create container
     def create_container(self, app_name, container_name, image_name, host_configuration, container_ports=[],
-                         env_vars=[], volume_mounts=[], default_network="nebula", container_type="app"):
+                         env_vars=[], volume_mounts=[], default_network="nebula", container_type="app",
+                         exit_on_failure=True, spec_hash=None):
         print("creating container " + container_name)
         try:
             container_created = self.cli.create_container(image=image_name, name=container_name, ports=container_ports,
                                                           environment=env_vars, host_config=host_configuration,
-                                                          labels={container_type + "_name": app_name,
-                                                                  "orchestrator": "nebula",
-                                                                  "container_type": container_type},
+                                                          labels=self.container_labels(app_name, container_type,
+                                                                                       spec_hash),
                                                           volumes=volume_mounts,
                                                           networking_config=self.create_networking_config(
                                                               default_network))
             print(("successfully created container " + container_name))
+            if self.container_inventory is not None:
+                self.container_inventory.container_created(container_name)
             return container_created
         except Exception as e:
             print(e, file=sys.stderr)
             print("failed creating container " + container_name)
+            if exit_on_failure is False:
+                return None
             os._exit(2)
 
     # stop container, default timeout set to 5 seconds, will try to kill if stop failed
@@ -152,26 +371,35 @@ class DockerFunctions:
         print(("stopping container " + container_name))
         try:
             reply = self.cli.stop(container_name, stop_timout)
+            if self.container_inventory is not None:
+                self.container_inventory.container_state_changed(container_name, "exited")
             return reply
         except:
             try:
-                reply = self.cli.kill(container_name, 9)
-                time.sleep(3)
+                with tracer.span("stop_container_kill_fallback", container_name=container_name):
+                    reply = self.cli.kill(container_name, 9)
+                    time.sleep(3)
+                if self.container_inventory is not None:
+                    self.container_inventory.container_state_changed(container_name, "exited")
                 return reply
             except Exception as e:
                 print(e, file=sys.stderr)
                 print("problem stopping container " + container_name)
                 os._exit(2)
 
-    # start container
+    # start container, returns False if docker refused to start it
     def start_container(self, container_name):
         print(("starting container " + container_name))
         try:
-            return self.cli.start(container_name)
-        except "APIError" as e:
+            self.cli.start(container_name)
+            if self.container_inventory is not None:
+                self.container_inventory.container_state_changed(container_name, "running")
+            return True
+        except docker.errors.APIError as e:
             print(e, file=sys.stderr)
             print("problem starting container - most likely port bind already taken")
-        except not "APIError" as e:
+            return False
+        except Exception as e:
             print(e, file=sys.stderr)
             print("problem starting container " + container_name)
             os._exit(2)
@@ -180,7 +408,10 @@ class DockerFunctions:
     def restart_container(self, container_name, stop_timout=2):
         print(("restarting container " + container_name))
         try:
-            return self.cli.restart(container_name, stop_timout)
+            reply = self.cli.restart(container_name, stop_timout)
+            if self.container_inventory is not None:
+                self.container_inventory.container_state_changed(container_name, "running")
+            return reply
         except "APIError" as e:
             print(e, file=sys.stderr)
             print("problem starting container - most likely port bind already taken")
@@ -193,14 +424,17 @@ class DockerFunctions:
     def remove_container(self, container_name):
         print(("removing container " + container_name))
         try:
-            return self.cli.remove_container(container_name)
+            reply = self.cli.remove_container(container_name)
         except:
             try:
-                return self.cli.remove_container(container_name, force=True)
+                reply = self.cli.remove_container(container_name, force=True)
             except Exception as e:
                 print(e, file=sys.stderr)
                 print("problem removing container " + container_name)
-            os._exit(2)
+                os._exit(2)
+        if self.container_inventory is not None:
+            self.container_inventory.container_removed(container_name)
+        return reply
 
     # create host_config
     def create_container_host_config(self, port_binds, volumes, devices, privileged, network_mode,
@@ -252,10 +486,8 @@ class DockerFunctions:
         else:
             return "nebula"
 
-    # pull image, create hostconfig, create and start the container and bind to networks all in one simple function
-    def run_container(self, app_name, container_name, image_name, bind_port, ports, env_vars, version_tag="latest",
-                      volumes=[], devices=[], privileged=False, networks=[], restart_policy="unless-stopped",
-                      container_type="app"):
+    # return the volume mount points & the network mode of a container from it's volumes & networks lists
+    def container_mounts_and_network_mode(self, volumes, networks):
         volume_mounts = []
         for volume in volumes:
             splitted_volume = volume.split(":")
@@ -266,11 +498,103 @@ class DockerFunctions:
             network_mode = "none"
         else:
             network_mode = "bridge"
-        self.create_container(app_name, container_name, image_name + ":" + version_tag,
-                              self.create_container_host_config(bind_port, volumes, devices, privileged, network_mode,
-                                                                restart_policy=restart_policy), ports, env_vars,
-                              volume_mounts, default_network=self.default_net(networks), container_type=container_type)
-        self.start_container(container_name)
+        return volume_mounts, network_mode
+
+    # build everything the asyncio backend needs to run a container - takes the same arguments as run_container
+    def create_container_run(self, app_name, container_name, image_name, bind_port, ports, env_vars,
+                             version_tag="latest", volumes=[], devices=[], privileged=False, networks=[],
+                             restart_policy="unless-stopped", container_type="app", spec_hash=None):
+        volume_mounts, network_mode = self.container_mounts_and_network_mode(volumes, networks)
+        network_ids = []
+        for network in networks:
+            # special networks which are created from the container creation as they have to be first
+            if network != "nebula" and network != "host" and network != "none":
+                try:
+                    network_ids.append(self.get_net_id(network))
+                except Exception as e:
+                    print(e, file=sys.stderr)
+                    print("problem connecting to network " + network)
+                    os._exit(2)
+        return {
+            "name": container_name,
+            "config": self.create_container_config(app_name, image_name + ":" + version_tag,
+                                                   self.create_container_host_config(bind_port, volumes, devices,
+                                                                                     privileged, network_mode,
+                                                                                     restart_policy=restart_policy),
+                                                   ports, env_vars, volume_mounts,
+                                                   default_network=self.default_net(networks),
+                                                   container_type=container_type, spec_hash=spec_hash),
+            "network_ids": network_ids
+        }
+
+    # run a batch of containers at once, each item is a dict of run_container keyword arguments, on the asyncio backend
+    # returns whether each of the containers started
+    def run_containers(self, containers_to_run):
+        if self.async_backend is not None:
+            container_runs = [self.create_container_run(**container_to_run) for container_to_run in containers_to_run]
+            containers_started = self.async_backend.run(self.async_backend.run_containers(container_runs))
+            if self.container_inventory is not None:
+                for container_run, container_started in zip(container_runs, containers_started):
+                    if container_started is True:
+                        self.container_inventory.container_created(container_run["name"])
+            return containers_started
+        threads = []
+        for container_to_run in containers_to_run:
+            t = Thread(target=self.run_container, kwargs=container_to_run)
+            threads.append(t)
+            t.start()
+        for y in threads:
+            y.join()
+
+    # stop and remove a batch of containers at once
+    def stop_and_remove_containers(self, container_names):
+        if self.async_backend is not None:
+            reply = self.async_backend.run(self.async_backend.stop_and_remove_containers(container_names))
+            if self.container_inventory is not None:
+                for container_name in container_names:
+                    self.container_inventory.container_removed(container_name)
+            return reply
+        threads = []
+        for container_name in container_names:
+            t = Thread(target=self.stop_and_remove_container, args=(container_name,))
+            threads.append(t)
+            t.start()
+        for z in threads:
+            z.join()
+
+    # return the X-Registry-Auth header value of the registry an image is pulled from, None if not logged in to it
+    def registry_auth_header(self, image_name):
+        registry, repository_name = docker.auth.resolve_repository_name(image_name)
+        return docker.auth.get_config_header(self.cli, registry)
+
+    # pull image, create hostconfig, create and start the container and bind to networks all in one simple function
+    def run_container(self, app_name, container_name, image_name, bind_port, ports, env_vars, version_tag="latest",
+                      volumes=[], devices=[], privileged=False, networks=[], restart_policy="unless-stopped",
+                      container_type="app", spec_hash=None):
+        self.create_run_container(app_name, container_name, image_name, bind_port, ports, env_vars,
+                                  version_tag=version_tag, volumes=volumes, devices=devices, privileged=privileged,
+                                  networks=networks, restart_policy=restart_policy, container_type=container_type,
+                                  spec_hash=spec_hash)
+        self.start_and_connect_container(container_name, networks)
+
+    # create hostconfig & create the container same as run_container does but without starting it, if exit_on_failure
+    # is False returns None rather then exiting when docker refuses to create it
+    def create_run_container(self, app_name, container_name, image_name, bind_port, ports, env_vars,
+                             version_tag="latest", volumes=[], devices=[], privileged=False, networks=[],
+                             restart_policy="unless-stopped", container_type="app", exit_on_failure=True,
+                             spec_hash=None):
+        volume_mounts, network_mode = self.container_mounts_and_network_mode(volumes, networks)
+        return self.create_container(app_name, container_name, image_name + ":" + version_tag,
+                                     self.create_container_host_config(bind_port, volumes, devices, privileged,
+                                                                       network_mode, restart_policy=restart_policy),
+                                     ports, env_vars, volume_mounts, default_network=self.default_net(networks),
+                                     container_type=container_type, exit_on_failure=exit_on_failure,
+                                     spec_hash=spec_hash)
+
+    # start a created container and bind it to it's networks, returns False if docker refused to start it
+    def start_and_connect_container(self, container_name, networks=[]):
+        if self.start_container(container_name) is False:
+            return False
         for network in networks:
             # special networks which are created from the container creation as they have to be first
             if network != "nebula" and network != "host" and network != "none":
@@ -280,6 +604,20 @@ class DockerFunctions:
                     print(e, file=sys.stderr)
                     print("problem connecting to network " + network)
                     os._exit(2)
+        return True
+
+    # rename container
+    def rename_container(self, container_name, new_container_name):
+        print(("renaming container " + container_name + " to " + new_container_name))
+        try:
+            reply = self.cli.rename(container_name, new_container_name)
+            if self.container_inventory is not None:
+                self.container_inventory.container_renamed(container_name, new_container_name)
+            return reply
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("problem renaming container " + container_name)
+            os._exit(2)
 
     # stop and remove container
     def stop_and_remove_container(self, container_name):
@@ -290,7 +628,11 @@ class DockerFunctions:
     def prune_exited_containers(self, filters=None):
         print("pruning exited containers")
         try:
-            print(self.cli.prune_containers(filters=filters))
+            reply = self.cli.prune_containers(filters=filters)
+            print(reply)
+            if self.container_inventory is not None:
+                for container_id in reply.get("ContainersDeleted") or []:
+                    self.container_inventory.container_removed(container_id)
         except Exception as e:
             print(e, file=sys.stderr)
             print("problem pruning unused image")
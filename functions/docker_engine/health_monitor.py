@@ -0,0 +1,76 @@
+from functions.misc.metrics import metrics
+from threading import Thread, Lock
+import os, sys, time
+
+
+class HealthMonitor:
+
+    def __init__(self, docker_connection_object, reconcile_interval=60, reconnect_wait=5, container_type="app"):
+        self.docker_connection = docker_connection_object
+        self.reconcile_interval = reconcile_interval
+        self.reconnect_wait = reconnect_wait
+        self.container_type = container_type
+        self.restarting_containers = set()
+        self.restarting_lock = Lock()
+
+    # start both the docker events listener & the periodic reconciliation sweep, each in it's own daemon thread
+    def start(self):
+        Thread(target=self.watch_health_events, daemon=True).start()
+        Thread(target=self.reconcile_loop, daemon=True).start()
+
+    # the docker events filters that only match health changes of nebula managed containers of the monitored type
+    def events_filters(self):
+        return {
+            "type": "container",
+            "event": "health_status",
+            "label": ["orchestrator=nebula", "container_type=" + self.container_type]
+        }
+
+    # restart a container that was reported as unhealthy, the inspection is done again to avoid restarting a container
+    # that's in the process of being removed\replaced and the set guards against the events listener & the
+    # reconciliation sweep both restarting the same container at once
+    def restart_unhealthy_container(self, container_id):
+        with self.restarting_lock:
+            if container_id in self.restarting_containers:
+                return
+            self.restarting_containers.add(container_id)
+        try:
+            if self.docker_connection.check_container_healthy(container_id) is False:
+                print("container " + container_id + " reported unhealthy, restarting it")
+                self.docker_connection.restart_container(container_id)
+                metrics.counter("nebula_worker_health_restarts_total",
+                                "Containers restarted after docker reported them unhealthy").inc()
+        finally:
+            with self.restarting_lock:
+                self.restarting_containers.discard(container_id)
+
+    # block on the docker events stream and restart containers as soon as docker reports them as unhealthy, if the
+    # stream breaks reconnect to it and run a sweep to catch anything that turned unhealthy while disconnected
+    def watch_health_events(self):
+        while True:
+            try:
+                for event in self.docker_connection.container_events(filters=self.events_filters()):
+                    if event.get("status", event.get("Action", "")) == "health_status: unhealthy":
+                        self.restart_unhealthy_container(event.get("id", event.get("Actor", {}).get("ID")))
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("lost connection to the docker events stream, reconnecting")
+            time.sleep(self.reconnect_wait)
+            self.reconcile_unhealthy_containers()
+
+    # backstop for the events stream - a single filtered list call returning only the containers which are unhealthy
+    def reconcile_unhealthy_containers(self):
+        for unhealthy_container in self.docker_connection.list_unhealthy_containers(
+                container_type=self.container_type):
+            self.restart_unhealthy_container(unhealthy_container["Id"])
+
+    # run the reconciliation sweep every reconcile_interval seconds
+    def reconcile_loop(self):
+        try:
+            while True:
+                self.reconcile_unhealthy_containers()
+                time.sleep(self.reconcile_interval)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed checking containers health")
+            os._exit(2)
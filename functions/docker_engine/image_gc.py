@@ -0,0 +1,126 @@
+from functions.misc.metrics import metrics
+from functions.misc.server import get_root_disk_usage
+from threading import Thread, Lock, Event
+import sys, time
+
+
+# the tags of a listed image, untagged images have none
+def image_tags(image):
+    return [image_tag for image_tag in (image.get("RepoTags") or []) if image_tag != "<none>:<none>"]
+
+
+class ImageGarbageCollector:
+
+    # checks the root disk usage every check_interval seconds & once it crosses high_water_mark percent removes the
+    # least recently used images until it's back under low_water_mark percent, images any container was created from,
+    # images used in the last min_unused_seconds seconds & the image references protected_images_function returns (the
+    # images of cron_jobs which are about to run) are never removed
+    # an image was last used when a container of it was last seen or when it was last pulled, images which were never
+    # seen used since the worker started count as last used when they were created
+    def __init__(self, docker_connection_object, high_water_mark=85, low_water_mark=70, check_interval=60,
+                 min_unused_seconds=300, protected_images_function=None, disk_usage_function=get_root_disk_usage,
+                 clock=time.time):
+        self.docker_connection = docker_connection_object
+        self.high_water_mark = high_water_mark
+        self.low_water_mark = min(low_water_mark, high_water_mark)
+        self.check_interval = check_interval
+        self.min_unused_seconds = min_unused_seconds
+        self.protected_images_function = protected_images_function
+        self.disk_usage_function = disk_usage_function
+        self.clock = clock
+        self.last_used = {}
+        self.lock = Lock()
+        self.collect_lock = Lock()
+        self.stop_event = Event()
+
+    def start(self):
+        Thread(target=self.collect_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def collect_loop(self):
+        while self.stop_event.wait(self.check_interval) is False:
+            try:
+                self.collect()
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed collecting unused images")
+
+    # mark an image (by it's id or image:tag) as used now, called on every pull so an image which was just pulled
+    # isn't removed before it's containers are created
+    def image_used(self, image_reference):
+        with self.lock:
+            self.last_used[image_reference] = self.clock()
+
+    def disk_usage_percent(self):
+        disk_usage = self.disk_usage_function()
+        if disk_usage["total"] <= 0:
+            return 0.0
+        return disk_usage["used"] / disk_usage["total"] * 100.0
+
+    def image_last_used(self, image):
+        with self.lock:
+            last_used = [self.last_used.get(image_reference) for image_reference in [image["Id"]] + image_tags(image)]
+        last_used = [last_used_time for last_used_time in last_used if last_used_time is not None]
+        if len(last_used) > 0:
+            return max(last_used)
+        return image.get("Created", 0)
+
+    # return the images which can be removed, least recently used first
+    def eviction_candidates(self, images, used_image_ids, protected_images):
+        now = self.clock()
+        eviction_candidates = []
+        for image in images:
+            if image["Id"] in used_image_ids:
+                self.image_used(image["Id"])
+                continue
+            if any(image_tag in protected_images for image_tag in image_tags(image)):
+                continue
+            image_last_used = self.image_last_used(image)
+            if now - image_last_used < self.min_unused_seconds:
+                continue
+            eviction_candidates.append((image_last_used, image))
+        eviction_candidates.sort(key=lambda eviction_candidate: eviction_candidate[0])
+        return [image for _, image in eviction_candidates]
+
+    # an image with several tags is only deleted once each of it's tags is removed
+    def remove_image(self, image):
+        for image_reference in image_tags(image) or [image["Id"]]:
+            if self.docker_connection.remove_image(image_reference) is False:
+                return False
+        with self.lock:
+            for image_reference in [image["Id"]] + image_tags(image):
+                self.last_used.pop(image_reference, None)
+        return True
+
+    # remove the least recently used images if the disk usage is over the high water mark, returns the ids of the
+    # removed images
+    def collect(self):
+        with self.collect_lock:
+            disk_usage_percent = self.disk_usage_percent()
+            if disk_usage_percent < self.high_water_mark:
+                return []
+            images = self.docker_connection.list_images()
+            used_image_ids = self.docker_connection.list_container_image_ids()
+            if images is None or used_image_ids is None:
+                return []
+            protected_images = set()
+            if self.protected_images_function is not None:
+                protected_images = set(self.protected_images_function())
+            print("root disk usage is " + str(round(disk_usage_percent, 1)) + "% - removing least recently used images "
+                  "until it's under " + str(self.low_water_mark) + "%")
+            removed_image_ids = []
+            for image in self.eviction_candidates(images, used_image_ids, protected_images):
+                if disk_usage_percent <= self.low_water_mark:
+                    break
+                if self.remove_image(image) is True:
+                    removed_image_ids.append(image["Id"])
+                    metrics.counter("nebula_worker_image_gc_removed_images_total",
+                                    "Images removed by the image garbage collector").inc()
+                    disk_usage_percent = self.disk_usage_percent()
+            if disk_usage_percent > self.low_water_mark:
+                print("root disk usage is still " + str(round(disk_usage_percent, 1)) + "% with no more images which "
+                      "can be removed")
+            return removed_image_ids
@@ -0,0 +1,88 @@
+from functions.misc.metrics import metrics
+from threading import Lock, Event
+import time
+
+IMAGE_PULLS_METRIC = "nebula_worker_image_pulls_total"
+IMAGE_PULLS_HELP = "Image pulls by whether the image was pulled fresh, was already up to date or joined an " \
+                   "in progress pull"
+
+
+class ImagePullManager:
+
+    # skips pulling images which their local digest matches the registry one & collapses concurrent pulls of the same
+    # image:tag into a single pull, the registry digest of each image is cached for digest_cache_ttl seconds for the
+    # repeated pulls of cron_jobs & such while pulls of app changes always check the registry, each pull marks the image
+    # as used on the optional image garbage collector
+    def __init__(self, docker_connection_object, digest_cache_ttl=300):
+        self.docker_connection = docker_connection_object
+        self.digest_cache_ttl = digest_cache_ttl
+        self.registry_digests = {}
+        self.in_flight_pulls = {}
+        self.pulls_lock = Lock()
+        self.image_gc = None
+
+    # return the registry digest of an image, from the cache if it was checked in the last digest_cache_ttl seconds
+    # unless use_cache is False in which case the registry is always asked (& the cache refreshed)
+    def get_registry_image_digest(self, image_reference, use_cache=True):
+        cached_digest = self.registry_digests.get(image_reference)
+        if use_cache is True and cached_digest is not None and \
+                time.monotonic() - cached_digest[1] < self.digest_cache_ttl:
+            return cached_digest[0]
+        registry_digest = self.docker_connection.get_registry_image_digest(image_reference)
+        if registry_digest is not None:
+            self.registry_digests[image_reference] = (registry_digest, time.monotonic())
+        return registry_digest
+
+    # check if the local copy of an image is the same one the registry holds, if it can't be determined the image is
+    # assumed to be outdated so it will be pulled same as it always was
+    def image_up_to_date(self, image_reference, use_digest_cache=True):
+        local_digests = self.docker_connection.get_local_image_digests(image_reference)
+        if len(local_digests) == 0:
+            return False
+        registry_digest = self.get_registry_image_digest(image_reference, use_cache=use_digest_cache)
+        if registry_digest is None:
+            return False
+        for local_digest in local_digests:
+            if local_digest.endswith("@" + registry_digest):
+                return True
+        return False
+
+    # pull an image unless it's already up to date, if the same image is already being pulled wait on that pull
+    # rather then starting another one, returns True if a pull took place and False if it was skipped, use_digest_cache
+    # False makes sure a new image pushed under the same tag is pulled (an app restart after pushing :latest) so such a
+    # pull only joins in progress pulls which checked the registry as well
+    def pull_image(self, image_name, version_tag="latest", use_digest_cache=True):
+        image_reference = image_name + ":" + str(version_tag)
+        if self.image_gc is not None:
+            self.image_gc.image_used(image_reference)
+        while True:
+            with self.pulls_lock:
+                in_flight_pull = self.in_flight_pulls.get(image_reference)
+                if in_flight_pull is None:
+                    pull_done = Event()
+                    self.in_flight_pulls[image_reference] = (pull_done, use_digest_cache)
+                    break
+            in_flight_pull_done, in_flight_pull_used_digest_cache = in_flight_pull
+            print("waiting on in progress pull of image " + image_reference)
+            in_flight_pull_done.wait()
+            if use_digest_cache is True or in_flight_pull_used_digest_cache is False:
+                metrics.counter(IMAGE_PULLS_METRIC, IMAGE_PULLS_HELP, label_names=("result",)).inc(result="joined")
+                return False
+        try:
+            if self.image_up_to_date(image_reference, use_digest_cache=use_digest_cache) is True:
+                print("image " + image_reference + " is up to date, skipping pull")
+                metrics.counter(IMAGE_PULLS_METRIC, IMAGE_PULLS_HELP, label_names=("result",)).inc(result="cached")
+                return False
+            pull_record = self.docker_connection.pull_image(image_name, version_tag=version_tag)
+            metrics.counter(IMAGE_PULLS_METRIC, IMAGE_PULLS_HELP, label_names=("result",)).inc(result="fresh")
+            if pull_record is not None:
+                pull_layers = metrics.counter("nebula_worker_image_pull_layers_total",
+                                              "Layers of pulled images by whether they were already cached",
+                                              label_names=("layer",))
+                pull_layers.inc(pull_record["cached_layers"], layer="cached")
+                pull_layers.inc(pull_record["fresh_layers"], layer="fresh")
+            return True
+        finally:
+            with self.pulls_lock:
+                self.in_flight_pulls.pop(image_reference, None)
+            pull_done.set()
@@ -0,0 +1,93 @@
+import time
+
+# the statuses docker reports for an image layer while pulling it
+LAYER_STATUSES = ("Pulling fs layer", "Waiting", "Downloading", "Verifying Checksum", "Download complete",
+                  "Extracting", "Pull complete", "Already exists", "Retrying")
+
+
+class PullProgressTracker:
+
+    # aggregates the stream of pull progress events of an image into per layer state, printing a summary at most every
+    # summary_interval seconds instead of every progress event
+    def __init__(self, image_reference, summary_interval=5):
+        self.image_reference = image_reference
+        self.summary_interval = summary_interval
+        self.layers = {}
+        self.digest = None
+        self.final_status = None
+        self.error = None
+        self.start_time = time.monotonic()
+        self.last_summary_time = self.start_time
+
+    # update the state of the pull with a single decoded progress event
+    def update(self, progress_event):
+        status = progress_event.get("status", "")
+        if "error" in progress_event:
+            self.error = progress_event["error"]
+        elif status.startswith("Digest: "):
+            self.digest = status[len("Digest: "):]
+        elif status.startswith("Status: "):
+            self.final_status = status[len("Status: "):]
+        elif "id" in progress_event and status.startswith(LAYER_STATUSES):
+            layer = self.layers.setdefault(progress_event["id"], {"downloaded": 0, "download_size": 0,
+                                                                 "extracted": 0, "cached": False,
+                                                                 "complete": False})
+            progress_detail = progress_event.get("progressDetail") or {}
+            if status == "Downloading":
+                layer["downloaded"] = progress_detail.get("current", layer["downloaded"])
+                layer["download_size"] = progress_detail.get("total", layer["download_size"])
+            elif status == "Download complete":
+                layer["downloaded"] = max(layer["downloaded"], layer["download_size"])
+            elif status == "Extracting":
+                layer["extracted"] = progress_detail.get("current", layer["extracted"])
+            elif status == "Pull complete":
+                layer["extracted"] = max(layer["extracted"], layer["downloaded"])
+                layer["complete"] = True
+            elif status == "Already exists":
+                layer["cached"] = True
+                layer["complete"] = True
+        if time.monotonic() - self.last_summary_time >= self.summary_interval:
+            self.last_summary_time = time.monotonic()
+            print(self.summary_line())
+
+    # return the aggregated state of the pull across all of it's layers
+    def summary(self):
+        summary = {
+            "layers": len(self.layers),
+            "cached_layers": 0,
+            "fresh_layers": 0,
+            "complete_layers": 0,
+            "bytes_downloaded": 0,
+            "bytes_extracted": 0
+        }
+        for layer in self.layers.values():
+            if layer["cached"] is True:
+                summary["cached_layers"] += 1
+            else:
+                summary["fresh_layers"] += 1
+            if layer["complete"] is True:
+                summary["complete_layers"] += 1
+            summary["bytes_downloaded"] += layer["downloaded"]
+            summary["bytes_extracted"] += layer["extracted"]
+        return summary
+
+    def summary_line(self):
+        summary = self.summary()
+        return "pulling image " + self.image_reference + " - " + str(summary["complete_layers"]) + "/" + \
+               str(summary["layers"]) + " layers complete (" + str(summary["cached_layers"]) + " cached), " + \
+               str(summary["bytes_downloaded"] // 1024 // 1024) + "MB downloaded"
+
+    # return the final record of the pull, including it's duration & download throughput
+    def finish(self):
+        duration = time.monotonic() - self.start_time
+        pull_record = self.summary()
+        pull_record.update({
+            "image": self.image_reference,
+            "digest": self.digest,
+            "status": self.final_status,
+            "error": self.error,
+            "duration_seconds": round(duration, 3),
+            "throughput_bytes_per_second": int(pull_record["bytes_downloaded"] / duration) if duration > 0 else 0,
+            "finish_time": int(time.time())
+        })
+        return pull_record
@@ -0,0 +1,192 @@
+from threading import Thread, Lock, Event
+from dateutil import parser as date_parser
+import sys, time
+
+
+# sum the values of a blkio stats list for the requested operation
+def sum_blkio_operation(blkio_entries, operation):
+    total = 0
+    for blkio_entry in blkio_entries or []:
+        if blkio_entry.get("op", "").lower() == operation:
+            total += blkio_entry.get("value", 0)
+    return total
+
+
+# turn a raw docker stats sample into the handful of figures which are actually useful (cpu %, memory & network\block
+# io totals and rates), the rates are calculated against the previous summary of the same container if one is given
+def summarize_container_stats(sample, previous_summary=None):
+    cpu_stats = sample.get("cpu_stats") or {}
+    precpu_stats = sample.get("precpu_stats") or {}
+    cpu_delta = (cpu_stats.get("cpu_usage") or {}).get("total_usage", 0) - \
+        (precpu_stats.get("cpu_usage") or {}).get("total_usage", 0)
+    system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get("system_cpu_usage", 0)
+    online_cpus = cpu_stats.get("online_cpus") or len((cpu_stats.get("cpu_usage") or {}).get("percpu_usage") or []) or 1
+    # the first sample of a stream has an empty precpu_stats, the delta against it would be the container's average
+    # since it started rather then it's current usage so it's reported as 0 until there's a real previous sample
+    if not precpu_stats.get("system_cpu_usage") or not (precpu_stats.get("cpu_usage") or {}).get("total_usage"):
+        cpu_percent = 0.0
+    elif cpu_delta > 0 and system_delta > 0:
+        cpu_percent = round(cpu_delta / system_delta * online_cpus * 100.0, 2)
+    else:
+        cpu_percent = 0.0
+
+    memory_stats = sample.get("memory_stats") or {}
+    # same as the docker cli the page cache isn't counted as used memory, it's "cache" on cgroup v1 & "inactive_file" on
+    # cgroup v2 hosts
+    memory_breakdown = memory_stats.get("stats") or {}
+    memory_cache = memory_breakdown.get("cache", memory_breakdown.get("inactive_file", 0))
+    memory_usage = memory_stats.get("usage", 0) - memory_cache
+    memory_limit = memory_stats.get("limit", 0)
+
+    network_rx_bytes = 0
+    network_tx_bytes = 0
+    for network_stats in (sample.get("networks") or {}).values():
+        network_rx_bytes += network_stats.get("rx_bytes", 0)
+        network_tx_bytes += network_stats.get("tx_bytes", 0)
+
+    blkio_entries = (sample.get("blkio_stats") or {}).get("io_service_bytes_recursive")
+
+    summary = {
+        "id": sample.get("id"),
+        "name": (sample.get("name") or "").lstrip("/"),
+        "read": sample.get("read"),
+        "cpu_percent": cpu_percent,
+        "memory_usage_bytes": memory_usage,
+        "memory_limit_bytes": memory_limit,
+        "memory_percent": round(memory_usage / memory_limit * 100.0, 2) if memory_limit > 0 else 0.0,
+        "network_rx_bytes": network_rx_bytes,
+        "network_tx_bytes": network_tx_bytes,
+        "network_rx_bytes_per_second": 0.0,
+        "network_tx_bytes_per_second": 0.0,
+        "block_read_bytes": sum_blkio_operation(blkio_entries, "read"),
+        "block_write_bytes": sum_blkio_operation(blkio_entries, "write")
+    }
+
+    if previous_summary is not None:
+        try:
+            seconds_between_samples = (date_parser.isoparse(summary["read"]) -
+                                       date_parser.isoparse(previous_summary["read"])).total_seconds()
+        except Exception:
+            seconds_between_samples = 0
+        if seconds_between_samples > 0:
+            summary["network_rx_bytes_per_second"] = round(
+                max(network_rx_bytes - previous_summary["network_rx_bytes"], 0) / seconds_between_samples, 2)
+            summary["network_tx_bytes_per_second"] = round(
+                max(network_tx_bytes - previous_summary["network_tx_bytes"], 0) / seconds_between_samples, 2)
+    return summary
+
+
+class ContainerStatsCollector:
+
+    # each stats stream holds a docker connection for as long as it's container runs so the streams are read over
+    # stats_docker_connection_object, a docker connection of their own, rather then taking up the connections the
+    # reconcile calls share, the running containers are still listed over docker_connection_object
+    def __init__(self, docker_connection_object, sync_interval=10, max_cached_containers=1000,
+                 stats_docker_connection_object=None):
+        self.docker_connection = docker_connection_object
+        self.stats_docker_connection = stats_docker_connection_object or docker_connection_object
+        self.sync_interval = sync_interval
+        self.max_cached_containers = max_cached_containers
+        self.cache_full_reported = False
+        self.stats_cache = {}
+        self.subscriptions = {}
+        self.cache_lock = Lock()
+
+    # start the thread which keeps the set of streaming stats subscriptions in sync with the running containers
+    def start(self):
+        self.sync_subscriptions()
+        Thread(target=self.sync_loop, daemon=True).start()
+
+    # resync the subscriptions every sync_interval seconds
+    def sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync_subscriptions()
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed syncing container stats subscriptions")
+
+    # subscribe to the stats stream of every newly running nebula container & unsubscribe from the ones that are gone,
+    # done with a single list call no matter how many containers are running
+    def sync_subscriptions(self):
+        running_containers = self.docker_connection.list_containers(container_type="all", show_all_containers=False)
+        running_container_ids = set()
+        for container in running_containers:
+            running_container_ids.add(container["Id"])
+            if container["Id"] not in self.subscriptions:
+                self.subscribe(container["Id"], container.get("Labels", {}).get("container_type", "app"))
+        for container_id in list(self.subscriptions):
+            if container_id not in running_container_ids:
+                self.unsubscribe(container_id)
+        with self.cache_lock:
+            if len(self.subscriptions) < self.max_cached_containers:
+                self.cache_full_reported = False
+
+    # the cache is bounded to max_cached_containers, containers past that limit are simply not collected & it's only
+    # reported once each time the cache fills up rather then on every sync
+    def subscribe(self, container_id, container_type):
+        with self.cache_lock:
+            if len(self.subscriptions) >= self.max_cached_containers:
+                if self.cache_full_reported is False:
+                    print("stats cache is full, not collecting stats of containers past the first " +
+                          str(self.max_cached_containers))
+                    self.cache_full_reported = True
+                return
+            stop_event = Event()
+            self.subscriptions[container_id] = stop_event
+        Thread(target=self.collect_container_stats, args=(container_id, container_type, stop_event),
+               daemon=True).start()
+
+    # the streaming thread notices the stop flag on it's next sample and exits
+    def unsubscribe(self, container_id):
+        with self.cache_lock:
+            stop_event = self.subscriptions.pop(container_id, None)
+            self.stats_cache.pop(container_id, None)
+        if stop_event is not None:
+            stop_event.set()
+
+    # consume the stats stream of a single container, keeping only the latest sample & it's precomputed summary
+    def collect_container_stats(self, container_id, container_type, stop_event):
+        try:
+            summary = None
+            for sample in self.stats_docker_connection.stream_container_stats(container_id):
+                if stop_event.is_set():
+                    break
+                summary = summarize_container_stats(sample, summary)
+                with self.cache_lock:
+                    if stop_event.is_set():
+                        break
+                    self.stats_cache[container_id] = {
+                        "container_type": container_type,
+                        "sample": sample,
+                        "summary": summary
+                    }
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("stats stream of container " + container_id + " ended")
+        finally:
+            with self.cache_lock:
+                if self.subscriptions.get(container_id) is stop_event:
+                    self.subscriptions.pop(container_id, None)
+                    self.stats_cache.pop(container_id, None)
+
+    # return the latest raw stats samples of all containers of the given type straight from the cache
+    def list_containers_stats(self, container_type="app"):
+        with self.cache_lock:
+            return [cached_stats["sample"] for cached_stats in self.stats_cache.values()
+                    if container_type == "all" or cached_stats["container_type"] == container_type]
+
+    # return the precomputed stats summaries of all containers of the given type straight from the cache
+    def list_containers_stats_summaries(self, container_type="app"):
+        with self.cache_lock:
+            return [cached_stats["summary"] for cached_stats in self.stats_cache.values()
+                    if container_type == "all" or cached_stats["container_type"] == container_type]
+
+    # return the precomputed stats summary of a single container, None if it's not being collected
+    def get_container_stats_summary(self, container_id):
+        with self.cache_lock:
+            cached_stats = self.stats_cache.get(container_id)
+        if cached_stats is None:
+            return None
+        return cached_stats["summary"]
@@ -0,0 +1,84 @@
+import random, time
+
+
+class CheckInScheduler:
+
+    # decides how long to wait before each check-in against the nebula manager:
+    # * the first check-in after boot is spread over a random part of check_in_interval & every wait is jittered by up
+    #   to jitter (a fraction of the wait) so workers which booted together don't stay in lockstep
+    # * for fast_duration seconds after a change was found the wait drops to fast_interval as more changes tend to
+    #   follow
+    # * after idle_after unchanged check-ins in a row the wait grows by idle_backoff per check-in up to max_interval, as
+    #   a worker which backed off picks up changes that much later it's opt-in - the default of 1 never grows the wait
+    # * a check-in which took longer then slow_threshold seconds doubles the wait per slow check-in in a row up to
+    #   max_interval & failed check-ins back off exponentially from error_backoff_base up to error_backoff_max seconds
+    #   with each wait a random point in the upper half of the backoff
+    # clock & random_generator are replaceable so the scheduling can be simulated without waiting
+    def __init__(self, check_in_interval=30, jitter=0.2, initial_splay=True, fast_interval=10, fast_duration=60,
+                 idle_after=10, idle_backoff=1, max_interval=None, slow_threshold=5, error_backoff_base=1,
+                 error_backoff_max=300, clock=time.monotonic, random_generator=None):
+        self.check_in_interval = check_in_interval
+        self.jitter = jitter
+        self.initial_splay = initial_splay
+        self.fast_interval = min(fast_interval, check_in_interval)
+        self.fast_duration = fast_duration
+        self.idle_after = idle_after
+        self.idle_backoff = idle_backoff
+        self.max_interval = max(max_interval if max_interval is not None else check_in_interval * 2,
+                                check_in_interval)
+        self.slow_threshold = slow_threshold
+        self.error_backoff_base = error_backoff_base
+        self.error_backoff_max = error_backoff_max
+        self.clock = clock
+        self.random = random_generator if random_generator is not None else random.Random()
+        self.first_check_in = True
+        self.fast_until = None
+        self.unchanged_check_ins = 0
+        self.slow_check_ins = 0
+        self.consecutive_errors = 0
+
+    # record a check-in which got the device_group info, duration is how long getting it took
+    def check_in_succeeded(self, changed=False, duration=0):
+        self.consecutive_errors = 0
+        if changed is True:
+            self.unchanged_check_ins = 0
+            self.fast_until = self.clock() + self.fast_duration
+        else:
+            self.unchanged_check_ins += 1
+        if self.slow_threshold is not None and duration > self.slow_threshold:
+            self.slow_check_ins += 1
+        else:
+            self.slow_check_ins = 0
+
+    def check_in_failed(self):
+        self.consecutive_errors += 1
+
+    def jittered(self, interval):
+        return self.random.uniform(interval * (1 - self.jitter), interval * (1 + self.jitter))
+
+    # the wait before a failed check-in is retried
+    def error_backoff(self):
+        backoff = min(self.error_backoff_base * 2 ** min(self.consecutive_errors - 1, 64), self.error_backoff_max)
+        return self.random.uniform(backoff / 2, backoff)
+
+    # the wait before the next check-in when the last one got the device_group info
+    def interval(self):
+        if self.fast_until is not None and self.clock() < self.fast_until:
+            interval = self.fast_interval
+        else:
+            # the backoff exponents are capped as the wait is capped anyway & a float power would overflow eventually
+            interval = self.check_in_interval * self.idle_backoff ** min(max(self.unchanged_check_ins -
+                                                                             self.idle_after, 0), 64)
+        if self.slow_check_ins > 0:
+            interval = interval * 2 ** min(self.slow_check_ins, 64)
+        return min(interval, self.max_interval)
+
+    # return the seconds to wait before the next check-in
+    def next_delay(self):
+        if self.consecutive_errors > 0:
+            return self.error_backoff()
+        if self.first_check_in is True:
+            self.first_check_in = False
+            if self.initial_splay is True:
+                return self.random.uniform(0, self.check_in_interval)
+        return self.jittered(self.interval())
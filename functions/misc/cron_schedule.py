@@ -1,22 +1,120 @@
 from croniter import croniter
-from datetime import datetime
+from functions.misc.metrics import metrics
+from datetime import datetime, timedelta
+from threading import Thread, Condition
+import heapq, itertools, sys
 
 
 class CronJobs:
 
     def __init__(self):
         self.cron_jobs = {}
+        self.cron_iterators = {}
+        self.cron_next_runs = {}
 
     def add_cron_job(self, cron_job_name, cron_schedule):
         self.cron_jobs[cron_job_name] = cron_schedule
-        return self.return_cron_job_next_runtime(cron_job_name)
+        self.cron_iterators[cron_job_name] = croniter(cron_schedule, datetime.now())
+        self.cron_next_runs[cron_job_name] = self.cron_iterators[cron_job_name].get_next(datetime)
+        return self.cron_next_runs[cron_job_name]
 
     def update_cron_job(self, cron_job_name, cron_schedule):
         return self.add_cron_job(cron_job_name, cron_schedule)
 
     def remove_cron_job(self, cron_job_name):
+        self.cron_iterators.pop(cron_job_name, None)
+        self.cron_next_runs.pop(cron_job_name, None)
         return self.cron_jobs.pop(cron_job_name, None)
 
+    # the croniter of each cron_job is cached so only passed runtimes move it forward, if the runtime is far behind the
+    # iterator is fast forwarded to the current time rather then stepping over every missed run
     def return_cron_job_next_runtime(self, cron_job_name):
-        next_run_dict = croniter(self.cron_jobs[cron_job_name], datetime.now())
-        return next_run_dict.get_next(datetime)
+        now = datetime.now()
+        next_run = self.cron_next_runs[cron_job_name]
+        if next_run <= now:
+            cron_iterator = self.cron_iterators[cron_job_name]
+            next_run = cron_iterator.get_next(datetime)
+            if next_run <= now:
+                metrics.counter("nebula_worker_cron_job_misses_total",
+                                "Times cron_jobs runs were skipped as they were too far behind schedule",
+                                label_names=("cron_job",)).inc(cron_job=cron_job_name)
+                cron_iterator.set_current(now)
+                next_run = cron_iterator.get_next(datetime)
+            self.cron_next_runs[cron_job_name] = next_run
+        return next_run
+
+    # return the names of the cron_jobs which their next run is due in the next seconds seconds (or overdue)
+    def cron_jobs_due_within(self, seconds):
+        due_before = datetime.now() + timedelta(seconds=seconds)
+        return [cron_job_name for cron_job_name, next_run in self.cron_next_runs.items() if next_run <= due_before]
+
+
+class CronScheduler(CronJobs):
+
+    # keeps a min-heap of the next runtime of each cron_job and runs run_cron_job_function(cron_job_name) in a new
+    # thread as soon as a cron_job is due, the heap is lazily cleaned of entries of removed\updated cron_jobs
+    def __init__(self, run_cron_job_function):
+        CronJobs.__init__(self)
+        self.run_cron_job_function = run_cron_job_function
+        self.schedule_heap = []
+        self.schedule_versions = {}
+        self.schedule_counter = itertools.count()
+        self.condition = Condition()
+
+    def add_cron_job(self, cron_job_name, cron_schedule):
+        with self.condition:
+            next_run = CronJobs.add_cron_job(self, cron_job_name, cron_schedule)
+            self.schedule_versions[cron_job_name] = next(self.schedule_counter)
+            self.push_schedule(cron_job_name, next_run)
+            # wake the scheduler thread as the new cron_job might be due before whatever it's currently waiting on
+            self.condition.notify()
+            return next_run
+
+    def remove_cron_job(self, cron_job_name):
+        with self.condition:
+            self.schedule_versions.pop(cron_job_name, None)
+            return CronJobs.remove_cron_job(self, cron_job_name)
+
+    def cron_jobs_due_within(self, seconds):
+        with self.condition:
+            return CronJobs.cron_jobs_due_within(self, seconds)
+
+    def push_schedule(self, cron_job_name, next_run):
+        heapq.heappush(self.schedule_heap, (next_run, next(self.schedule_counter), cron_job_name,
+                                            self.schedule_versions[cron_job_name]))
+
+    # an entry is stale if it's cron_job was removed or updated after it was pushed to the heap
+    def is_stale(self, schedule_entry):
+        return self.schedule_versions.get(schedule_entry[2]) != schedule_entry[3]
+
+    # start the scheduler thread
+    def start(self):
+        Thread(target=self.run_scheduler, daemon=True).start()
+
+    # block until the earliest cron_job is due, reschedule it to it's next runtime & return it's name
+    def wait_for_next_due_cron_job(self):
+        with self.condition:
+            while True:
+                while len(self.schedule_heap) > 0 and self.is_stale(self.schedule_heap[0]) is True:
+                    heapq.heappop(self.schedule_heap)
+                if len(self.schedule_heap) == 0:
+                    self.condition.wait()
+                    continue
+                seconds_until_due = (self.schedule_heap[0][0] - datetime.now()).total_seconds()
+                if seconds_until_due > 0:
+                    self.condition.wait(timeout=seconds_until_due)
+                    continue
+                cron_job_name = heapq.heappop(self.schedule_heap)[2]
+                self.push_schedule(cron_job_name, self.return_cron_job_next_runtime(cron_job_name))
+                return cron_job_name
+
+    def run_scheduler(self):
+        while True:
+            cron_job_name = self.wait_for_next_due_cron_job()
+            try:
+                Thread(target=self.run_cron_job_function, args=(cron_job_name,), daemon=True).start()
+                metrics.counter("nebula_worker_cron_job_launches_total", "Cron_jobs runs launched",
+                                label_names=("cron_job",)).inc(cron_job=cron_job_name)
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed starting cron_job " + cron_job_name)
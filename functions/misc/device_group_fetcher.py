@@ -0,0 +1,65 @@
+from functions.misc.metrics import metrics
+from requests.adapters import HTTPAdapter
+from threading import Lock
+import requests
+
+MANAGER_FETCHES_METRIC = "nebula_worker_manager_fetches_total"
+MANAGER_FETCHES_HELP = "Device_group info fetches by whether the device_group was modified since the last fetch"
+
+
+class CachedDeviceGroupInfo:
+
+    def __init__(self, etag, raw_reply, reply):
+        self.etag = etag
+        self.raw_reply = raw_reply
+        self.reply = reply
+
+
+class DeviceGroupFetcher:
+
+    # gets the device_group /info from the nebula manager over a single keep-alive session accepting gzip compressed
+    # replies, the last reply of each device_group is kept along with it's ETag & raw body so when the manager replies
+    # 304 to the If-None-Match of the next check-in (or the same bytes if it doesn't send ETags) the cached reply is
+    # returned without parsing any JSON & marked "not_modified", any other call is passed through to the wrapped nebula
+    # connection so this can stand in for it
+    def __init__(self, nebula_connection_object, pool_maxsize=2):
+        self.nebula_connection = nebula_connection_object
+        self.lock = Lock()
+        self.cache = {}
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize))
+        self.session.headers.update(nebula_connection_object.headers)
+        self.session.headers["accept-encoding"] = "gzip"
+
+    def __getattr__(self, attribute_name):
+        return getattr(self.nebula_connection, attribute_name)
+
+    def device_group_info_url(self, device_group):
+        return self.nebula_connection.host + "/api/" + self.nebula_connection.API_VERSION + "/device_groups/" + \
+            device_group + "/info"
+
+    # same reply format as the nebula connection list_device_group_info
+    def list_device_group_info(self, device_group):
+        with self.lock:
+            cached_info = self.cache.get(device_group)
+        headers = {}
+        if cached_info is not None and cached_info.etag is not None:
+            headers["if-none-match"] = cached_info.etag
+        response = self.session.get(self.device_group_info_url(device_group), headers=headers,
+                                    timeout=self.nebula_connection.request_timeout)
+        if cached_info is not None and (response.status_code == 304 or (response.status_code == 200 and
+                                                                         response.content == cached_info.raw_reply)):
+            metrics.counter(MANAGER_FETCHES_METRIC, MANAGER_FETCHES_HELP, label_names=("result",)).inc(
+                result="not_modified")
+            return {"status_code": 200, "reply": cached_info.reply, "not_modified": True}
+        reply = response.json()
+        if response.status_code == 200:
+            metrics.counter(MANAGER_FETCHES_METRIC, MANAGER_FETCHES_HELP, label_names=("result",)).inc(
+                result="modified")
+            with self.lock:
+                self.cache[device_group] = CachedDeviceGroupInfo(response.headers.get("etag"), response.content, reply)
+        return {"status_code": response.status_code, "reply": reply}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,151 @@
+from collections import deque, namedtuple
+from threading import Thread, Lock
+import os, sys, time, psutil
+
+# a single sample of the host, memory & disk are in mb
+HostSample = namedtuple("HostSample", ["sample_time", "cpu_percent", "memory_total_mb", "memory_used_mb",
+                                       "memory_free_mb", "memory_available_mb", "root_disk_total_mb",
+                                       "root_disk_used_mb", "root_disk_free_mb", "load_1m"])
+
+# the sample fields which are aggregated over a window
+AGGREGATED_FIELDS = ("cpu_percent", "memory_used_mb", "memory_available_mb", "root_disk_used_mb", "load_1m")
+
+
+# return the busy & total cpu time of the host from /proc/stat, falls back to psutil where there is no /proc
+def read_cpu_times(proc_stat_path="/proc/stat"):
+    try:
+        with open(proc_stat_path) as proc_stat:
+            cpu_times = [int(cpu_time) for cpu_time in proc_stat.readline().split()[1:]]
+        # guest time is already counted in user time
+        total_time = sum(cpu_times[:8])
+        idle_time = cpu_times[3] + (cpu_times[4] if len(cpu_times) > 4 else 0)
+    except OSError:
+        cpu_times = psutil.cpu_times()
+        total_time = sum(cpu_times) - getattr(cpu_times, "guest", 0) - getattr(cpu_times, "guest_nice", 0)
+        idle_time = cpu_times.idle + getattr(cpu_times, "iowait", 0)
+    return total_time - idle_time, total_time
+
+
+# return the total, used, free & available memory of the host in mb from /proc/meminfo, used is calculated the same way
+# psutil does, falls back to psutil where there is no /proc
+def read_memory(proc_meminfo_path="/proc/meminfo"):
+    try:
+        meminfo = {}
+        with open(proc_meminfo_path) as proc_meminfo:
+            for meminfo_line in proc_meminfo:
+                meminfo_key, _, meminfo_value = meminfo_line.partition(":")
+                meminfo[meminfo_key] = int(meminfo_value.split()[0]) // 1024
+    except OSError:
+        memory_in_bytes = psutil.virtual_memory()
+        return int(memory_in_bytes.total // 1024 // 1024), int(memory_in_bytes.used // 1024 // 1024), \
+            int(memory_in_bytes.free // 1024 // 1024), int(memory_in_bytes.available // 1024 // 1024)
+    memory_used = meminfo["MemTotal"] - meminfo["MemFree"] - meminfo.get("Buffers", 0) - meminfo.get("Cached", 0) - \
+        meminfo.get("SReclaimable", 0)
+    if memory_used < 0:
+        memory_used = meminfo["MemTotal"] - meminfo["MemFree"]
+    return meminfo["MemTotal"], memory_used, meminfo["MemFree"], meminfo.get("MemAvailable", meminfo["MemFree"])
+
+
+# return the total, used & free space of the root disk in mb, the same statvfs call psutil.disk_usage makes
+def read_root_disk(root_path="/"):
+    disk_stats = os.statvfs(root_path)
+    total_space = disk_stats.f_blocks * disk_stats.f_frsize
+    free_space = disk_stats.f_bavail * disk_stats.f_frsize
+    used_space = (disk_stats.f_blocks - disk_stats.f_bfree) * disk_stats.f_frsize
+    return int(total_space // 1024 // 1024), int(used_space // 1024 // 1024), int(free_space // 1024 // 1024)
+
+
+# the value below which percentile percent of the values fall, nearest rank
+def percentile(sorted_values, percent):
+    rank = max(int(-(-percent * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+# return the min\avg\max\p95 of each aggregated field over the given samples
+def aggregate_samples(samples):
+    aggregates = {}
+    for field_name in AGGREGATED_FIELDS:
+        values = sorted(getattr(sample, field_name) for sample in samples)
+        aggregates[field_name] = {
+            "min": values[0],
+            "avg": round(sum(values) / len(values), 2),
+            "max": values[-1],
+            "p95": percentile(values, 95)
+        }
+    return aggregates
+
+
+class HostSampler:
+
+    # samples the host cpu, memory, root disk & load every sample_interval seconds into a ring buffer of the last
+    # buffer_size samples, so reports can carry aggregates over the time since the previous report rather then a single
+    # point in time sample (or a cpu percentage over however long the last check-in happened to take)
+    def __init__(self, sample_interval=1, buffer_size=3600):
+        self.sample_interval = sample_interval
+        self.samples = deque(maxlen=buffer_size)
+        self.samples_lock = Lock()
+        self.previous_cpu_times = read_cpu_times()
+        self.window_start_time = time.monotonic()
+
+    # take the first sample right away so there is always a latest sample to read
+    def start(self):
+        self.sample()
+        Thread(target=self.sample_loop, daemon=True).start()
+
+    def sample_loop(self):
+        while True:
+            time.sleep(self.sample_interval)
+            try:
+                self.sample()
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed sampling the host")
+
+    def sample(self):
+        cpu_busy_time, cpu_total_time = read_cpu_times()
+        previous_cpu_busy_time, previous_cpu_total_time = self.previous_cpu_times
+        self.previous_cpu_times = (cpu_busy_time, cpu_total_time)
+        if cpu_total_time > previous_cpu_total_time:
+            cpu_percent = round((cpu_busy_time - previous_cpu_busy_time) /
+                                (cpu_total_time - previous_cpu_total_time) * 100.0, 2)
+        else:
+            cpu_percent = 0.0
+        host_sample = HostSample(time.monotonic(), cpu_percent, *read_memory(), *read_root_disk(),
+                                 round(os.getloadavg()[0], 2))
+        with self.samples_lock:
+            self.samples.append(host_sample)
+        return host_sample
+
+    # the latest sample, None if nothing was sampled yet
+    def latest(self):
+        with self.samples_lock:
+            if len(self.samples) == 0:
+                return None
+            return self.samples[-1]
+
+    # return the aggregates of the samples taken in the last seconds seconds (or of all buffered samples)
+    def window(self, seconds=None):
+        with self.samples_lock:
+            samples = list(self.samples)
+        if seconds is not None:
+            window_start_time = time.monotonic() - seconds
+            samples = [sample for sample in samples if sample.sample_time >= window_start_time]
+        return self.summarize_window(samples)
+
+    # return the aggregates of the samples taken since the last time this was called
+    def pop_window(self):
+        with self.samples_lock:
+            samples = [sample for sample in self.samples if sample.sample_time >= self.window_start_time]
+            self.window_start_time = time.monotonic()
+        return self.summarize_window(samples)
+
+    @staticmethod
+    def summarize_window(samples):
+        if len(samples) == 0:
+            return None
+        window = {
+            "samples": len(samples),
+            "seconds": round(samples[-1].sample_time - samples[0].sample_time, 2)
+        }
+        window.update(aggregate_samples(samples))
+        return window
@@ -0,0 +1,245 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from functions.misc.tracing import tracer
+from threading import Thread, Lock
+import bisect, sys, time
+
+# the default histogram buckets in seconds, fitting everything from a quick docker API call to a slow image pull
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(label_names, label_values, extra_label=None):
+    labels = [label_name + '="' + str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") +
+              '"' for label_name, label_value in zip(label_names, label_values)]
+    if extra_label is not None:
+        labels.append(extra_label)
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+
+    metric_type = "untyped"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.lock = Lock()
+        self.values = {}
+
+    def label_values(self, labels):
+        return tuple(str(labels.get(label_name, "")) for label_name in self.label_names)
+
+    def exposition_lines(self):
+        lines = ["# HELP " + self.name + " " + self.help_text, "# TYPE " + self.name + " " + self.metric_type]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(self.name + format_labels(self.label_names, label_values) + " " + format_value(value))
+        return lines
+
+
+class Counter(Metric):
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        label_values = self.label_values(labels)
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+
+    metric_type = "gauge"
+
+    def __init__(self, name, help_text, label_names=()):
+        Metric.__init__(self, name, help_text, label_names=label_names)
+        self.value_function = None
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.label_values(labels)] = value
+
+    # have the gauge read it's value by calling value_function on every scrape rather then being set
+    def set_function(self, value_function):
+        self.value_function = value_function
+
+    def exposition_lines(self):
+        if self.value_function is not None:
+            try:
+                self.set(self.value_function())
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed getting the value of metric " + self.name)
+        return Metric.exposition_lines(self)
+
+
+class Histogram(Metric):
+
+    metric_type = "histogram"
+
+    # the values of a histogram are [per bucket counts, sum, count] with the bucket counts not yet cumulative
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, help_text, label_names=label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        label_values = self.label_values(labels)
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram_values = self.values.get(label_values)
+            if histogram_values is None:
+                histogram_values = [[0] * len(self.buckets), 0.0, 0]
+                self.values[label_values] = histogram_values
+            histogram_values[0][bucket_index] += 1
+            histogram_values[1] += value
+            histogram_values[2] += 1
+
+    # a context manager observing the time it's block took
+    def time(self, **labels):
+        return HistogramTimer(self, labels)
+
+    def exposition_lines(self):
+        lines = ["# HELP " + self.name + " " + self.help_text, "# TYPE " + self.name + " " + self.metric_type]
+        with self.lock:
+            for label_values, histogram_values in sorted(self.values.items()):
+                cumulative_count = 0
+                for bucket, bucket_count in zip(self.buckets, histogram_values[0]):
+                    cumulative_count += bucket_count
+                    lines.append(self.name + "_bucket" +
+                                 format_labels(self.label_names, label_values, 'le="' + format_value(bucket) + '"') +
+                                 " " + str(cumulative_count))
+                lines.append(self.name + "_sum" + format_labels(self.label_names, label_values) + " " +
+                             format_value(histogram_values[1]))
+                lines.append(self.name + "_count" + format_labels(self.label_names, label_values) + " " +
+                             str(histogram_values[2]))
+        return lines
+
+
+class HistogramTimer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.monotonic() - self.start_time, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+
+    # metrics are created on first use & the same metric object is returned for the same name after that
+    def __init__(self):
+        self.lock = Lock()
+        self.metrics = {}
+
+    def get_or_create(self, metric_class, name, help_text, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, help_text, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self.get_or_create(Counter, name, help_text, label_names=label_names)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self.get_or_create(Gauge, name, help_text, label_names=label_names)
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.get_or_create(Histogram, name, help_text, label_names=label_names, buckets=buckets)
+
+    # return all metrics in the prometheus text exposition format
+    def exposition(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.exposition_lines())
+        return "\n".join(lines) + "\n"
+
+
+# the registry all of the worker metrics are kept in
+metrics = MetricsRegistry()
+
+
+class InstrumentedProxy:
+
+    # wraps an object so each call of one of it's method_names is timed into the histogram labeled by the method name &
+    # is recorded as a tracing span, used to time the docker API calls of the docker client, only method_names are
+    # timed as the client also has helpers which never reach the API & calls made with stream=True aren't timed as they
+    # return as soon as the stream is open
+    def __init__(self, wrapped_object, histogram, method_names, label_name="operation", span_prefix="docker_api"):
+        self.wrapped_object = wrapped_object
+        self.span_prefix = span_prefix
+        self.histogram = histogram
+        self.method_names = frozenset(method_names)
+        self.label_name = label_name
+
+    def __getattr__(self, attribute_name):
+        attribute = getattr(self.wrapped_object, attribute_name)
+        if attribute_name not in self.method_names or not callable(attribute):
+            return attribute
+        histogram = self.histogram
+        labels = {self.label_name: attribute_name}
+        span_name = self.span_prefix + "." + attribute_name
+
+        def timed_call(*args, **kwargs):
+            if kwargs.get("stream") is True:
+                return attribute(*args, **kwargs)
+            with tracer.span(span_name), histogram.time(**labels):
+                return attribute(*args, **kwargs)
+        return timed_call
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    registry = metrics
+
+    # /metrics returns the metrics & /trace the recorded tracing spans, /trace?format=chrome in the chrome trace format
+    def do_GET(self):
+        request_path, _, request_query = self.path.partition("?")
+        if request_path == "/metrics":
+            response_body = self.registry.exposition().encode("utf-8")
+            content_type = PROMETHEUS_CONTENT_TYPE
+        elif request_path == "/trace":
+            trace_format = "chrome" if "format=chrome" in request_query else "json"
+            response_body = tracer.dump(trace_format=trace_format).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    # scrapes every few seconds shouldn't flood the worker logs
+    def log_message(self, format, *args):
+        pass
+
+
+# serve the /metrics endpoint from a daemon thread so scrapes never touch the main loop
+def start_metrics_server(port, host="0.0.0.0"):
+    metrics_server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    metrics_server.daemon_threads = True
+    Thread(target=metrics_server.serve_forever, daemon=True).start()
+    print("serving worker metrics on port " + str(port) + " /metrics")
+    return metrics_server
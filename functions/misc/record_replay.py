@@ -0,0 +1,193 @@
+from collections import deque
+from threading import Lock, Condition
+import gzip, json, time
+
+TRAFFIC_FORMAT = "nebula-traffic"
+TRAFFIC_FORMAT_VERSION = 1
+
+# calls which return endless streams, these are passed through when recording & return empty streams when replaying
+STREAMING_OPERATIONS = ("events", "attach", "logs")
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+class ReplayedError(Exception):
+    pass
+
+
+def call_key(operation, args, kwargs):
+    return operation + " " + json.dumps([args, kwargs], sort_keys=True, default=str)
+
+
+def is_streaming_call(operation, kwargs):
+    return operation in STREAMING_OPERATIONS or (operation == "stats" and kwargs.get("stream", True) is True)
+
+
+class TrafficRecorder:
+
+    # records calls to a gzip compressed JSON-lines file, each call is flushed as soon as it's recorded so the file
+    # stays readable up to the last call even if the worker is killed mid recording
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock = Lock()
+        self.start_time = time.monotonic()
+        self.traffic_file = gzip.open(file_path, "wt", encoding="utf-8")
+        self.write({"format": TRAFFIC_FORMAT, "format_version": TRAFFIC_FORMAT_VERSION, "start_time": time.time()})
+
+    def write(self, traffic_event):
+        with self.lock:
+            self.traffic_file.write(json.dumps(traffic_event, default=str) + "\n")
+            self.traffic_file.flush()
+
+    def record(self, source, operation, args, kwargs, call_start, result=None, error=None):
+        self.write({
+            "source": source,
+            "operation": operation,
+            "key": call_key(operation, args, kwargs),
+            "offset": round(call_start - self.start_time, 6),
+            "duration": round(time.monotonic() - call_start, 6),
+            "result": result,
+            "error": error
+        })
+
+    def close(self):
+        with self.lock:
+            self.traffic_file.close()
+
+
+class RecordingProxy:
+
+    # wraps an object so each call of any of it's methods is recorded along with it's result & timing, source tells
+    # the recorded calls of different objects apart (the docker client & the nebula manager connection)
+    def __init__(self, wrapped_object, recorder, source):
+        self.wrapped_object = wrapped_object
+        self.recorder = recorder
+        self.source = source
+
+    def __getattr__(self, attribute_name):
+        attribute = getattr(self.wrapped_object, attribute_name)
+        if not callable(attribute):
+            return attribute
+        recorder = self.recorder
+        source = self.source
+
+        def recorded_call(*args, **kwargs):
+            if is_streaming_call(attribute_name, kwargs) is True:
+                return attribute(*args, **kwargs)
+            call_start = time.monotonic()
+            try:
+                result = attribute(*args, **kwargs)
+                # finite streams (image pulls) are read in full so they can be recorded & then handed back as is
+                if kwargs.get("stream") is True:
+                    result = list(result)
+            except Exception as e:
+                recorder.record(source, attribute_name, args, kwargs, call_start, error=str(e))
+                raise
+            recorder.record(source, attribute_name, args, kwargs, call_start, result=result)
+            if kwargs.get("stream") is True:
+                return iter(result)
+            return result
+        return recorded_call
+
+
+class TrafficReplay:
+
+    # replays a recording made by TrafficRecorder, calls are matched to recorded calls of the same source, operation &
+    # arguments in the order they were recorded, falling back to the next recorded call of the same operation when the
+    # arguments differ (cron_job containers are named by the time they ran), speed scales the recorded timings - 2 is
+    # twice as fast & 0 replays without waiting at all
+    def __init__(self, file_path, speed=1.0):
+        self.speed = speed
+        self.condition = Condition()
+        self.calls_by_key = {}
+        self.calls_by_operation = {}
+        self.replayed_calls = 0
+        self.recorded_calls = 0
+        for traffic_event in self.read_recording(file_path):
+            traffic_event["replayed"] = False
+            self.calls_by_key.setdefault((traffic_event["source"], traffic_event["key"]), deque()).append(
+                traffic_event)
+            self.calls_by_operation.setdefault((traffic_event["source"], traffic_event["operation"]), deque()).append(
+                traffic_event)
+            self.recorded_calls += 1
+        self.start_time = time.monotonic()
+
+    @staticmethod
+    def read_recording(file_path):
+        with gzip.open(file_path, "rt", encoding="utf-8") as traffic_file:
+            header = json.loads(traffic_file.readline())
+            if header.get("format") != TRAFFIC_FORMAT or header.get("format_version") != TRAFFIC_FORMAT_VERSION:
+                raise ValueError("unsupported traffic recording " + file_path)
+            try:
+                for traffic_line in traffic_file:
+                    yield json.loads(traffic_line)
+            except (EOFError, ValueError):
+                # the recording was cut short by the worker being killed, replay what was recorded
+                pass
+
+    def scaled(self, seconds):
+        if self.speed <= 0:
+            return 0
+        return seconds / self.speed
+
+    @staticmethod
+    def pop_unreplayed(calls):
+        while len(calls) > 0:
+            traffic_event = calls.popleft()
+            if traffic_event["replayed"] is False:
+                traffic_event["replayed"] = True
+                return traffic_event
+        return None
+
+    def next_call(self, source, operation, args, kwargs):
+        with self.condition:
+            traffic_event = self.pop_unreplayed(self.calls_by_key.get((source, call_key(operation, args, kwargs)),
+                                                                      deque()))
+            if traffic_event is None:
+                traffic_event = self.pop_unreplayed(self.calls_by_operation.get((source, operation), deque()))
+            if traffic_event is not None:
+                self.replayed_calls += 1
+            return traffic_event
+
+    # replay a single call - wait until it's recorded time for manager calls (which pace the check-in loop) or for
+    # it's recorded duration for everything else & return it's recorded result or raise it's recorded error
+    def replay(self, source, operation, args, kwargs):
+        traffic_event = self.next_call(source, operation, args, kwargs)
+        if traffic_event is None:
+            if source == "manager":
+                raise ReplayFinished("replayed all " + str(self.replayed_calls) + " recorded calls")
+            raise ReplayMismatch("no recorded " + source + " call left matching " + call_key(operation, args, kwargs))
+        if source == "manager":
+            time.sleep(max(self.start_time + self.scaled(traffic_event["offset"]) - time.monotonic(), 0))
+        time.sleep(self.scaled(traffic_event["duration"]))
+        if traffic_event["error"] is not None:
+            raise ReplayedError(traffic_event["error"])
+        if kwargs.get("stream") is True:
+            return iter(traffic_event["result"])
+        return traffic_event["result"]
+
+
+class ReplayProxy:
+
+    # stands in for the object the recording was made from, every method call is answered from the recording
+    def __init__(self, traffic_replay, source):
+        self.traffic_replay = traffic_replay
+        self.source = source
+
+    def __getattr__(self, attribute_name):
+        if attribute_name.startswith("_"):
+            return None
+        traffic_replay = self.traffic_replay
+        source = self.source
+
+        def replayed_call(*args, **kwargs):
+            if is_streaming_call(attribute_name, kwargs) is True:
+                return iter([])
+            return traffic_replay.replay(source, attribute_name, list(args), kwargs)
+        return replayed_call
@@ -0,0 +1,182 @@
+from collections import deque
+from threading import Lock, local
+import functools, inspect, itertools, json, os, threading, time
+
+# parameters which their values are recorded as span attributes, dict parameters (app\cron_job configs) are searched
+# for these as keys too
+TRACED_ATTRIBUTES = ("app_name", "cron_job_name", "container_name", "image_name", "version_name", "version_tag",
+                     "docker_image", "app_container_name", "container_type", "container_number", "device_group")
+
+
+class Span:
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = None
+        self.parent_id = None
+        self.start_time = None
+        self.start_monotonic = None
+
+    def set_attribute(self, attribute_name, attribute_value):
+        self.attributes[attribute_name] = attribute_value
+
+    def __enter__(self):
+        span_stack = self.tracer.span_stack()
+        self.span_id = next(self.tracer.span_ids)
+        self.parent_id = span_stack[-1].span_id if len(span_stack) > 0 else None
+        span_stack.append(self)
+        self.start_time = time.time()
+        self.start_monotonic = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.monotonic() - self.start_monotonic
+        self.tracer.span_stack().pop()
+        span_record = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "thread": threading.current_thread().name,
+            "thread_id": threading.get_ident(),
+            "start_time": self.start_time,
+            "duration_seconds": duration,
+            "attributes": self.attributes
+        }
+        if exc_type is not None:
+            span_record["error"] = exc_type.__name__ + ": " + str(exc_value)
+        self.tracer.record(span_record)
+        return False
+
+
+class NoopSpan:
+
+    def set_attribute(self, attribute_name, attribute_value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+
+    # records nested timed spans into a ring buffer of the last buffer_size spans, spans nest per thread, while
+    # disabled span() returns a shared no-op span & traced functions are called directly
+    def __init__(self, enabled=False, buffer_size=10000):
+        self.enabled = enabled
+        self.spans = deque(maxlen=buffer_size)
+        self.spans_lock = Lock()
+        self.span_ids = itertools.count(1)
+        self.thread_local = local()
+
+    def configure(self, enabled=False, buffer_size=10000):
+        with self.spans_lock:
+            self.spans = deque(self.spans, maxlen=buffer_size)
+        self.enabled = enabled
+
+    def span_stack(self):
+        span_stack = getattr(self.thread_local, "span_stack", None)
+        if span_stack is None:
+            span_stack = []
+            self.thread_local.span_stack = span_stack
+        return span_stack
+
+    def span(self, name, **attributes):
+        if self.enabled is False:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def record(self, span_record):
+        with self.spans_lock:
+            self.spans.append(span_record)
+
+    def list_spans(self):
+        with self.spans_lock:
+            return list(self.spans)
+
+    def dump_json(self):
+        return json.dumps(self.list_spans(), default=str)
+
+    # the chrome trace event format, load it in chrome://tracing or https://ui.perfetto.dev
+    def dump_chrome_trace(self):
+        trace_events = []
+        for span_record in self.list_spans():
+            span_arguments = dict(span_record["attributes"])
+            if "error" in span_record:
+                span_arguments["error"] = span_record["error"]
+            trace_events.append({
+                "name": span_record["name"],
+                "ph": "X",
+                "ts": int(span_record["start_time"] * 1000000),
+                "dur": int(span_record["duration_seconds"] * 1000000),
+                "pid": os.getpid(),
+                "tid": span_record["thread_id"],
+                "args": span_arguments
+            })
+        return json.dumps({"traceEvents": trace_events, "displayTimeUnit": "ms"}, default=str)
+
+    def dump(self, trace_format="json"):
+        if trace_format == "chrome":
+            return self.dump_chrome_trace()
+        return self.dump_json()
+
+    # write the spans to a file, used to dump them on SIGUSR1
+    def dump_to_file(self, file_path, trace_format="json"):
+        with open(file_path, "w") as trace_file:
+            trace_file.write(self.dump(trace_format=trace_format))
+        print("dumped " + str(len(self.spans)) + " tracing spans to " + file_path)
+
+
+# the tracer all of the worker spans are recorded to
+tracer = Tracer()
+
+
+# pick the span attributes out of a traced function call arguments
+def call_attributes(parameter_names, args, kwargs):
+    attributes = {}
+    for parameter_name, argument in itertools.chain(zip(parameter_names, args), kwargs.items()):
+        if parameter_name in TRACED_ATTRIBUTES and isinstance(argument, (str, int, float)):
+            attributes[parameter_name] = argument
+        elif isinstance(argument, tuple) and hasattr(argument, "_fields"):
+            # namedtuples such as reconcile actions
+            for attribute_name, attribute_value in zip(argument._fields, argument):
+                if isinstance(attribute_value, (str, int, float)):
+                    attributes.setdefault(attribute_name, attribute_value)
+        elif isinstance(argument, dict):
+            for attribute_name in TRACED_ATTRIBUTES:
+                attribute_value = argument.get(attribute_name)
+                if isinstance(attribute_value, (str, int, float)):
+                    attributes.setdefault(attribute_name, attribute_value)
+    return attributes
+
+
+# decorate a function so each call of it is recorded as a span named span_name (the function name by default) with
+# it's app\container\image arguments as attributes
+def traced(span_name=None):
+    def decorator(function):
+        name = span_name or function.__qualname__
+        parameter_names = tuple(inspect.signature(function).parameters)
+
+        @functools.wraps(function)
+        def traced_function(*args, **kwargs):
+            if tracer.enabled is False:
+                return function(*args, **kwargs)
+            with Span(tracer, name, call_attributes(parameter_names, args, kwargs)):
+                return function(*args, **kwargs)
+        return traced_function
+    return decorator
+
+
+# decorate all of the public methods of a class with traced
+def trace_methods(cls):
+    for attribute_name, attribute in list(vars(cls).items()):
+        if inspect.isfunction(attribute) and not attribute_name.startswith("_"):
+            setattr(cls, attribute_name, traced()(attribute))
+    return cls
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from threading import Condition
+import sys
+
+
+class AppReconcileExecutor:
+
+    # operations of different apps run in parallel up to max_concurrency at a time while operations of the same app run
+    # one after the other, as each operation is given the whole app config a queued operation which didn't start yet is
+    # superseded by a newer operation of the same app rather then running both
+    def __init__(self, max_concurrency=4):
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="app-reconcile")
+        self.condition = Condition()
+        self.app_queues = {}
+        self.in_flight_operations = 0
+
+    # queue an operation of an app, returns right away without waiting for it to run
+    def submit(self, app_name, operation, *args, **kwargs):
+        with self.condition:
+            if app_name in self.app_queues:
+                if len(self.app_queues[app_name]) > 0:
+                    print("superseding the queued change of app " + app_name)
+                    self.app_queues[app_name].clear()
+                else:
+                    self.in_flight_operations += 1
+                self.app_queues[app_name].append((operation, args, kwargs))
+                return
+            self.in_flight_operations += 1
+            self.app_queues[app_name] = deque()
+        self.pool.submit(self.run_app_operations, app_name, operation, args, kwargs)
+
+    # run the operation & then any other operation of the same app which was queued up while it ran
+    def run_app_operations(self, app_name, operation, args, kwargs):
+        while True:
+            try:
+                operation(*args, **kwargs)
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed reconciling app " + app_name)
+            with self.condition:
+                self.in_flight_operations -= 1
+                if len(self.app_queues[app_name]) == 0:
+                    self.app_queues.pop(app_name)
+                    self.condition.notify_all()
+                    return
+                operation, args, kwargs = self.app_queues[app_name].popleft()
+
+    # number of operations which are either running or queued
+    def in_flight(self):
+        with self.condition:
+            return self.in_flight_operations
+
+    # check if an app has any running or queued operation
+    def app_busy(self, app_name):
+        with self.condition:
+            return app_name in self.app_queues
+
+    # block until all running & queued operations completed, returns False if the timeout passed first
+    def wait_until_idle(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.in_flight_operations == 0, timeout=timeout)
@@ -0,0 +1,154 @@
+from collections import namedtuple
+import hashlib, json
+
+# the actions a reconcile plan can be made of
+ADD_APP = "add_app"
+STOP_APP = "stop_app"
+RESTART_APP = "restart_app"
+ROLL_APP = "roll_app"
+REMOVE_APP = "remove_app"
+ADD_CRON_JOB = "add_cron_job"
+UPDATE_CRON_JOB = "update_cron_job"
+REMOVE_CRON_JOB = "remove_cron_job"
+PRUNE_IMAGES = "prune_images"
+
+# force marks restarts\rolls which must replace the app containers even if they already match the app config
+ReconcileAction = namedtuple("ReconcileAction", ["action", "name", "config", "force"], defaults=(False,))
+
+# the app keys which make up the spec of each of it's containers, the other app keys (app_id, running, rolling_restart &
+# containers_per) don't change what a single container of the app is created from
+APP_SPEC_KEYS = ("docker_image", "env_vars", "starting_ports", "volumes", "devices", "privileged", "networks")
+
+
+# return a stable fingerprint of any json serializable object, keys are sorted so dict ordering doesn't matter
+def fingerprint(json_object):
+    return hashlib.sha1(json.dumps(json_object, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+# check if nothing but the app_id of an app changed, which is how the manager asks for an app to be restarted
+def app_id_only_changed(local_app, remote_app):
+    return fingerprint(dict(local_app, app_id=None)) == fingerprint(dict(remote_app, app_id=None))
+
+
+# return the fingerprint of the spec an app containers are created from, containers are labeled with it so it's
+# possible to tell if a running container matches the app config without inspecting it
+def app_spec_fingerprint(app_json):
+    return fingerprint(dict((spec_key, app_json.get(spec_key)) for spec_key in APP_SPEC_KEYS))
+
+
+class DeviceGroupIndex:
+
+    # only the fingerprint of the whole reply is calculated up front, the per app\cron_job indexes are built the first
+    # time they are needed so an unchanged reply costs a single hash
+    def __init__(self, device_group_info_reply):
+        self.reply = device_group_info_reply
+        self.fingerprint = fingerprint(device_group_info_reply)
+        self.device_group_id = device_group_info_reply["device_group_id"]
+        self.prune_id = device_group_info_reply["prune_id"]
+        self._apps = None
+        self._cron_jobs = None
+
+    @property
+    def apps(self):
+        if self._apps is None:
+            self._apps = {}
+            for app in self.reply["apps"]:
+                self._apps[app["app_name"]] = (app, fingerprint(app))
+        return self._apps
+
+    @property
+    def cron_jobs(self):
+        if self._cron_jobs is None:
+            self._cron_jobs = {}
+            for cron_job in self.reply["cron_jobs"]:
+                self._cron_jobs[cron_job["cron_job_name"]] = (cron_job, fingerprint(cron_job))
+        return self._cron_jobs
+
+    # return the config of an app by it's name, None if the device_group doesn't contain it
+    def get_app(self, app_name):
+        app = self.apps.get(app_name)
+        return app[0] if app is not None else None
+
+    # return the config of a cron_job by it's name, None if the device_group doesn't contain it
+    def get_cron_job(self, cron_job_name):
+        cron_job = self.cron_jobs.get(cron_job_name)
+        return cron_job[0] if cron_job is not None else None
+
+
+class ReconcilePlan:
+
+    def __init__(self):
+        self.actions = []
+        self.changed = False
+
+    def add(self, action, name, config, force=False):
+        self.actions.append(ReconcileAction(action, name, config, force))
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __iter__(self):
+        return iter(self.actions)
+
+
+# diff the locally applied device_group against the one the manager replied with and return the plan of actions needed
+# to bring the worker in line with it, changes are detected by the monotonic ids increasing same as the manager sets
+# them while the fingerprints allow skipping anything which hasn't changed at all
+def plan_device_group_changes(local_index, remote_index):
+    plan = ReconcilePlan()
+    if local_index.fingerprint == remote_index.fingerprint:
+        return plan
+
+    # apps which their app_id increased are stopped\rolled\restarted, newly added apps are started
+    local_apps = local_index.apps
+    for app_name, (remote_app, remote_app_fingerprint) in remote_index.apps.items():
+        local_app = local_apps.get(app_name)
+        if local_app is None:
+            plan.changed = True
+            plan.add(ADD_APP, app_name, remote_app)
+        elif local_app[1] != remote_app_fingerprint and remote_app["app_id"] > local_app[0]["app_id"]:
+            plan.changed = True
+            if remote_app["running"] is False:
+                plan.add(STOP_APP, app_name, remote_app)
+            elif remote_app["rolling_restart"] is True and local_app[0]["running"] is True:
+                plan.add(ROLL_APP, app_name, remote_app, force=app_id_only_changed(local_app[0], remote_app))
+            else:
+                plan.add(RESTART_APP, app_name, remote_app, force=app_id_only_changed(local_app[0], remote_app))
+
+    # apps which were removed from the device_group are stopped
+    device_group_id_increased = remote_index.device_group_id > local_index.device_group_id
+    if device_group_id_increased is True:
+        plan.changed = True
+        remote_apps = remote_index.apps
+        for app_name, (local_app, local_app_fingerprint) in local_apps.items():
+            if app_name not in remote_apps:
+                plan.add(REMOVE_APP, app_name, local_app)
+
+    # cron_jobs which their cron_job_id increased are updated\removed, newly added cron_jobs are scheduled
+    local_cron_jobs = local_index.cron_jobs
+    for cron_job_name, (remote_cron_job, remote_cron_job_fingerprint) in remote_index.cron_jobs.items():
+        local_cron_job = local_cron_jobs.get(cron_job_name)
+        if local_cron_job is None:
+            plan.changed = True
+            plan.add(ADD_CRON_JOB, cron_job_name, remote_cron_job)
+        elif local_cron_job[1] != remote_cron_job_fingerprint and \
+                remote_cron_job["cron_job_id"] > local_cron_job[0]["cron_job_id"]:
+            plan.changed = True
+            if remote_cron_job["running"] is False:
+                plan.add(REMOVE_CRON_JOB, cron_job_name, remote_cron_job)
+            else:
+                plan.add(UPDATE_CRON_JOB, cron_job_name, remote_cron_job)
+
+    # cron_jobs which were removed from the device_group are unscheduled
+    if device_group_id_increased is True:
+        remote_cron_jobs = remote_index.cron_jobs
+        for cron_job_name, (local_cron_job, local_cron_job_fingerprint) in local_cron_jobs.items():
+            if cron_job_name not in remote_cron_jobs:
+                plan.add(REMOVE_CRON_JOB, cron_job_name, local_cron_job)
+
+    # images are pruned when the prune_id increased
+    if remote_index.prune_id > local_index.prune_id:
+        plan.changed = True
+        plan.add(PRUNE_IMAGES, None, None)
+
+    return plan
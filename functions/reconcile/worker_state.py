@@ -0,0 +1,38 @@
+import json, os, sys
+
+
+class WorkerStateFile:
+
+    # keeps the last device_group config the worker applied on local disk so it's known across worker restarts, the
+    # file is replaced atomically so a crash mid write leaves the previous state in place, if state_file_path is None no
+    # state is kept
+    def __init__(self, state_file_path):
+        self.state_file_path = state_file_path
+
+    # return the last saved device_group info or None if there is none
+    def load(self):
+        if self.state_file_path is None:
+            return None
+        try:
+            with open(self.state_file_path) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed reading worker state file " + self.state_file_path + " - ignoring it")
+            return None
+
+    def save(self, device_group_info):
+        if self.state_file_path is None:
+            return
+        try:
+            state_directory = os.path.dirname(self.state_file_path)
+            if state_directory != "":
+                os.makedirs(state_directory, exist_ok=True)
+            with open(self.state_file_path + ".tmp", "w") as state_file:
+                json.dump(device_group_info, state_file)
+            os.replace(self.state_file_path + ".tmp", self.state_file_path)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed saving worker state file " + self.state_file_path)
@@ -1,13 +1,33 @@
 from kafka import KafkaProducer
+from kafka import codec
 import sys, json
 
+# the compression library kafka-python needs for each compression type, only gzip is part of python itself
+KAFKA_COMPRESSION_CODECS = {
+    "gzip": codec.has_gzip,
+    "snappy": codec.has_snappy,
+    "lz4": codec.has_lz4,
+    "zstd": codec.has_zstd
+}
+
+
+# check a kafka compression type is known & it's python compression library is installed, kafka-python only checks it
+# when the producer is created
+def kafka_compression_type_supported(compression_type):
+    if compression_type is None:
+        return True
+    return compression_type in KAFKA_COMPRESSION_CODECS and KAFKA_COMPRESSION_CODECS[compression_type]() is True
+
 
 class KafkaConnection:
 
+    # compression_type can be None, "gzip", "snappy", "lz4" or "zstd" - all but gzip require their python compression
+    # library to be installed, linger_ms\batch_size\buffer_memory\max_block_ms are passed as is to the KafkaProducer
     def __init__(self, bootstrap_servers, security_protocol="PLAINTEXT", sasl_mechanism=None, sasl_plain_username=None,
                  sasl_plain_password=None, ssl_keyfile=None, ssl_password=None, ssl_certfile=None, ssl_cafile=None,
                  ssl_crlfile=None, sasl_kerberos_service_name="kafka", sasl_kerberos_domain_name="kafka",
-                 topic="nebula-reports"):
+                 topic="nebula-reports", compression_type=None, linger_ms=0, batch_size=16384,
+                 buffer_memory=33554432, max_block_ms=60000):
         self.topic = topic
         self.producer = KafkaProducer(value_serializer=lambda m: json.dumps(m).encode('ascii'),
                                       bootstrap_servers=bootstrap_servers, security_protocol=security_protocol,
@@ -15,15 +35,37 @@ class KafkaConnection:
                                       sasl_plain_password=sasl_plain_password, ssl_keyfile=ssl_keyfile,
                                       ssl_password=ssl_password, ssl_certfile=ssl_certfile, ssl_cafile=ssl_cafile,
                                       ssl_crlfile=ssl_crlfile, sasl_kerberos_service_name=sasl_kerberos_service_name,
-                                      sasl_kerberos_domain_name=sasl_kerberos_domain_name)
+                                      sasl_kerberos_domain_name=sasl_kerberos_domain_name,
+                                      compression_type=compression_type, linger_ms=linger_ms, batch_size=batch_size,
+                                      buffer_memory=buffer_memory, max_block_ms=max_block_ms)
 
     @staticmethod
     def on_send_error(excp):
         print("Report delivery to kafka failed: " + str(excp))
 
-    def push_report(self, report):
+    # send a report without waiting on it's delivery, if on_error is set it's called with the report & the exception
+    # instead of on_send_error when the delivery fails
+    def push_report(self, report, on_error=None):
         try:
-            self.producer.send(self.topic, report).add_errback(self.on_send_error)
+            send_future = self.producer.send(self.topic, report)
+            if on_error is None:
+                send_future.add_errback(self.on_send_error)
+            else:
+                send_future.add_errback(lambda excp: on_error(report, excp))
         except Exception as e:
             print(e, file=sys.stderr)
             print("Report delivery to kafka failed")
+            if on_error is not None:
+                on_error(report, e)
+
+    # send a report and wait for it to be delivered, raises if it wasn't delivered within the timeout
+    def send_report(self, report, timeout=10):
+        self.producer.send(self.topic, report).get(timeout=timeout)
+
+    # block until all buffered reports were delivered or the timeout passed
+    def flush(self, timeout=None):
+        try:
+            self.producer.flush(timeout=timeout)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed flushing reports to kafka")
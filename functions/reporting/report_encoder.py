@@ -0,0 +1,139 @@
+from functions.reconcile.device_group_diff import fingerprint
+from threading import Lock
+
+# consumers should check both of these before decoding a compact report
+COMPACT_REPORT_FORMAT = "nebula-compact"
+COMPACT_REPORT_FORMAT_VERSION = 1
+
+# the per container keys kept in compact reports, a projection of the raw docker stats
+PROJECTED_STATS_KEYS = ("name", "cpu_percent", "memory_usage_bytes", "memory_limit_bytes", "memory_percent",
+                        "network_rx_bytes", "network_tx_bytes", "network_rx_bytes_per_second",
+                        "network_tx_bytes_per_second", "block_read_bytes", "block_write_bytes")
+
+# the keys of the containers lists in a report
+CONTAINERS_LISTS = ("apps_containers", "cron_jobs_containers")
+
+
+# raised by the decoder for a delta which doesn't directly follow the previously decoded report, the consumer should
+# drop deltas until the next snapshot arrives
+class ReportSequenceGap(ValueError):
+    pass
+
+
+# project a container stats summary (see summarize_container_stats) down to the keys compact reports carry
+def project_container_stats(container_stats_summary):
+    projected_stats = {"id": container_stats_summary["id"]}
+    for projected_stats_key in PROJECTED_STATS_KEYS:
+        projected_stats[projected_stats_key] = container_stats_summary.get(projected_stats_key)
+    return projected_stats
+
+
+class CompactReportEncoder:
+
+    # every full_snapshot_every reports a snapshot holding the full state is sent, the reports in between are deltas
+    # holding only what changed since the previous report, the device_group config is only sent when it changed &
+    # in snapshots, otherwise just it's fingerprint is
+    def __init__(self, full_snapshot_every=10):
+        self.full_snapshot_every = max(int(full_snapshot_every), 1)
+        self.snapshot_forced = False
+        self.snapshot_forced_lock = Lock()
+        self.sequence = 0
+        self.last_config_fingerprint = None
+        self.last_containers = {}
+
+    # make the next report a snapshot, called when a report was lost on the way to the consumers so they can resync
+    # rather then waiting for the next periodic snapshot
+    def force_snapshot(self):
+        with self.snapshot_forced_lock:
+            self.snapshot_forced = True
+
+    # encode a report where the containers lists hold projected stats (see project_container_stats)
+    def encode(self, report):
+        with self.snapshot_forced_lock:
+            snapshot = self.snapshot_forced is True or self.sequence % self.full_snapshot_every == 0
+            self.snapshot_forced = False
+        compact_report = {
+            "report_format": COMPACT_REPORT_FORMAT,
+            "report_format_version": COMPACT_REPORT_FORMAT_VERSION,
+            "report_type": "snapshot" if snapshot is True else "delta",
+            "sequence": self.sequence
+        }
+        for report_key, report_value in report.items():
+            if report_key != "current_device_group_config" and report_key not in CONTAINERS_LISTS:
+                compact_report[report_key] = report_value
+
+        config_fingerprint = fingerprint(report["current_device_group_config"])
+        compact_report["device_group_config_fingerprint"] = config_fingerprint
+        if snapshot is True or config_fingerprint != self.last_config_fingerprint:
+            compact_report["current_device_group_config"] = report["current_device_group_config"]
+        self.last_config_fingerprint = config_fingerprint
+
+        current_containers = {}
+        for containers_list in CONTAINERS_LISTS:
+            compact_report[containers_list] = []
+            for container_stats in report[containers_list]:
+                current_containers[container_stats["id"]] = container_stats
+                last_container_stats = self.last_containers.get(container_stats["id"])
+                if snapshot is True or last_container_stats is None:
+                    compact_report[containers_list].append(container_stats)
+                    continue
+                # only the keys which changed since the previous report are sent in deltas
+                changed_stats = {}
+                for stats_key, stats_value in container_stats.items():
+                    if last_container_stats.get(stats_key) != stats_value:
+                        changed_stats[stats_key] = stats_value
+                if len(changed_stats) > 0:
+                    changed_stats["id"] = container_stats["id"]
+                    compact_report[containers_list].append(changed_stats)
+        if snapshot is False:
+            compact_report["removed_containers"] = [container_id for container_id in self.last_containers
+                                                    if container_id not in current_containers]
+        self.last_containers = current_containers
+        self.sequence += 1
+        return compact_report
+
+
+class CompactReportDecoder:
+
+    # the consumer side of CompactReportEncoder, keeps the state of a single worker & returns the full state after
+    # applying each report to it, reports have to be decoded in order starting with a snapshot, a delta which doesn't
+    # follow the last decoded report raises ReportSequenceGap & once a report was missed every delta is rejected until
+    # the next snapshot rather then applying it on top of the stale state
+    def __init__(self):
+        self.device_group_config = None
+        self.containers = {}
+        self.last_sequence = None
+
+    def decode(self, compact_report):
+        if compact_report.get("report_format") != COMPACT_REPORT_FORMAT or \
+                compact_report.get("report_format_version") != COMPACT_REPORT_FORMAT_VERSION:
+            raise ValueError("unsupported report format " + str(compact_report.get("report_format")) + " version " +
+                             str(compact_report.get("report_format_version")))
+        if compact_report["report_type"] == "snapshot":
+            self.containers = {}
+        elif self.last_sequence is None:
+            raise ReportSequenceGap("delta " + str(compact_report["sequence"]) + " can't be decoded before a snapshot")
+        elif compact_report["sequence"] != self.last_sequence + 1:
+            # a report which was already decoded (or an older one) doesn't change the state, a skipped one does
+            if compact_report["sequence"] > self.last_sequence:
+                self.last_sequence = None
+            raise ReportSequenceGap("delta " + str(compact_report["sequence"]) + " doesn't follow the last decoded "
+                                    "report, waiting for the next snapshot")
+        self.last_sequence = compact_report["sequence"]
+        if "current_device_group_config" in compact_report:
+            self.device_group_config = compact_report["current_device_group_config"]
+        report = {}
+        for report_key, report_value in compact_report.items():
+            if report_key not in CONTAINERS_LISTS and report_key != "removed_containers":
+                report[report_key] = report_value
+        report["current_device_group_config"] = self.device_group_config
+        for container_id in compact_report.get("removed_containers", []):
+            self.containers.pop(container_id, None)
+        for containers_list in CONTAINERS_LISTS:
+            for container_stats in compact_report[containers_list]:
+                self.containers.setdefault(container_stats["id"], {"list": containers_list, "stats": {}})
+                self.containers[container_stats["id"]]["stats"].update(container_stats)
+        for containers_list in CONTAINERS_LISTS:
+            report[containers_list] = [dict(container["stats"]) for container in self.containers.values()
+                                       if container["list"] == containers_list]
+        return report
@@ -0,0 +1,126 @@
+from threading import Thread, Condition
+from collections import deque
+import sys, time
+
+
+class ReportSender:
+
+    # hands reports to kafka from a dedicated thread so a slow or unreachable broker never holds up the check-in loop,
+    # reports wait in a queue bounded to queue_size, once it's full either the oldest queued report is dropped to make
+    # room for the new one (drop_policy="oldest") or the new report is dropped (drop_policy="newest"), if a
+    # report_spool is set reports kafka failed to deliver are written to it & replayed in order once kafka recovers,
+    # whenever a report is lost (dropped or undelivered without a spool) the optional report_encoder
+    # (CompactReportEncoder) is made to send a snapshot next as the deltas which follow can't be applied
+    def __init__(self, kafka_connection_object, queue_size=100, drop_policy="oldest", report_spool=None,
+                 spool_retry_interval=5, report_encoder=None):
+        self.kafka_connection = kafka_connection_object
+        self.queue_size = max(int(queue_size), 1)
+        self.drop_policy = drop_policy
+        self.reports_queue = deque()
+        self.condition = Condition()
+        self.sending = False
+        self.closed = False
+        self.dropped_reports = 0
+        self.report_spool = report_spool
+        self.spool_retry_interval = spool_retry_interval
+        self.report_encoder = report_encoder
+        if self.report_spool is not None:
+            self.report_spool.on_eviction = self.report_lost
+
+    def start(self):
+        Thread(target=self.send_reports, daemon=True).start()
+        if self.report_spool is not None:
+            Thread(target=self.drain_spool, daemon=True).start()
+        return self
+
+    # queue a report to be sent, never blocks
+    def queue_report(self, report):
+        with self.condition:
+            if self.closed is True:
+                return
+            if len(self.reports_queue) >= self.queue_size:
+                self.dropped_reports += 1
+                self.report_lost()
+                if self.drop_policy == "newest":
+                    print("reporting queue full, dropping the new report")
+                    return
+                print("reporting queue full, dropping the oldest queued report")
+                self.reports_queue.popleft()
+            self.reports_queue.append(report)
+            self.condition.notify()
+
+    def queue_depth(self):
+        with self.condition:
+            return len(self.reports_queue)
+
+    def send_reports(self):
+        while True:
+            with self.condition:
+                while len(self.reports_queue) == 0:
+                    self.condition.wait()
+                report = self.reports_queue.popleft()
+                self.sending = True
+            try:
+                # while the spool holds reports new ones are spooled after them so they reach kafka in order, with
+                # the spool empty each report is waited on until kafka acknowledged it & spooled right away if it wasn't
+                # delivered so the next report can't reach kafka ahead of it
+                if self.report_spool is None:
+                    self.kafka_connection.push_report(report, on_error=self.report_not_delivered)
+                elif self.report_spool.is_empty() is False:
+                    self.report_spool.append(report)
+                else:
+                    self.deliver_or_spool_report(report)
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed sending report to kafka")
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+
+    def report_lost(self):
+        if self.report_encoder is not None:
+            self.report_encoder.force_snapshot()
+
+    def report_not_delivered(self, report, excp):
+        print("Report delivery to kafka failed: " + str(excp))
+        self.report_lost()
+
+    def deliver_or_spool_report(self, report):
+        try:
+            self.kafka_connection.send_report(report)
+        except Exception as e:
+            self.spool_report(report, e)
+
+    def spool_report(self, report, excp):
+        print("Report delivery to kafka failed, spooling it to disk: " + str(excp))
+        try:
+            self.report_spool.append(report)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            print("failed spooling report to disk")
+
+    # replay the spooled reports to kafka oldest first, each report is only removed from the spool once kafka
+    # acknowledged it, while kafka is unreachable the drain retries every spool_retry_interval seconds
+    def drain_spool(self):
+        while True:
+            try:
+                report = self.report_spool.peek()
+                if report is None:
+                    time.sleep(self.spool_retry_interval)
+                    continue
+                self.kafka_connection.send_report(report)
+                self.report_spool.pop()
+            except Exception as e:
+                print(e, file=sys.stderr)
+                print("failed replaying spooled reports to kafka - retrying in " + str(self.spool_retry_interval) +
+                      " seconds")
+                time.sleep(self.spool_retry_interval)
+
+    # stop accepting new reports, wait for the queued reports to be handed to kafka & flush them, used on shutdown
+    def close(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.closed = True
+            self.condition.wait_for(lambda: len(self.reports_queue) == 0 and self.sending is False,
+                                    timeout=max(deadline - time.monotonic(), 0))
+        self.kafka_connection.flush(timeout=max(deadline - time.monotonic(), 0))
@@ -0,0 +1,130 @@
+from threading import Lock
+import os, json
+
+# spool segments are named by a zero padded sequence number so sorting their names sorts them oldest to newest
+SPOOL_SEGMENT_SUFFIX = ".spool"
+SPOOL_OFFSET_FILE = "read.offset"
+
+
+class ReportSpool:
+
+    # an append only on disk queue of reports split to segment files of up to segment_max_bytes each, once the spool
+    # is over max_total_bytes the oldest segments are evicted, the read position is kept in a file of it's own so
+    # what's left in the spool survives worker restarts, only the report being read is ever held in memory, on_eviction
+    # is called after segments were evicted as the reports in them are lost
+    def __init__(self, directory, segment_max_bytes=1048576, max_total_bytes=104857600, on_eviction=None):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.lock = Lock()
+        self.evicted_segments = 0
+        self.on_eviction = on_eviction
+        os.makedirs(self.directory, exist_ok=True)
+        self.segments = sorted(file_name for file_name in os.listdir(self.directory)
+                               if file_name.endswith(SPOOL_SEGMENT_SUFFIX))
+        # segment sizes are read from disk once here & then kept up to date by append & eviction
+        self.segment_sizes = {segment_name: os.path.getsize(self.segment_path(segment_name))
+                              for segment_name in self.segments}
+        self.stored_bytes = sum(self.segment_sizes.values())
+        self.read_segment, self.read_offset = self.load_read_position()
+        # appends always start a new segment after a restart so they never follow a line cut short by a crash
+        self.write_segment = None
+        self.peeked_report = None
+        self.peeked_offset = None
+
+    def segment_path(self, segment_name):
+        return os.path.join(self.directory, segment_name)
+
+    def new_segment_name(self):
+        segment_number = 0
+        if len(self.segments) > 0:
+            segment_number = int(self.segments[-1][:-len(SPOOL_SEGMENT_SUFFIX)]) + 1
+        return "%020d" % segment_number + SPOOL_SEGMENT_SUFFIX
+
+    def load_read_position(self):
+        try:
+            with open(os.path.join(self.directory, SPOOL_OFFSET_FILE)) as offset_file:
+                read_segment, read_offset = offset_file.read().split()
+            if read_segment in self.segments:
+                return read_segment, int(read_offset)
+        except (OSError, ValueError):
+            pass
+        return None, 0
+
+    # the read position is replaced atomically so a crash mid write can't corrupt it
+    def save_read_position(self):
+        offset_path = os.path.join(self.directory, SPOOL_OFFSET_FILE)
+        with open(offset_path + ".tmp", "w") as offset_file:
+            offset_file.write(str(self.read_segment) + " " + str(self.read_offset))
+        os.replace(offset_path + ".tmp", offset_path)
+
+    def total_bytes(self):
+        return self.stored_bytes
+
+    def remove_oldest_segment(self):
+        segment_name = self.segments.pop(0)
+        os.remove(self.segment_path(segment_name))
+        self.stored_bytes -= self.segment_sizes.pop(segment_name, 0)
+        if segment_name == self.write_segment:
+            self.write_segment = None
+        if segment_name == self.read_segment:
+            self.read_segment, self.read_offset = None, 0
+            self.peeked_report = None
+            self.save_read_position()
+
+    # append a report to the newest segment, rotating to a new segment once it's full & evicting the oldest segments
+    # once the spool is over it's size cap
+    def append(self, report):
+        report_line = (json.dumps(report) + "\n").encode("utf-8")
+        evicted_segments = self.evicted_segments
+        with self.lock:
+            if self.write_segment is None or \
+                    self.segment_sizes[self.write_segment] + len(report_line) > self.segment_max_bytes:
+                self.write_segment = self.new_segment_name()
+                self.segments.append(self.write_segment)
+                self.segment_sizes[self.write_segment] = 0
+            with open(self.segment_path(self.segments[-1]), "ab") as segment_file:
+                segment_file.write(report_line)
+            self.segment_sizes[self.write_segment] += len(report_line)
+            self.stored_bytes += len(report_line)
+            while len(self.segments) > 1 and self.total_bytes() > self.max_total_bytes:
+                print("report spool is over " + str(self.max_total_bytes) + " bytes - evicting it's oldest segment")
+                self.evicted_segments += 1
+                self.remove_oldest_segment()
+        if self.evicted_segments > evicted_segments and self.on_eviction is not None:
+            self.on_eviction()
+
+    def is_empty(self):
+        with self.lock:
+            return len(self.segments) == 0
+
+    # return the oldest report in the spool without removing it or None if the spool is empty
+    def peek(self):
+        with self.lock:
+            while len(self.segments) > 0:
+                if self.read_segment != self.segments[0]:
+                    self.read_segment, self.read_offset = self.segments[0], 0
+                with open(self.segment_path(self.read_segment), "rb") as segment_file:
+                    segment_file.seek(self.read_offset)
+                    report_line = segment_file.readline()
+                if report_line.endswith(b"\n"):
+                    try:
+                        self.peeked_report = json.loads(report_line)
+                        self.peeked_offset = self.read_offset + len(report_line)
+                        return self.peeked_report
+                    except ValueError:
+                        print("skipping a corrupted report in the report spool")
+                        self.read_offset += len(report_line)
+                        continue
+                # the oldest segment was fully read (or ends with a line cut short by a crash)
+                self.remove_oldest_segment()
+            return None
+
+    # remove the report returned by the last peek from the spool
+    def pop(self):
+        with self.lock:
+            if self.peeked_report is None:
+                return
+            self.read_offset = self.peeked_offset
+            self.peeked_report = None
+            self.save_read_position()
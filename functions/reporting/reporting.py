@@ -1,29 +1,90 @@
 from functions.docker_engine.docker_engine import *
+from functions.docker_engine.stats_collector import *
+from functions.reporting.report_encoder import *
 from functions.misc.server import *
+from functions.misc.host_sampler import *
 import time
 
 
 class ReportingDocument:
 
-    def __init__(self, docker_connection_object, device_group):
+    # if a report encoder (CompactReportEncoder) is given reports are sent in it's compact format with projected
+    # containers stats rather then the raw docker stats & the full device_group config in every report, if a host
+    # sampler (HostSampler) is given the host usage is read from it's samples along with aggregates of the samples taken
+    # since the previous report
+    def __init__(self, docker_connection_object, device_group, stats_collector_object=None, report_encoder=None,
+                 host_sampler_object=None):
         self.docker_connection = docker_connection_object
+        self.stats_collector = stats_collector_object
+        self.host_sampler = host_sampler_object
+        self.report_encoder = report_encoder
         self.server_number_of_cores = get_number_of_cpu_cores()
         self.device_group = device_group
 
+    # when a stats collector is configured the containers stats are read from it's cache rather then asking docker
+    # for a fresh sample of each container which takes 1-2 seconds per container
+    def list_containers_stats(self, container_type):
+        if self.stats_collector is not None:
+            return self.stats_collector.list_containers_stats(container_type=container_type)
+        return self.docker_connection.list_containers_stats(container_type=container_type)
+
+    # the projected stats of the containers, straight from the stats collector precomputed summaries if configured
+    def list_containers_projected_stats(self, container_type):
+        if self.stats_collector is not None:
+            containers_stats_summaries = self.stats_collector.list_containers_stats_summaries(
+                container_type=container_type)
+        else:
+            containers_stats_summaries = [summarize_container_stats(container_stats) for container_stats in
+                                          self.docker_connection.list_containers_stats(container_type=container_type)]
+        return [project_container_stats(container_stats_summary) for container_stats_summary in
+                containers_stats_summaries]
+
+    # return the memory & root disk usage, cpu used percent & the host stats window of the report, when a host sampler
+    # is configured these are read from it's samples rather then sampled while the report is built & the cpu used
+    # percent is the average over the report window
+    def host_usage(self):
+        if self.host_sampler is not None:
+            host_sample = self.host_sampler.latest()
+            host_stats_window = self.host_sampler.pop_window()
+            if host_sample is not None and host_stats_window is not None:
+                memory_usage = {
+                    "total": host_sample.memory_total_mb,
+                    "used": host_sample.memory_used_mb,
+                    "free": host_sample.memory_free_mb,
+                    "available": host_sample.memory_available_mb
+                }
+                root_disk_usage = {
+                    "total": host_sample.root_disk_total_mb,
+                    "used": host_sample.root_disk_used_mb,
+                    "free": host_sample.root_disk_free_mb
+                }
+                return memory_usage, root_disk_usage, host_stats_window["cpu_percent"]["avg"], host_stats_window
+        return get_memory_usage(), get_root_disk_usage(), get_cpu_use_percentage(), None
+
     def current_status_report(self, device_group_config, updated):
+        if self.report_encoder is not None:
+            containers_stats_function = self.list_containers_projected_stats
+        else:
+            containers_stats_function = self.list_containers_stats
+        memory_usage, root_disk_usage, cpu_used_percent, host_stats_window = self.host_usage()
         report = {
-            "memory_usage": get_memory_usage(),
-            "root_disk_usage": get_root_disk_usage(),
+            "memory_usage": memory_usage,
+            "root_disk_usage": root_disk_usage,
             "cpu_usage": {
                 "cores": self.server_number_of_cores,
-                "used_percent": get_cpu_use_percentage()
+                "used_percent": cpu_used_percent
             },
-            "cron_jobs_containers": self.docker_connection.list_containers_stats(container_type="cron_job"),
-            "apps_containers": self.docker_connection.list_containers_stats(container_type="app"),
+            "cron_jobs_containers": containers_stats_function("cron_job"),
+            "apps_containers": containers_stats_function("app"),
+            "image_pulls": self.docker_connection.pop_pull_records(),
             "current_device_group_config": device_group_config,
             "device_group": self.device_group,
             "report_creation_time": int(time.time()),
             "hostname": get_fqdn(),
             "updated": updated
         }
+        if host_stats_window is not None:
+            report["host_stats_window"] = host_stats_window
+        if self.report_encoder is not None:
+            return self.report_encoder.encode(report)
         return report
@@ -0,0 +1,166 @@
+# simulates a fleet of workers checking in against a single nebula manager with the check-in scheduler & reports the
+# manager request rate over time along with how long it took the workers to notice changes, in simulated time so hours
+# of a large fleet take seconds to run:
+# python -m test.benchmarks.check_in_simulation --workers 5000 --duration 3600 --change-every 900 --outage 1200:1320
+from functions.misc.check_in_scheduler import CheckInScheduler
+from collections import Counter
+import argparse, heapq, json, random
+
+
+class FixedCheckInScheduler(CheckInScheduler):
+
+    # the check-in loop before the scheduler existed - a fixed sleep between check-ins no matter what
+    def next_delay(self):
+        return self.check_in_interval
+
+
+class CheckInSimulation:
+
+    # workers boot spread evenly over boot_spread seconds, the device_group changes every change_every seconds, the
+    # manager fails every request during outage (a (start, end) tuple) & takes manager_latency seconds to reply or
+    # slow_latency seconds during slow_period (a (start, end) tuple), scheduler_options are CheckInScheduler arguments
+    def __init__(self, workers=1000, duration=3600, boot_spread=0, change_every=None, outage=None,
+                 manager_latency=0.05, slow_period=None, slow_latency=10, fixed=False, seed=1, **scheduler_options):
+        self.workers = workers
+        self.duration = duration
+        self.boot_spread = boot_spread
+        self.change_every = change_every
+        self.outage = outage
+        self.manager_latency = manager_latency
+        self.slow_period = slow_period
+        self.slow_latency = slow_latency
+        self.fixed = fixed
+        self.random = random.Random(seed)
+        self.scheduler_options = scheduler_options
+        self.change_offset = self.random.uniform(0, change_every) if change_every is not None else None
+        self.now = 0.0
+
+    def in_period(self, period, at_time):
+        return period is not None and period[0] <= at_time < period[1]
+
+    # the number of the device_group config version at a given time, changes are offset from the boot time so they
+    # don't line up with the check-ins of workers which booted together
+    def config_version(self, at_time):
+        if self.change_every is None or at_time < self.change_offset:
+            return 0
+        return int((at_time - self.change_offset) // self.change_every) + 1
+
+    def change_time(self, config_version):
+        return self.change_offset + (config_version - 1) * self.change_every
+
+    def create_scheduler(self):
+        scheduler_class = FixedCheckInScheduler if self.fixed is True else CheckInScheduler
+        return scheduler_class(clock=lambda: self.now, random_generator=self.random, **self.scheduler_options)
+
+    def run(self):
+        schedulers = [self.create_scheduler() for _ in range(self.workers)]
+        seen_versions = [0] * self.workers
+        requests_per_second = Counter()
+        detection_delays = []
+        check_ins = []
+        for worker_number in range(self.workers):
+            boot_time = self.boot_spread * worker_number / self.workers
+            # the initial fetch on boot
+            requests_per_second[int(boot_time)] += 1
+            heapq.heappush(check_ins, (boot_time + schedulers[worker_number].next_delay(), worker_number))
+        while len(check_ins) > 0:
+            self.now, worker_number = heapq.heappop(check_ins)
+            if self.now >= self.duration:
+                break
+            requests_per_second[int(self.now)] += 1
+            scheduler = schedulers[worker_number]
+            if self.in_period(self.outage, self.now):
+                scheduler.check_in_failed()
+            else:
+                latency = self.slow_latency if self.in_period(self.slow_period, self.now) else self.manager_latency
+                current_version = self.config_version(self.now)
+                changed = current_version > seen_versions[worker_number]
+                if changed is True:
+                    detection_delays.append(self.now - self.change_time(current_version))
+                    seen_versions[worker_number] = current_version
+                scheduler.check_in_succeeded(changed=changed, duration=latency)
+            heapq.heappush(check_ins, (self.now + scheduler.next_delay(), worker_number))
+        return self.results(requests_per_second, detection_delays)
+
+    def results(self, requests_per_second, detection_delays):
+        per_second = [requests_per_second.get(second, 0) for second in range(int(self.duration))]
+        sorted_per_second = sorted(per_second)
+        sorted_detection_delays = sorted(detection_delays)
+        return {
+            "mode": "fixed" if self.fixed is True else "adaptive",
+            "workers": self.workers,
+            "total_requests": sum(per_second),
+            "mean_requests_per_second": round(sum(per_second) / len(per_second), 2),
+            "peak_requests_per_second": sorted_per_second[-1],
+            "p99_requests_per_second": sorted_per_second[int(len(sorted_per_second) * 0.99)],
+            "mean_change_detection_seconds": round(sum(detection_delays) / len(detection_delays), 2)
+            if len(detection_delays) > 0 else None,
+            "max_change_detection_seconds": round(sorted_detection_delays[-1], 2)
+            if len(detection_delays) > 0 else None,
+            "requests_per_second": per_second
+        }
+
+
+# the request rate profile in buckets of bucket_seconds - the mean & peak requests per second of each
+def rate_profile(requests_per_second, bucket_seconds=60):
+    profile = []
+    for bucket_start in range(0, len(requests_per_second), bucket_seconds):
+        bucket = requests_per_second[bucket_start:bucket_start + bucket_seconds]
+        profile.append((bucket_start, round(sum(bucket) / len(bucket), 2), max(bucket)))
+    return profile
+
+
+def print_results(results, bucket_seconds):
+    print("%-10s %15s %12s %10s %10s %18s %18s" % ("mode", "total requests", "mean req/s", "peak req/s", "p99 req/s",
+                                                  "mean detection s", "max detection s"))
+    for result in results:
+        print("%-10s %15d %12.2f %10d %10d %18s %18s" % (
+            result["mode"], result["total_requests"], result["mean_requests_per_second"],
+            result["peak_requests_per_second"], result["p99_requests_per_second"],
+            result["mean_change_detection_seconds"], result["max_change_detection_seconds"]))
+    for result in results:
+        print("\n" + result["mode"] + " request rate profile (bucket start second, mean req/s, peak req/s):")
+        for bucket_start, mean_rate, peak_rate in rate_profile(result["requests_per_second"], bucket_seconds):
+            print("%8d %10.2f %8d %s" % (bucket_start, mean_rate, peak_rate, "#" * min(int(peak_rate), 100)))
+
+
+def parse_period(period):
+    if period is None:
+        return None
+    period_start, period_end = period.split(":")
+    return float(period_start), float(period_end)
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="simulate the manager request rate of a fleet of workers")
+    argument_parser.add_argument("--workers", type=int, default=1000)
+    argument_parser.add_argument("--duration", type=int, default=3600, help="simulated seconds")
+    argument_parser.add_argument("--boot-spread", type=float, default=0, help="seconds the workers boot over")
+    argument_parser.add_argument("--change-every", type=float, default=None, help="seconds between config changes")
+    argument_parser.add_argument("--outage", default=None, help="start:end seconds the manager fails every request")
+    argument_parser.add_argument("--slow-period", default=None, help="start:end seconds the manager is slow")
+    argument_parser.add_argument("--check-in-interval", type=float, default=30)
+    argument_parser.add_argument("--jitter", type=float, default=0.2)
+    argument_parser.add_argument("--fast-interval", type=float, default=10)
+    argument_parser.add_argument("--fast-duration", type=float, default=60)
+    argument_parser.add_argument("--idle-after", type=int, default=10)
+    argument_parser.add_argument("--idle-backoff", type=float, default=1.0)
+    argument_parser.add_argument("--max-interval", type=float, default=None)
+    argument_parser.add_argument("--bucket-seconds", type=int, default=60)
+    argument_parser.add_argument("--json", action="store_true", help="print the results as json")
+    arguments = argument_parser.parse_args()
+
+    simulation_results = []
+    for fixed_mode in (True, False):
+        simulation_results.append(CheckInSimulation(
+            workers=arguments.workers, duration=arguments.duration, boot_spread=arguments.boot_spread,
+            change_every=arguments.change_every, outage=parse_period(arguments.outage),
+            slow_period=parse_period(arguments.slow_period), fixed=fixed_mode,
+            check_in_interval=arguments.check_in_interval, jitter=arguments.jitter,
+            fast_interval=arguments.fast_interval, fast_duration=arguments.fast_duration,
+            idle_after=arguments.idle_after, idle_backoff=arguments.idle_backoff,
+            max_interval=arguments.max_interval).run())
+    if arguments.json is True:
+        print(json.dumps(simulation_results, indent=2))
+    else:
+        print_results(simulation_results, arguments.bucket_seconds)
@@ -0,0 +1,254 @@
+# drives the worker.py start\stop\restart\roll\cron paths & the check-in loop against a fake docker engine & a fake
+# nebula manager and reports throughput, end to end reconcile latency & docker call counts per scenario, run with:
+# python -m test.benchmarks.reconcile_benchmark --apps 20 --containers 4 --cron-jobs 5 --docker-latency 0.005
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from test.fakes.fake_nebula_manager import FakeNebulaManager
+from threading import Thread
+import argparse, contextlib, io, json, time
+import worker
+
+BENCHMARK_DEVICE_GROUP = "benchmark"
+
+
+def create_benchmark_app(app_number, containers, app_id=1, running=True, rolling_restart=False):
+    return {
+        "app_name": "app" + str(app_number), "app_id": app_id, "running": running, "rolling_restart": rolling_restart,
+        "docker_image": "registry.example.com/team/app" + str(app_number) + ":1.0", "containers_per":
+            {"server": containers}, "starting_ports": [{str(10000 + app_number * 100): "80"}],
+        "env_vars": {"ENV": "benchmark"}, "volumes": [], "devices": [], "privileged": False, "networks": ["nebula"]
+    }
+
+
+def create_benchmark_cron_job(cron_job_number, cron_job_id=1):
+    return {
+        "cron_job_name": "cron" + str(cron_job_number), "cron_job_id": cron_job_id, "running": True,
+        "schedule": "0 * * * *", "docker_image": "registry.example.com/team/cron" + str(cron_job_number) + ":1.0",
+        "env_vars": {}, "volumes": [], "devices": [], "privileged": False, "networks": ["nebula"]
+    }
+
+
+class ReconcileBenchmark:
+
+    # docker_latencies is a dict of fake docker engine operation to the seconds it takes, see the fake engine ROUTES
+    def __init__(self, apps=10, containers=2, cron_jobs=2, docker_latencies=None, docker_default_latency=0.0,
+                 manager_latency=0.0, reconcile_max_concurrency=4, rolling_restart_batch_size=1,
+                 create_before_stop=False, async_backend=False, container_inventory=False, conditional_fetch=False,
+                 quiet=True):
+        self.apps = [create_benchmark_app(app_number, containers) for app_number in range(apps)]
+        self.cron_jobs = [create_benchmark_cron_job(cron_job_number) for cron_job_number in range(cron_jobs)]
+        self.containers = containers
+        self.device_group_id = 0
+        self.prune_id = 1
+        self.reconcile_max_concurrency = reconcile_max_concurrency
+        self.rolling_restart_batch_size = rolling_restart_batch_size
+        self.create_before_stop = create_before_stop
+        self.async_backend = async_backend
+        self.container_inventory = container_inventory
+        self.inventory = None
+        self.conditional_fetch = conditional_fetch
+        self.quiet = quiet
+        self.docker_engine = FakeDockerEngine(latencies=docker_latencies, default_latency=docker_default_latency)
+        self.nebula_manager = FakeNebulaManager(latency=manager_latency)
+        self.local_device_group_info = None
+        self.local_device_group_index = None
+        self.remote_device_group_index = None
+
+    def start(self):
+        self.docker_engine.start()
+        self.nebula_manager.start()
+        with self.output():
+            self.configure_worker()
+        return self
+
+    def stop(self):
+        worker.app_reconcile_executor.pool.shutdown(wait=True)
+        if self.inventory is not None:
+            self.inventory.stop()
+        if self.conditional_fetch is True:
+            self.nebula_connection.close()
+        self.nebula_manager.stop()
+        self.docker_engine.stop()
+
+    # the worker functions use the module globals worker.py sets up in it's __main__, set them up the same way
+    def configure_worker(self):
+        worker.max_restart_wait_in_seconds = 0
+        worker.cpu_cores = 4
+        worker.total_memory_size_in_mb = 8192
+        worker.rolling_restart_batch_size = self.rolling_restart_batch_size
+        worker.rolling_restart_ready_timeout = 60
+        worker.restart_create_before_stop = self.create_before_stop
+        worker.restart_skip_unchanged = True
+        docker_async_socket = None
+        if self.async_backend is True:
+            docker_async_socket = worker.AsyncDockerFunctions(socket_path=self.docker_engine.socket_path).start()
+        worker.docker_socket = worker.DockerFunctions(base_url=self.docker_engine.base_url,
+                                                      async_backend=docker_async_socket)
+        if self.container_inventory is True:
+            self.inventory = worker.ContainerInventory(worker.docker_socket)
+            self.inventory.start()
+            worker.docker_socket.container_inventory = self.inventory
+        worker.docker_socket.create_docker_network("nebula", "bridge")
+        worker.image_puller = worker.ImagePullManager(worker.docker_socket)
+        worker.app_reconcile_executor = worker.AppReconcileExecutor(max_concurrency=self.reconcile_max_concurrency)
+        worker.cron_scheduler = worker.CronScheduler(worker.run_scheduled_cron_job)
+        worker.cron_job_configs = {}
+        self.nebula_connection = worker.Nebula(host_uri=self.nebula_manager.host_uri, username="benchmark",
+                                               password="benchmark")
+        if self.conditional_fetch is True:
+            self.nebula_connection = worker.DeviceGroupFetcher(self.nebula_connection)
+
+    # the worker prints a line per container operation, keep the benchmark output readable
+    def output(self):
+        if self.quiet is True:
+            return contextlib.redirect_stdout(io.StringIO())
+        return contextlib.nullcontext()
+
+    # publish the current apps & cron_jobs as a new device_group config on the fake manager
+    def publish(self):
+        self.device_group_id += 1
+        self.nebula_manager.set_device_group_info(BENCHMARK_DEVICE_GROUP, {
+            "apps": self.apps, "apps_list": [app["app_name"] for app in self.apps],
+            "cron_jobs": self.cron_jobs, "cron_jobs_list": [cron_job["cron_job_name"] for cron_job in self.cron_jobs],
+            "device_group_id": self.device_group_id, "prune_id": self.prune_id
+        })
+
+    # boot with the same worker.py functions it's __main__ does - start every app & schedule every cron_job of the
+    # device_group
+    def boot(self):
+        self.publish()
+        self.local_device_group_info = worker.get_device_group_info(self.nebula_connection, BENCHMARK_DEVICE_GROUP)
+        worker.start_apps_on_boot(self.local_device_group_info["reply"])
+        worker.schedule_cron_jobs(self.local_device_group_info["reply"])
+        self.local_device_group_index = worker.DeviceGroupIndex(self.local_device_group_info["reply"])
+
+    # a single iteration of the worker.py check-in loop, waits for the app changes it started to complete so it's
+    # duration is the end to end reconcile latency
+    def check_in(self):
+        remote_device_group_info = worker.get_device_group_info(self.nebula_connection, BENCHMARK_DEVICE_GROUP)
+        reconcile_plan, self.remote_device_group_index = worker.reconcile_device_group(
+            self.local_device_group_index, remote_device_group_info, self.remote_device_group_index)
+        worker.app_reconcile_executor.wait_until_idle()
+        if reconcile_plan.changed is True:
+            self.local_device_group_info = remote_device_group_info
+            self.local_device_group_index = self.remote_device_group_index
+        return len(reconcile_plan)
+
+    # a worker restart - the worker boots against the containers the previous worker left running & adopts them
+    def restart_worker(self):
+        self.local_device_group_info = worker.get_device_group_info(self.nebula_connection, BENCHMARK_DEVICE_GROUP)
+        worker.start_apps_on_boot(self.local_device_group_info["reply"], adopt=True)
+        self.local_device_group_index = worker.DeviceGroupIndex(self.local_device_group_info["reply"])
+
+    def change_apps(self, **app_changes):
+        for app in self.apps:
+            app.update(app_changes)
+            app["app_id"] += 1
+        self.publish()
+
+    def run_cron_jobs(self):
+        threads = [Thread(target=worker.run_scheduled_cron_job, args=(cron_job["cron_job_name"],))
+                   for cron_job in self.cron_jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def unchanged_check_ins(self, check_ins=10):
+        for _ in range(check_ins):
+            self.check_in()
+
+    # run a scenario & return it's measurements, containers is the number of containers the scenario changes
+    def measure(self, scenario_name, scenario, containers, iterations=1):
+        self.docker_engine.reset_call_counts()
+        self.nebula_manager.request_counts.clear()
+        self.nebula_manager.bytes_sent = 0
+        start_time = time.monotonic()
+        with self.output():
+            scenario()
+        duration = time.monotonic() - start_time
+        docker_calls = self.docker_engine.reset_call_counts()
+        return {
+            "scenario": scenario_name,
+            "seconds": round(duration, 4),
+            "seconds_per_iteration": round(duration / iterations, 4),
+            "containers": containers,
+            "containers_per_second": round(containers / duration, 1) if containers > 0 and duration > 0 else 0,
+            "docker_calls": sum(docker_calls.values()),
+            "docker_calls_by_operation": dict(sorted(docker_calls.items())),
+            "manager_requests": sum(self.nebula_manager.request_counts.values()),
+            "manager_bytes": self.nebula_manager.bytes_sent,
+            "running_containers": len(self.docker_engine.running_containers())
+        }
+
+    def run(self):
+        app_containers = len(self.apps) * self.containers
+        return [
+            self.measure("boot", self.boot, app_containers),
+            self.measure("unchanged_check_in", self.unchanged_check_ins, 0, iterations=10),
+            self.measure("worker_restart", self.restart_worker, 0),
+            self.measure("restart_check_in", lambda: (self.change_apps(env_vars={"ENV": "restart"}), self.check_in()),
+                         app_containers),
+            self.measure("roll_check_in", lambda: (self.change_apps(rolling_restart=True, env_vars={"ENV": "roll"}),
+                                                   self.check_in()), app_containers),
+            self.measure("metadata_only_check_in", lambda: (self.change_apps(rolling_restart=False), self.check_in()),
+                         0),
+            self.measure("explicit_restart_check_in", lambda: (self.change_apps(), self.check_in()), app_containers),
+            self.measure("cron_jobs_launch", self.run_cron_jobs, len(self.cron_jobs)),
+            self.measure("stop_check_in", lambda: (self.change_apps(running=False), self.check_in()),
+                         app_containers)
+        ]
+
+
+def print_results(results):
+    print("%-20s %10s %12s %12s %14s %10s %9s %14s" % ("scenario", "seconds", "per iter", "containers",
+                                                       "containers/s", "docker", "manager", "manager bytes"))
+    for result in results:
+        print("%-20s %10.4f %12.4f %12d %14.1f %10d %9d %14d" % (
+            result["scenario"], result["seconds"], result["seconds_per_iteration"], result["containers"],
+            result["containers_per_second"], result["docker_calls"], result["manager_requests"],
+            result["manager_bytes"]))
+    print("\ndocker calls by operation:")
+    for result in results:
+        print(result["scenario"] + ": " + json.dumps(result["docker_calls_by_operation"]))
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="benchmark the worker reconcile hot paths")
+    argument_parser.add_argument("--apps", type=int, default=10)
+    argument_parser.add_argument("--containers", type=int, default=2)
+    argument_parser.add_argument("--cron-jobs", type=int, default=2)
+    argument_parser.add_argument("--docker-latency", type=float, default=0.0,
+                                 help="seconds every fake docker engine call takes")
+    argument_parser.add_argument("--docker-latencies", type=json.loads, default=None,
+                                 help='per operation latencies as json, e.g. {"stop_container": 0.5}')
+    argument_parser.add_argument("--manager-latency", type=float, default=0.0)
+    argument_parser.add_argument("--reconcile-max-concurrency", type=int, default=4)
+    argument_parser.add_argument("--rolling-restart-batch-size", type=int, default=1)
+    argument_parser.add_argument("--create-before-stop", action="store_true",
+                                 help="create the new containers of a restart before stopping the old ones")
+    argument_parser.add_argument("--async-backend", action="store_true")
+    argument_parser.add_argument("--container-inventory", action="store_true",
+                                 help="list containers from the events fed containers inventory")
+    argument_parser.add_argument("--conditional-fetch", action="store_true",
+                                 help="get the device_group info with keep-alive, gzip & conditional requests")
+    argument_parser.add_argument("--json", action="store_true", help="print the results as json")
+    arguments = argument_parser.parse_args()
+
+    benchmark = ReconcileBenchmark(apps=arguments.apps, containers=arguments.containers,
+                                   cron_jobs=arguments.cron_jobs, docker_latencies=arguments.docker_latencies,
+                                   docker_default_latency=arguments.docker_latency,
+                                   manager_latency=arguments.manager_latency,
+                                   reconcile_max_concurrency=arguments.reconcile_max_concurrency,
+                                   rolling_restart_batch_size=arguments.rolling_restart_batch_size,
+                                   create_before_stop=arguments.create_before_stop,
+                                   async_backend=arguments.async_backend,
+                                   container_inventory=arguments.container_inventory,
+                                   conditional_fetch=arguments.conditional_fetch).start()
+    try:
+        benchmark_results = benchmark.run()
+    finally:
+        benchmark.stop()
+    if arguments.json is True:
+        print(json.dumps(benchmark_results, indent=2))
+    else:
+        print_results(benchmark_results)
@@ -0,0 +1,113 @@
+# compares the size & encoding throughput of the full and the compact kafka report formats, run with:
+# python -m test.benchmarks.report_size_benchmark --containers 60 --apps 30 --reports 100
+from functions.reporting.reporting import ReportingDocument
+from functions.reporting.report_encoder import CompactReportEncoder
+import argparse, gzip, json, random, time
+
+
+# a raw docker stats sample shaped the same as what the docker engine returns for a container
+def create_raw_stats_sample(container_number, sample_number):
+    return {
+        "read": "2021-07-14T10:00:%02d.000000000Z" % (sample_number % 60),
+        "preread": "2021-07-14T10:00:%02d.000000000Z" % ((sample_number - 1) % 60),
+        "id": "%064x" % container_number,
+        "name": "/app" + str(container_number) + "-1",
+        "num_procs": 0,
+        "pids_stats": {"current": 12},
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": 1000000 * sample_number + random.randint(0, 100000),
+                          "percpu_usage": [random.randint(0, 1000000) for cpu in range(8)],
+                          "usage_in_kernelmode": 100000 * sample_number, "usage_in_usermode": 900000 * sample_number},
+            "system_cpu_usage": 100000000 * sample_number, "online_cpus": 8,
+            "throttling_data": {"periods": 0, "throttled_periods": 0, "throttled_time": 0}
+        },
+        "precpu_stats": {
+            "cpu_usage": {"total_usage": 1000000 * (sample_number - 1),
+                          "percpu_usage": [random.randint(0, 1000000) for cpu in range(8)],
+                          "usage_in_kernelmode": 100000 * (sample_number - 1),
+                          "usage_in_usermode": 900000 * (sample_number - 1)},
+            "system_cpu_usage": 100000000 * (sample_number - 1), "online_cpus": 8,
+            "throttling_data": {"periods": 0, "throttled_periods": 0, "throttled_time": 0}
+        },
+        "memory_stats": {
+            "usage": 50000000 + container_number, "max_usage": 60000000, "limit": 8000000000,
+            "stats": dict([(memory_stat, random.randint(0, 10000000)) for memory_stat in
+                           ("active_anon", "active_file", "cache", "dirty", "hierarchical_memory_limit",
+                            "inactive_anon", "inactive_file", "mapped_file", "pgfault", "pgmajfault", "pgpgin",
+                            "pgpgout", "rss", "rss_huge", "total_active_anon", "total_active_file", "total_cache",
+                            "total_inactive_anon", "total_inactive_file", "total_rss", "unevictable", "writeback")])
+        },
+        "blkio_stats": {"io_service_bytes_recursive": [{"major": 8, "minor": 0, "op": op, "value": 4096}
+                                                       for op in ("Read", "Write", "Sync", "Async", "Total")]},
+        "networks": {"eth0": {"rx_bytes": 1000 * sample_number, "rx_packets": sample_number, "rx_errors": 0,
+                              "rx_dropped": 0, "tx_bytes": 500 * sample_number, "tx_packets": sample_number,
+                              "tx_errors": 0, "tx_dropped": 0}}
+    }
+
+
+def create_device_group_config(number_of_apps):
+    apps = [{
+        "app_name": "app" + str(app_number), "app_id": 1, "running": True, "rolling_restart": False,
+        "docker_image": "registry.example.com/team/app" + str(app_number) + ":1.0." + str(app_number),
+        "containers_per": {"server": 2}, "starting_ports": [{"8000": "80"}], "env_vars": {"ENV": "prod"},
+        "volumes": ["/tmp:/tmp:rw"], "devices": [], "privileged": False, "networks": ["nebula", "bridge"]
+    } for app_number in range(number_of_apps)]
+    return {"status_code": 200, "reply": {
+        "apps": apps, "apps_list": [app["app_name"] for app in apps], "cron_jobs": [], "cron_jobs_list": [],
+        "device_group_id": 1, "prune_id": 1
+    }}
+
+
+class BenchmarkDockerConnection:
+
+    def __init__(self, number_of_containers):
+        self.number_of_containers = number_of_containers
+        self.sample_number = 1
+
+    def list_containers_stats(self, container_type="app"):
+        if container_type != "app":
+            return []
+        self.sample_number += 1
+        return [create_raw_stats_sample(container_number, self.sample_number)
+                for container_number in range(self.number_of_containers)]
+
+    def pop_pull_records(self):
+        return []
+
+
+def run_benchmark(report_encoder, number_of_containers, number_of_apps, number_of_reports):
+    reporting_object = ReportingDocument(BenchmarkDockerConnection(number_of_containers), "benchmark",
+                                         report_encoder=report_encoder)
+    device_group_config = create_device_group_config(number_of_apps)
+    total_bytes = 0
+    total_gzip_bytes = 0
+    start_time = time.perf_counter()
+    for report_number in range(number_of_reports):
+        encoded_report = json.dumps(reporting_object.current_status_report(device_group_config, False)).encode("ascii")
+        total_bytes += len(encoded_report)
+        total_gzip_bytes += len(gzip.compress(encoded_report))
+    duration = time.perf_counter() - start_time
+    return {
+        "average_report_bytes": total_bytes // number_of_reports,
+        "average_gzip_report_bytes": total_gzip_bytes // number_of_reports,
+        "reports_per_second": round(number_of_reports / duration, 1)
+    }
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="compare the full & compact report formats")
+    argument_parser.add_argument("--containers", type=int, default=60)
+    argument_parser.add_argument("--apps", type=int, default=30)
+    argument_parser.add_argument("--reports", type=int, default=100)
+    argument_parser.add_argument("--snapshot-every", type=int, default=10)
+    arguments = argument_parser.parse_args()
+
+    full_results = run_benchmark(None, arguments.containers, arguments.apps, arguments.reports)
+    compact_results = run_benchmark(CompactReportEncoder(full_snapshot_every=arguments.snapshot_every),
+                                    arguments.containers, arguments.apps, arguments.reports)
+    print("format   avg bytes  avg gzip bytes  reports/s")
+    for format_name, results in (("full", full_results), ("compact", compact_results)):
+        print("%-8s %9d  %14d  %9.1f" % (format_name, results["average_report_bytes"],
+                                         results["average_gzip_report_bytes"], results["reports_per_second"]))
+    print("compact reports are %.1fx smaller" % (full_results["average_report_bytes"] /
+                                                 compact_results["average_report_bytes"]))
@@ -0,0 +1,552 @@
+# an in process stand-in of the docker engine API served over a temporary unix socket, it keeps the state of the
+# containers\images\networks it was asked to create in memory, counts every call it gets per operation & can be set to
+# take a configurable latency per operation so the worker hot paths can be measured without a real docker engine
+from http.server import BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn, UnixStreamServer
+from collections import Counter, deque
+from threading import Thread, Lock
+from queue import Queue
+from urllib.parse import urlparse, parse_qs, unquote
+import hashlib, itertools, json, os, re, tempfile, time
+
+FAKE_API_VERSION = "1.41"
+
+# the routes of the fake engine - method, path regex (without the /v<version> prefix) & the name of the operation,
+# the operation name is what latencies & call counts are keyed by and the handler is the method named fake_<operation>
+ROUTES = [
+    ("GET", r"^/_ping$", "ping"),
+    ("GET", r"^/version$", "version"),
+    ("GET", r"^/containers/json$", "list_containers"),
+    ("POST", r"^/containers/create$", "create_container"),
+    ("GET", r"^/containers/(?P<container>[^/]+)/json$", "inspect_container"),
+    ("POST", r"^/containers/(?P<container>[^/]+)/start$", "start_container"),
+    ("POST", r"^/containers/(?P<container>[^/]+)/stop$", "stop_container"),
+    ("POST", r"^/containers/(?P<container>[^/]+)/kill$", "kill_container"),
+    ("POST", r"^/containers/(?P<container>[^/]+)/restart$", "restart_container"),
+    ("POST", r"^/containers/(?P<container>[^/]+)/rename$", "rename_container"),
+    ("GET", r"^/containers/(?P<container>[^/]+)/stats$", "container_stats"),
+    ("DELETE", r"^/containers/(?P<container>[^/]+)$", "remove_container"),
+    ("POST", r"^/containers/prune$", "prune_containers"),
+    ("POST", r"^/images/create$", "pull_image"),
+    ("GET", r"^/images/json$", "list_images"),
+    ("GET", r"^/images/(?P<image>.+)/json$", "inspect_image"),
+    ("DELETE", r"^/images/(?P<image>.+)$", "remove_image"),
+    ("POST", r"^/images/prune$", "prune_images"),
+    ("GET", r"^/distribution/(?P<image>.+)/json$", "inspect_distribution"),
+    ("GET", r"^/networks$", "list_networks"),
+    ("POST", r"^/networks/create$", "create_network"),
+    ("POST", r"^/networks/(?P<network>[^/]+)/connect$", "connect_network"),
+    ("POST", r"^/auth$", "login"),
+    ("GET", r"^/events$", "events"),
+]
+COMPILED_ROUTES = [(method, re.compile(path_regex), operation) for method, path_regex, operation in ROUTES]
+VERSION_PREFIX = re.compile(r"^/v[0-9.]+")
+
+
+class FakeDockerError(Exception):
+
+    def __init__(self, status_code, message):
+        Exception.__init__(self, message)
+        self.status_code = status_code
+        self.message = message
+
+
+def image_reference(image_name, tag="latest"):
+    if ":" in image_name.rsplit("/", 1)[-1]:
+        return image_name
+    return image_name + ":" + tag
+
+
+def label_filters_match(labels, label_filters):
+    for label_filter in label_filters:
+        label_name, _, label_value = label_filter.partition("=")
+        if label_name not in labels or ("=" in label_filter and labels[label_name] != label_value):
+            return False
+    return True
+
+
+class FakeDockerEngineServer(ThreadingMixIn, UnixStreamServer):
+
+    daemon_threads = True
+    # connecting to a unix socket fails right away rather then waiting once it's backlog is full
+    request_queue_size = 1024
+
+
+class FakeDockerEngineRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    engine = None
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method):
+        parsed_url = urlparse(self.path)
+        path = VERSION_PREFIX.sub("", unquote(parsed_url.path))
+        query = dict((key, values[-1]) for key, values in parse_qs(parsed_url.query).items())
+        body = None
+        content_length = int(self.headers.get("Content-Length") or 0)
+        if content_length > 0:
+            body = json.loads(self.rfile.read(content_length))
+        for route_method, route_path, operation in COMPILED_ROUTES:
+            route_match = route_path.match(path)
+            if route_method == method and route_match is not None:
+                break
+        else:
+            self.send_json(404, {"message": "page not found"})
+            return
+        self.engine.record_call(operation)
+        if operation == "events":
+            self.send_events(query)
+            return
+        try:
+            status_code, reply = getattr(self.engine, "fake_" + operation)(query, body, **route_match.groupdict())
+        except FakeDockerError as e:
+            status_code, reply = e.status_code, {"message": e.message}
+        if isinstance(reply, list) and operation == "pull_image":
+            self.send_json_lines(status_code, reply)
+        else:
+            self.send_json(status_code, reply)
+
+    def send_json(self, status_code, reply):
+        response_body = b"" if reply is None else json.dumps(reply).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    # streamed replies are sent chunked with an event per chunk, same as the docker engine does
+    def send_json_lines(self, status_code, replies):
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for reply in replies:
+            chunk = (json.dumps(reply) + "\r\n").encode("utf-8")
+            self.wfile.write(("%x\r\n" % len(chunk)).encode("latin-1") + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    # the events stream stays open sending every event matching it's filters as it happens until the engine stops, same
+    # as docker it starts with the past events since the given time
+    def send_events(self, query):
+        label_filters = json.loads(query.get("filters", "{}")).get("label", [])
+        events_queue = self.engine.subscribe_events(label_filters, since=query.get("since"))
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.flush()
+            while True:
+                event = events_queue.get()
+                if event is None:
+                    break
+                chunk = (json.dumps(event) + "\n").encode("utf-8")
+                self.wfile.write(("%x\r\n" % len(chunk)).encode("latin-1") + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            pass
+        finally:
+            self.engine.unsubscribe_events(events_queue)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDockerEngine:
+
+    # latencies is a dict of operation name (see ROUTES) to the seconds each call of it takes, operations missing from
+    # it take default_latency, pull_layers is the number of layers every image is made of & image_size_mb the disk space
+    # each image takes, image_health is a dict of image:tag to the health status containers created from it report (as
+    # if the image had a healthcheck), containers of other images have no healthcheck
+    def __init__(self, socket_path=None, latencies=None, default_latency=0.0, pull_layers=3,
+                 registry_digest_prefix="sha256:", image_size_mb=100):
+        if socket_path is None:
+            self.socket_directory = tempfile.mkdtemp(prefix="fake-docker-")
+            socket_path = os.path.join(self.socket_directory, "docker.sock")
+        else:
+            self.socket_directory = None
+        self.socket_path = socket_path
+        self.latencies = dict(latencies or {})
+        self.default_latency = default_latency
+        self.pull_layers = pull_layers
+        self.image_size_mb = image_size_mb
+        self.registry_digest_prefix = registry_digest_prefix
+        self.image_health = {}
+        self.lock = Lock()
+        self.call_counts = Counter()
+        self.containers = {}
+        self.images = {}
+        self.registry_digests = {}
+        self.networks = {}
+        self.event_subscribers = {}
+        self.events_history = deque(maxlen=1000)
+        self.ids = itertools.count(1)
+        self.server = None
+
+    @property
+    def base_url(self):
+        return "unix://" + self.socket_path
+
+    def start(self):
+        request_handler = type("BoundFakeDockerEngineRequestHandler", (FakeDockerEngineRequestHandler,),
+                               {"engine": self})
+        self.server = FakeDockerEngineServer(self.socket_path, request_handler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self.lock:
+            for events_queue in self.event_subscribers:
+                events_queue.put(None)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        if self.socket_directory is not None:
+            os.rmdir(self.socket_directory)
+
+    def record_call(self, operation):
+        with self.lock:
+            self.call_counts[operation] += 1
+        latency = self.latencies.get(operation, self.default_latency)
+        if latency > 0:
+            time.sleep(latency)
+
+    def subscribe_events(self, label_filters, since=None):
+        events_queue = Queue()
+        with self.lock:
+            if since is not None:
+                for event in self.events_history:
+                    if event["time"] >= int(since) and \
+                            label_filters_match(event["Actor"]["Attributes"], label_filters) is True:
+                        events_queue.put(event)
+            self.event_subscribers[events_queue] = label_filters
+        return events_queue
+
+    def unsubscribe_events(self, events_queue):
+        with self.lock:
+            self.event_subscribers.pop(events_queue, None)
+
+    # send a container event to every events stream it matches the filters of, called with the lock held
+    def emit_event(self, action, fake_container):
+        labels = fake_container["Config"]["Labels"]
+        event = {
+            "status": action, "id": fake_container["Id"], "Type": "container", "Action": action,
+            "Actor": {"ID": fake_container["Id"],
+                      "Attributes": dict(labels, name=fake_container["Name"].lstrip("/"),
+                                         image=fake_container["Config"]["Image"])},
+            "time": int(time.time())
+        }
+        self.events_history.append(event)
+        for events_queue, label_filters in self.event_subscribers.items():
+            if label_filters_match(labels, label_filters) is True:
+                events_queue.put(event)
+
+    def reset_call_counts(self):
+        with self.lock:
+            call_counts = self.call_counts
+            self.call_counts = Counter()
+        return call_counts
+
+    def new_id(self):
+        return hashlib.sha256(str(next(self.ids)).encode("utf-8")).hexdigest()
+
+    # change the digest the fake registry holds for an image, as if a new version of it was pushed
+    def push_image(self, image_name, tag="latest"):
+        with self.lock:
+            self.registry_digests[image_reference(image_name, tag)] = self.registry_digest_prefix + self.new_id()
+
+    def registry_digest(self, reference):
+        with self.lock:
+            if reference not in self.registry_digests:
+                self.registry_digests[reference] = self.registry_digest_prefix + self.new_id()
+            return self.registry_digests[reference]
+
+    def find_container(self, container):
+        with self.lock:
+            if container in self.containers:
+                return self.containers[container]
+            for fake_container in self.containers.values():
+                if fake_container["Name"] == container or fake_container["Name"] == "/" + container:
+                    return fake_container
+        raise FakeDockerError(404, "No such container: " + container)
+
+    def running_containers(self, container_type=None):
+        with self.lock:
+            return [fake_container for fake_container in self.containers.values()
+                    if fake_container["State"]["Running"] is True and
+                    (container_type is None or fake_container["Config"]["Labels"].get("container_type") ==
+                     container_type)]
+
+    def fake_ping(self, query, body):
+        return 200, "OK"
+
+    def fake_version(self, query, body):
+        return 200, {"ApiVersion": FAKE_API_VERSION, "Version": "20.10.0", "MinAPIVersion": "1.12", "Os": "linux"}
+
+    def fake_list_containers(self, query, body):
+        filters = json.loads(query.get("filters", "{}"))
+        label_filters = filters.get("label", [])
+        if isinstance(label_filters, dict):
+            label_filters = [label_filter for label_filter, enabled in label_filters.items() if enabled]
+        name_filters = filters.get("name", [])
+        show_all = query.get("all") in ("1", "True", "true")
+        containers = []
+        with self.lock:
+            for fake_container in self.containers.values():
+                if show_all is False and fake_container["State"]["Running"] is False:
+                    continue
+                if "health" in filters and fake_container["State"].get("Health", {}).get("Status", "none") not in \
+                        filters["health"]:
+                    continue
+                if label_filters_match(fake_container["Config"]["Labels"], label_filters) is False:
+                    continue
+                if name_filters and not any(re.search(name_filter, fake_container["Name"])
+                                            for name_filter in name_filters):
+                    continue
+                containers.append({
+                    "Id": fake_container["Id"],
+                    "Names": [fake_container["Name"]],
+                    "Image": fake_container["Config"]["Image"],
+                    "ImageID": fake_container["Image"],
+                    "Labels": fake_container["Config"]["Labels"],
+                    "State": fake_container["State"]["Status"],
+                    "Status": fake_container["State"]["Status"]
+                })
+        return 200, containers
+
+    def fake_create_container(self, query, body):
+        container_name = "/" + query["name"]
+        with self.lock:
+            for fake_container in self.containers.values():
+                if fake_container["Name"] == container_name:
+                    raise FakeDockerError(409, "Conflict. The container name " + container_name + " is already in use")
+            container_id = self.new_id()
+            self.containers[container_id] = {
+                "Id": container_id,
+                "Name": container_name,
+                "Created": time.time(),
+                "Image": self.images.get(image_reference(body.get("Image")), {}).get("id"),
+                "Config": {"Image": body.get("Image"), "Labels": body.get("Labels") or {}, "Env": body.get("Env")},
+                "HostConfig": body.get("HostConfig") or {},
+                "State": {"Status": "created", "Running": False, "Restarting": False, "Paused": False, "Dead": False}
+            }
+            if image_reference(body.get("Image")) in self.image_health:
+                self.containers[container_id]["State"]["Health"] = {
+                    "Status": self.image_health[image_reference(body.get("Image"))]}
+            self.emit_event("create", self.containers[container_id])
+        return 201, {"Id": container_id, "Warnings": []}
+
+    def fake_inspect_container(self, query, body, container):
+        return 200, self.find_container(container)
+
+    def set_container_running(self, container, running):
+        fake_container = self.find_container(container)
+        with self.lock:
+            fake_container["State"]["Running"] = running
+            fake_container["State"]["Status"] = "running" if running is True else "exited"
+            self.emit_event("start" if running is True else "die", fake_container)
+
+    # change the health status a container's healthcheck reports, sending the health_status event docker sends for it
+    # unless emit_event is False (as if the worker missed it)
+    def set_container_health(self, container, status, emit_event=True):
+        fake_container = self.find_container(container)
+        with self.lock:
+            fake_container["State"]["Health"] = {"Status": status}
+            if emit_event is True:
+                self.emit_event("health_status: " + status, fake_container)
+
+    # the host ports a container binds, same as docker a container can't start while another running container is
+    # bound to any of them
+    @staticmethod
+    def host_ports(fake_container):
+        return set(port_binding.get("HostPort") for port_bindings in
+                   (fake_container["HostConfig"].get("PortBindings") or {}).values()
+                   for port_binding in (port_bindings or []))
+
+    def fake_start_container(self, query, body, container):
+        fake_container = self.find_container(container)
+        with self.lock:
+            for other_container in self.containers.values():
+                if other_container is not fake_container and other_container["State"]["Running"] is True and \
+                        len(self.host_ports(fake_container) & self.host_ports(other_container)) > 0:
+                    raise FakeDockerError(500, "driver failed programming external connectivity on endpoint " +
+                                          fake_container["Name"].lstrip("/") + ": port is already allocated")
+        self.set_container_running(container, True)
+        return 204, None
+
+    def fake_stop_container(self, query, body, container):
+        self.set_container_running(container, False)
+        return 204, None
+
+    def fake_kill_container(self, query, body, container):
+        self.set_container_running(container, False)
+        return 204, None
+
+    # same as docker a restarted container's healthcheck starts over
+    def fake_restart_container(self, query, body, container):
+        fake_container = self.find_container(container)
+        with self.lock:
+            if "Health" in fake_container["State"]:
+                fake_container["State"]["Health"] = {"Status": "starting"}
+        self.set_container_running(container, True)
+        return 204, None
+
+    def fake_rename_container(self, query, body, container):
+        fake_container = self.find_container(container)
+        with self.lock:
+            fake_container["Name"] = "/" + query["name"]
+            self.emit_event("rename", fake_container)
+        return 204, None
+
+    def fake_container_stats(self, query, body, container):
+        fake_container = self.find_container(container)
+        return 200, {
+            "id": fake_container["Id"],
+            "name": fake_container["Name"],
+            "read": "2021-07-14T10:00:01.000000000Z",
+            "cpu_stats": {"cpu_usage": {"total_usage": 2000000}, "system_cpu_usage": 200000000, "online_cpus": 1},
+            "precpu_stats": {"cpu_usage": {"total_usage": 1000000}, "system_cpu_usage": 100000000},
+            "memory_stats": {"usage": 50000000, "limit": 8000000000},
+            "networks": {"eth0": {"rx_bytes": 1000, "tx_bytes": 1000}},
+            "blkio_stats": {"io_service_bytes_recursive": []}
+        }
+
+    def fake_remove_container(self, query, body, container):
+        fake_container = self.find_container(container)
+        with self.lock:
+            if fake_container["State"]["Running"] is True and query.get("force") not in ("1", "True", "true"):
+                raise FakeDockerError(409, "You cannot remove a running container " + fake_container["Id"])
+            self.containers.pop(fake_container["Id"], None)
+            self.emit_event("destroy", fake_container)
+        return 204, None
+
+    def fake_prune_containers(self, query, body):
+        label_filters = json.loads(query.get("filters", "{}")).get("label", [])
+        containers_deleted = []
+        with self.lock:
+            for container_id, fake_container in list(self.containers.items()):
+                if fake_container["State"]["Running"] is False and \
+                        label_filters_match(fake_container["Config"]["Labels"], label_filters) is True:
+                    containers_deleted.append(container_id)
+                    self.emit_event("destroy", self.containers.pop(container_id))
+        return 200, {"ContainersDeleted": containers_deleted, "SpaceReclaimed": 0}
+
+    # a pull streams per layer progress events the same way the docker engine does, layers of an image which is
+    # already at the registry digest are reported as already existing
+    def fake_pull_image(self, query, body):
+        reference = image_reference(query["fromImage"], query.get("tag") or "latest")
+        digest = self.registry_digest(reference)
+        with self.lock:
+            image_cached = self.images.get(reference, {}).get("digest") == digest
+            image_id = self.images[reference]["id"] if image_cached is True else "sha256:" + self.new_id()
+            self.images[reference] = {"digest": digest, "id": image_id, "last_pulled": time.time(),
+                                      "created": self.images[reference]["created"] if image_cached is True
+                                      else int(time.time())}
+        progress_events = [{"status": "Pulling from " + query["fromImage"], "id": query.get("tag") or "latest"}]
+        for layer_number in range(self.pull_layers):
+            layer_id = "%012x" % layer_number
+            if image_cached is True:
+                progress_events.append({"status": "Already exists", "id": layer_id})
+                continue
+            progress_events.extend([
+                {"status": "Pulling fs layer", "id": layer_id},
+                {"status": "Downloading", "id": layer_id, "progressDetail": {"current": 1048576, "total": 1048576}},
+                {"status": "Download complete", "id": layer_id},
+                {"status": "Extracting", "id": layer_id, "progressDetail": {"current": 1048576, "total": 1048576}},
+                {"status": "Pull complete", "id": layer_id}
+            ])
+        progress_events.append({"status": "Digest: " + digest})
+        progress_events.append({"status": "Status: Downloaded newer image for " + reference})
+        return 200, progress_events
+
+    def fake_inspect_image(self, query, body, image):
+        reference = image_reference(image)
+        with self.lock:
+            fake_image = self.images.get(reference)
+        if fake_image is None:
+            raise FakeDockerError(404, "No such image: " + reference)
+        return 200, {"Id": fake_image["id"], "RepoTags": [reference],
+                     "RepoDigests": [reference.rsplit(":", 1)[0] + "@" + fake_image["digest"]]}
+
+    # the disk space the local images take, images are counted once no matter how many tags they have
+    def images_size_mb(self):
+        with self.lock:
+            return len(set(fake_image["id"] for fake_image in self.images.values())) * self.image_size_mb
+
+    def fake_list_images(self, query, body):
+        images_by_id = {}
+        with self.lock:
+            for reference, fake_image in self.images.items():
+                listed_image = images_by_id.setdefault(fake_image["id"], {
+                    "Id": fake_image["id"], "RepoTags": [], "Created": fake_image["created"],
+                    "Size": self.image_size_mb * 1024 * 1024})
+                listed_image["RepoTags"].append(reference)
+        return 200, list(images_by_id.values())
+
+    # removing a tag only deletes the image once it's last tag is removed, an image any container was created from
+    # can't be removed
+    def fake_remove_image(self, query, body, image):
+        with self.lock:
+            references = [reference for reference, fake_image in self.images.items()
+                          if reference == image_reference(image) or fake_image["id"] == image]
+            if len(references) == 0:
+                raise FakeDockerError(404, "No such image: " + image)
+            image_id = self.images[references[0]]["id"]
+            if any(fake_container["Image"] == image_id for fake_container in self.containers.values()):
+                raise FakeDockerError(409, "conflict: unable to remove " + image + " - image is being used")
+            if len(references) > 1 and query.get("force") not in ("1", "True", "true"):
+                raise FakeDockerError(409, "conflict: unable to delete " + image + " - image is referenced in "
+                                                                                   "multiple repositories")
+            for reference in references:
+                self.images.pop(reference)
+            removed_images = [{"Untagged": reference} for reference in references]
+            if all(fake_image["id"] != image_id for fake_image in self.images.values()):
+                removed_images.append({"Deleted": image_id})
+        return 200, removed_images
+
+    def fake_prune_images(self, query, body):
+        with self.lock:
+            used_images = set(fake_container["Config"]["Image"] for fake_container in self.containers.values())
+            images_deleted = [{"Deleted": fake_image["id"]} for reference, fake_image in self.images.items()
+                              if reference not in used_images]
+            self.images = dict((reference, fake_image) for reference, fake_image in self.images.items()
+                               if reference in used_images)
+        return 200, {"ImagesDeleted": images_deleted, "SpaceReclaimed": 0}
+
+    def fake_inspect_distribution(self, query, body, image):
+        return 200, {"Descriptor": {"mediaType": "application/vnd.docker.distribution.manifest.v2+json",
+                                    "digest": self.registry_digest(image_reference(image)), "size": 1024},
+                     "Platforms": [{"architecture": "amd64", "os": "linux"}]}
+
+    def fake_list_networks(self, query, body):
+        names = json.loads(query.get("filters", "{}")).get("name", [])
+        with self.lock:
+            return 200, [network for network in self.networks.values() if not names or network["Name"] in names]
+
+    def fake_create_network(self, query, body):
+        network_id = self.new_id()
+        with self.lock:
+            self.networks[network_id] = {"Name": body["Name"], "Id": network_id, "Driver": body.get("Driver")}
+        return 201, {"Id": network_id, "Warning": ""}
+
+    def fake_connect_network(self, query, body, network):
+        self.find_container(body["Container"])
+        return 200, None
+
+    def fake_login(self, query, body):
+        return 200, {"Status": "Login Succeeded"}
+
+    # the events stream is sent by the request handler as it never ends
+    def fake_events(self, query, body):
+        return 200, None
@@ -0,0 +1,127 @@
+# an in process stand-in of the nebula manager API serving the device_group /info replies the worker checks in on, the
+# replies are set by the caller & every request it gets is counted so check-ins can be measured without a real manager,
+# optionally tags the /info replies with an ETag answering 304 to a matching If-None-Match & gzips them when accepted
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+from threading import Thread, Lock
+import gzip, hashlib, json, re, time
+
+DEVICE_GROUP_INFO_PATH = re.compile(r"^/api/v2/device_groups/(?P<device_group>[^/]+)/info$")
+
+
+class FakeNebulaManagerRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    manager = None
+
+    def do_GET(self):
+        self.manager.record_connection(self.client_address)
+        path = self.path.split("?")[0]
+        if path == "/api/v2/status":
+            self.manager.record_request("status")
+            self.send_json(200, {"api_available": True})
+            return
+        device_group_match = DEVICE_GROUP_INFO_PATH.match(path)
+        if device_group_match is None:
+            self.send_json(404, {"message": "page not found"})
+            return
+        self.manager.record_request("device_group_info")
+        reply = self.manager.get_device_group_info(device_group_match.group("device_group"))
+        if reply is None:
+            self.send_json(403, {"device_group_exists": False})
+            return
+        response_body = json.dumps(reply).encode("utf-8")
+        etag = None
+        if self.manager.etags is True:
+            etag = '"' + hashlib.sha1(response_body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.manager.record_reply(304, 0)
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        self.send_body(200, response_body, etag=etag)
+
+    def send_json(self, status_code, reply):
+        self.send_body(status_code, json.dumps(reply).encode("utf-8"))
+
+    def send_body(self, status_code, response_body, etag=None):
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if self.manager.gzip_replies is True and "gzip" in self.headers.get("Accept-Encoding", ""):
+            response_body = gzip.compress(response_body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(response_body)))
+        # recorded before anything reaches the client so a test reading the counts right after it's reply sees it
+        self.manager.record_reply(status_code, len(response_body))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeNebulaManager:
+
+    # serves on 127.0.0.1 on a random free port, each request takes latency seconds
+    def __init__(self, latency=0.0, etags=True, gzip_replies=True):
+        self.latency = latency
+        self.etags = etags
+        self.gzip_replies = gzip_replies
+        self.reply_counts = Counter()
+        self.client_addresses = set()
+        self.bytes_sent = 0
+        self.lock = Lock()
+        self.device_groups = {}
+        self.request_counts = Counter()
+        self.server = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def host_uri(self):
+        return "http://127.0.0.1:" + str(self.port)
+
+    def start(self):
+        request_handler = type("BoundFakeNebulaManagerRequestHandler", (FakeNebulaManagerRequestHandler,),
+                               {"manager": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), request_handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def record_request(self, request_type):
+        with self.lock:
+            self.request_counts[request_type] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    # the client address of each connection requests came over, tells keep-alive connections reuse apart
+    def record_connection(self, client_address):
+        with self.lock:
+            self.client_addresses.add(client_address)
+
+    # count the replies by their status code & the bytes of the bodies sent
+    def record_reply(self, status_code, bytes_sent):
+        with self.lock:
+            self.reply_counts[status_code] += 1
+            self.bytes_sent += bytes_sent
+
+    # set the device_group /info reply, reply is the same dict the manager returns under "reply"
+    def set_device_group_info(self, device_group, reply):
+        with self.lock:
+            self.device_groups[device_group] = json.loads(json.dumps(reply))
+
+    def get_device_group_info(self, device_group):
+        with self.lock:
+            return self.device_groups.get(device_group)
@@ -0,0 +1,92 @@
+from unittest import TestCase
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from functions.docker_engine.docker_engine import DockerFunctions
+from functions.reconcile.app_executor import AppReconcileExecutor
+from threading import Event, Lock
+import contextlib, io
+
+TEST_IMAGE = "registry.example.com/team/app"
+
+
+class AppReconcileExecutorTests(TestCase):
+
+    def setUp(self):
+        self.docker_engine = FakeDockerEngine(latencies={"create_container": 0.1}).start()
+        self.addCleanup(self.docker_engine.stop)
+        self.docker_socket = DockerFunctions(base_url=self.docker_engine.base_url)
+        self.executor = AppReconcileExecutor(max_concurrency=4)
+        self.addCleanup(self.executor.pool.shutdown, wait=True)
+        self.lock = Lock()
+        self.running_operations = {}
+        self.max_running_operations = {}
+        self.operations_run = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.docker_socket.create_docker_network("nebula", "bridge")
+
+    # run a container of an app on the fake docker engine while tracking how many operations of the app run at once,
+    # if release is given the operation first waits for it to be set
+    def run_app_container(self, app_name, container_name, release=None):
+        with self.lock:
+            self.running_operations[app_name] = self.running_operations.get(app_name, 0) + 1
+            self.max_running_operations[app_name] = max(self.max_running_operations.get(app_name, 0),
+                                                        self.running_operations[app_name])
+            self.max_running_operations["all"] = max(self.max_running_operations.get("all", 0),
+                                                     sum(self.running_operations.values()))
+        try:
+            if release is not None:
+                release.wait(10)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.docker_socket.run_container(app_name, container_name, TEST_IMAGE, {}, [], {},
+                                                 networks=["nebula"])
+            self.operations_run.append(container_name)
+        finally:
+            with self.lock:
+                self.running_operations[app_name] -= 1
+
+    def test_operations_of_the_same_app_run_one_at_a_time(self):
+        release = Event()
+        self.executor.submit("app1", self.run_app_container, "app1", "app1-1", release=release)
+        self.executor.submit("app1", self.run_app_container, "app1", "app1-2")
+        self.assertTrue(self.executor.app_busy("app1"))
+        self.assertEqual(self.executor.in_flight(), 2)
+        release.set()
+        self.assertTrue(self.executor.wait_until_idle(timeout=10))
+        self.assertEqual(self.operations_run, ["app1-1", "app1-2"])
+        self.assertEqual(self.max_running_operations["app1"], 1)
+        self.assertFalse(self.executor.app_busy("app1"))
+        self.assertEqual(self.executor.in_flight(), 0)
+
+    def test_operations_of_different_apps_run_in_parallel(self):
+        release = Event()
+        for app_number in range(1, 5):
+            self.executor.submit("app" + str(app_number), self.run_app_container, "app" + str(app_number),
+                                 "app" + str(app_number) + "-1", release=release)
+        self.assertEqual(self.executor.in_flight(), 4)
+        release.set()
+        self.assertTrue(self.executor.wait_until_idle(timeout=10))
+        self.assertEqual(self.max_running_operations["all"], 4)
+        self.assertEqual(len(self.docker_engine.running_containers()), 4)
+
+    def test_queued_operation_is_superseded_by_a_newer_one(self):
+        release = Event()
+        self.executor.submit("app1", self.run_app_container, "app1", "app1-1", release=release)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.executor.submit("app1", self.run_app_container, "app1", "app1-2")
+            self.executor.submit("app1", self.run_app_container, "app1", "app1-3")
+        # the running operation & the newest queued one
+        self.assertEqual(self.executor.in_flight(), 2)
+        release.set()
+        self.assertTrue(self.executor.wait_until_idle(timeout=10))
+        self.assertEqual(self.operations_run, ["app1-1", "app1-3"])
+        self.assertEqual(sorted(container["Name"] for container in self.docker_engine.running_containers()),
+                         ["/app1-1", "/app1-3"])
+
+    def test_failed_operation_doesnt_block_the_app(self):
+        def failing_operation():
+            raise RuntimeError("docker went away")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            self.executor.submit("app1", failing_operation)
+            self.assertTrue(self.executor.wait_until_idle(timeout=10))
+        self.executor.submit("app1", self.run_app_container, "app1", "app1-1")
+        self.assertTrue(self.executor.wait_until_idle(timeout=10))
+        self.assertEqual(self.operations_run, ["app1-1"])
@@ -0,0 +1,185 @@
+from unittest import TestCase
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from functions.docker_engine.docker_engine import DockerFunctions
+from functions.docker_engine.async_docker_engine import *
+from threading import Thread
+from queue import Queue
+import asyncio, contextlib, io, json, os, tempfile, time
+
+TEST_IMAGE = "registry.example.com/team/app"
+
+
+# stands in for the docker-py client & fails the calls which are expected to go over the asyncio backend
+class AsyncOnlyReadsClient:
+
+    ASYNC_CALLS = ("containers", "inspect_container", "stats", "events")
+
+    def __init__(self, docker_client):
+        self.docker_client = docker_client
+
+    def __getattr__(self, attribute_name):
+        if attribute_name in self.ASYNC_CALLS:
+            raise AssertionError(attribute_name + " was called on the docker-py client")
+        return getattr(self.docker_client, attribute_name)
+
+
+# records the containers DockerFunctions writes through to the containers inventory
+class RecordingInventory:
+
+    def __init__(self):
+        self.created_containers = []
+
+    def container_created(self, container_name):
+        self.created_containers.append(container_name)
+
+
+class AsyncDockerFunctionsTests(TestCase):
+
+    def setUp(self):
+        self.docker_engine = FakeDockerEngine().start()
+        self.addCleanup(self.docker_engine.stop)
+        self.async_socket = AsyncDockerFunctions(socket_path=self.docker_engine.socket_path).start()
+        self.addCleanup(self.async_socket.stop)
+        self.docker_socket = DockerFunctions(base_url=self.docker_engine.base_url, async_backend=self.async_socket)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.docker_socket.create_docker_network("nebula", "bridge")
+        self.docker_socket.cli = AsyncOnlyReadsClient(self.docker_socket.cli)
+
+    def run_app_containers(self, containers=2):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.docker_socket.run_containers([{"app_name": "app", "container_name": "app-" + str(container_number),
+                                                "image_name": TEST_IMAGE, "bind_port": {}, "ports": [],
+                                                "env_vars": {}, "networks": ["nebula"]}
+                                               for container_number in range(1, containers + 1)])
+
+    def test_api_version_is_negotiated(self):
+        self.assertEqual(self.async_socket.api_version, "1.41")
+
+    def test_run_and_remove_a_batch_of_containers(self):
+        containers_to_run = [{"app_name": "app", "container_name": "app-" + str(container_number),
+                              "image_name": TEST_IMAGE, "bind_port": {}, "ports": [], "env_vars": {},
+                              "networks": ["nebula"]}
+                             for container_number in range(1, 21)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.docker_socket.run_containers(containers_to_run)
+            self.assertEqual(len(self.docker_engine.running_containers()), 20)
+            self.docker_socket.stop_and_remove_containers(["app-" + str(container_number)
+                                                           for container_number in range(1, 21)])
+        self.assertEqual(len(self.docker_engine.containers), 0)
+        # the request\response calls share the pooled keep-alive connections rather then opening one per call
+        self.assertLessEqual(len(self.async_socket.idle_connections), self.async_socket.max_connections)
+
+    def test_containers_are_listed_on_the_async_backend(self):
+        self.run_app_containers()
+        self.assertEqual(sorted(container["Names"][0] for container in self.docker_socket.list_containers("app")),
+                         ["/app-1", "/app-2"])
+        self.assertEqual(len(self.docker_socket.list_containers(container_type="all")), 2)
+        self.assertEqual(self.docker_socket.list_container_image_ids(),
+                         set(container["Image"] for container in self.docker_engine.running_containers()))
+        self.assertEqual(self.docker_engine.reset_call_counts()["list_containers"], 3)
+
+    def test_containers_are_inspected_on_the_async_backend(self):
+        self.run_app_containers(containers=1)
+        inspection = self.async_socket.run(self.async_socket.inspect_container("app-1"))
+        self.assertEqual(inspection["Name"], "/app-1")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(self.docker_socket.check_container_healthy("app-1"))
+            self.assertTrue(self.docker_socket.wait_for_container_ready("app-1", timeout=1))
+        self.assertEqual(self.docker_engine.reset_call_counts()["inspect_container"], 3)
+
+    def test_stats_are_read_on_the_async_backend(self):
+        self.run_app_containers()
+        container_ids = sorted(container["Id"] for container in self.docker_engine.running_containers())
+        self.assertEqual(sorted(sample["id"] for sample in self.docker_socket.list_containers_stats("app")),
+                         container_ids)
+        streamed_samples = list(self.docker_socket.stream_container_stats(container_ids[0]))
+        self.assertGreaterEqual(len(streamed_samples), 1)
+        self.assertEqual(streamed_samples[0]["id"], container_ids[0])
+
+    def test_events_are_streamed_on_the_async_backend(self):
+        events_queue = Queue()
+        since = int(time.time())
+
+        def watch_events():
+            for event in self.docker_socket.container_events(filters={"type": "container",
+                                                                      "label": ["orchestrator=nebula"]}, since=since):
+                events_queue.put(event)
+        Thread(target=watch_events, daemon=True).start()
+        self.run_app_containers(containers=1)
+        event = events_queue.get(timeout=10)
+        self.assertEqual(event["Action"], "create")
+        self.assertEqual(event["Actor"]["Attributes"]["name"], "app-1")
+        self.assertEqual(events_queue.get(timeout=10)["Action"], "start")
+
+    def test_container_which_failed_to_start_isnt_reported_as_run(self):
+        self.docker_socket.container_inventory = RecordingInventory()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            self.docker_socket.create_docker_network("extra", "bridge")
+            containers_started = self.docker_socket.run_containers([
+                {"app_name": "app", "container_name": container_name, "image_name": TEST_IMAGE,
+                 "bind_port": {80: 10080}, "ports": [80], "env_vars": {}, "networks": ["nebula", "extra"]}
+                for container_name in ("app-1", "app-2")])
+        # both bind the same host port so only one of them starts & only it is connected to the extra network
+        self.assertEqual(sorted(containers_started), [False, True])
+        self.assertEqual(len(self.docker_engine.running_containers()), 1)
+        self.assertEqual(self.docker_engine.reset_call_counts()["connect_network"], 1)
+        self.assertEqual(self.docker_socket.container_inventory.created_containers,
+                         [self.docker_engine.running_containers()[0]["Name"].lstrip("/")])
+
+    def test_errors_are_raised_with_the_engine_message(self):
+        with self.assertRaises(DockerAPIError) as raised:
+            self.async_socket.run(self.async_socket.request("GET", "/containers/missing/json"))
+        self.assertEqual(raised.exception.status_code, 404)
+
+    def test_pull_is_streamed_on_the_async_backend(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            first_pull = self.docker_socket.pull_image(TEST_IMAGE)
+            second_pull = self.docker_socket.pull_image(TEST_IMAGE)
+        self.assertIsNone(first_pull["error"])
+        self.assertEqual(first_pull["fresh_layers"], 3)
+        self.assertEqual(second_pull["cached_layers"], 3)
+        self.assertEqual(self.docker_engine.reset_call_counts()["pull_image"], 2)
+        self.assertEqual(len(self.docker_socket.pop_pull_records()), 2)
+
+
+class AsyncDockerStreamTests(TestCase):
+
+    # a unix socket server which replies to any request with the given chunks as a chunked body
+    def setUp(self):
+        self.socket_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.socket_directory.cleanup)
+        self.async_socket = AsyncDockerFunctions(socket_path=os.path.join(self.socket_directory.name, "docker.sock"),
+                                                 api_version="1.41")
+        self.async_socket.loop = asyncio.new_event_loop()
+        Thread(target=self.async_socket.loop.run_forever, daemon=True).start()
+        self.addCleanup(self.async_socket.stop)
+        self.reply_chunks = []
+        self.server = self.async_socket.run(asyncio.start_unix_server(self.reply, path=self.async_socket.socket_path))
+        self.addCleanup(lambda: self.async_socket.run(self.close_server()))
+
+    async def close_server(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def reply(self, reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for chunk in self.reply_chunks:
+            writer.write(("%x\r\n" % len(chunk)).encode("latin-1") + chunk + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def collect_stream(self):
+        return [decoded_object async for decoded_object in self.async_socket.stream("GET", "/events")]
+
+    def test_objects_split_across_chunks_are_decoded(self):
+        reply_body = (json.dumps({"status": "start", "id": "café"}, ensure_ascii=False) + "\n" +
+                      json.dumps({"status": "die", "id": "été"}, ensure_ascii=False) + "\n").encode("utf-8")
+        # split in the middle of every multi byte character
+        split_points = [0] + [index + 1 for index in range(len(reply_body)) if reply_body[index] == 0xc3] + \
+            [len(reply_body)]
+        self.reply_chunks = [reply_body[split_start:split_end]
+                             for split_start, split_end in zip(split_points, split_points[1:])]
+        self.assertEqual(self.async_socket.run(self.collect_stream()),
+                         [{"status": "start", "id": "café"}, {"status": "die", "id": "été"}])
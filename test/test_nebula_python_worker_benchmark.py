@@ -0,0 +1,184 @@
+from unittest import TestCase
+from test.benchmarks.reconcile_benchmark import *
+
+
+class ReconcileBenchmarkTests(TestCase):
+
+    def test_tiny_reconcile_scenario(self):
+        benchmark = ReconcileBenchmark(apps=2, containers=2, cron_jobs=1).start()
+        try:
+            results = dict((result["scenario"], result) for result in benchmark.run())
+        finally:
+            benchmark.stop()
+        self.assertEqual(results["boot"]["running_containers"], 4)
+        self.assertEqual(results["boot"]["docker_calls_by_operation"]["create_container"], 4)
+        self.assertEqual(results["unchanged_check_in"]["docker_calls"], 0)
+        self.assertEqual(results["unchanged_check_in"]["manager_requests"], 10)
+        # restarting the worker adopts the running containers rather then replacing them
+        self.assertEqual(results["worker_restart"]["docker_calls_by_operation"], {"list_containers": 1})
+        self.assertEqual(results["worker_restart"]["running_containers"], 4)
+        # a change which doesn't touch the containers spec leaves the containers as they are
+        self.assertNotIn("create_container", results["metadata_only_check_in"]["docker_calls_by_operation"])
+        self.assertNotIn("stop_container", results["metadata_only_check_in"]["docker_calls_by_operation"])
+        self.assertEqual(results["metadata_only_check_in"]["running_containers"], 4)
+        # an app_id bump alone is the manager asking for a restart so the containers are replaced
+        self.assertEqual(results["explicit_restart_check_in"]["docker_calls_by_operation"]["create_container"], 4)
+        self.assertEqual(results["explicit_restart_check_in"]["running_containers"], 4)
+        self.assertEqual(results["restart_check_in"]["docker_calls_by_operation"]["stop_container"], 4)
+        self.assertEqual(results["restart_check_in"]["running_containers"], 4)
+        self.assertEqual(results["roll_check_in"]["running_containers"], 4)
+        self.assertEqual(results["cron_jobs_launch"]["running_containers"], 5)
+        self.assertEqual(results["stop_check_in"]["running_containers"], 1)
+
+    def test_worker_restart_replaces_only_changed_apps(self):
+        benchmark = ReconcileBenchmark(apps=2, containers=2, cron_jobs=0).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 4)
+            # one app changed & another was added while the worker was down
+            benchmark.apps[0]["env_vars"] = {"ENV": "changed"}
+            benchmark.apps.append(create_benchmark_app(2, 1))
+            benchmark.publish()
+            result = benchmark.measure("worker_restart", benchmark.restart_worker, 3)
+        finally:
+            benchmark.stop()
+        self.assertEqual(result["docker_calls_by_operation"]["stop_container"], 2)
+        self.assertEqual(result["docker_calls_by_operation"]["create_container"], 3)
+        self.assertEqual(result["running_containers"], 5)
+
+    def test_restart_after_new_image_push_replaces_containers(self):
+        benchmark = ReconcileBenchmark(apps=1, containers=2, cron_jobs=0).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 2)
+            # same tag & spec but the registry holds a new image for it, the metadata only change would otherwise leave
+            # the containers as they are
+            benchmark.docker_engine.push_image(benchmark.apps[0]["docker_image"])
+            result = benchmark.measure("restart_check_in", lambda: (benchmark.change_apps(rolling_restart=True),
+                                                                    benchmark.check_in()), 2)
+        finally:
+            benchmark.stop()
+        self.assertEqual(result["docker_calls_by_operation"]["stop_container"], 2)
+        self.assertEqual(result["docker_calls_by_operation"]["create_container"], 2)
+
+    def test_restart_after_new_image_push_skips_the_registry_digest_cache(self):
+        benchmark = ReconcileBenchmark(apps=1, containers=2, cron_jobs=0).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 2)
+            # the registry digest is cached by the pull of the first restart
+            benchmark.measure("restart_check_in", lambda: (benchmark.change_apps(env_vars={"ENV": "restart"}),
+                                                           benchmark.check_in()), 2)
+            benchmark.docker_engine.push_image(benchmark.apps[0]["docker_image"])
+            result = benchmark.measure("restart_check_in", lambda: (benchmark.change_apps(), benchmark.check_in()), 2)
+            image_id = benchmark.docker_engine.images[benchmark.apps[0]["docker_image"]]["id"]
+            running_containers = benchmark.docker_engine.running_containers()
+        finally:
+            benchmark.stop()
+        self.assertEqual(result["docker_calls_by_operation"]["pull_image"], 1)
+        self.assertEqual([container["Image"] for container in running_containers], [image_id, image_id])
+
+    def test_skipping_unchanged_restarts_can_be_disabled(self):
+        benchmark = ReconcileBenchmark(apps=1, containers=2, cron_jobs=0).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 2)
+            worker.restart_skip_unchanged = False
+            result = benchmark.measure("metadata_only_check_in", lambda: (benchmark.change_apps(rolling_restart=True),
+                                                                          benchmark.check_in()), 2)
+        finally:
+            worker.restart_skip_unchanged = True
+            benchmark.stop()
+        self.assertEqual(result["docker_calls_by_operation"]["create_container"], 2)
+
+    def test_roll_starts_the_slots_the_app_grew_by(self):
+        benchmark = ReconcileBenchmark(apps=1, containers=3, cron_jobs=0, rolling_restart_batch_size=2).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 3)
+            result = benchmark.measure("roll_check_in", lambda: (
+                benchmark.change_apps(rolling_restart=True, containers_per={"server": 4}, env_vars={"ENV": "roll"}),
+                benchmark.check_in()), 4)
+            running_containers = benchmark.docker_engine.running_containers()
+        finally:
+            benchmark.stop()
+        self.assertEqual(result["docker_calls_by_operation"]["stop_container"], 3)
+        self.assertEqual(result["docker_calls_by_operation"]["create_container"], 4)
+        self.assertEqual(sorted(container["Name"] for container in running_containers),
+                         ["/app0-1", "/app0-2", "/app0-3", "/app0-4"])
+
+    def test_containers_per_change_scales_in_place(self):
+        benchmark = ReconcileBenchmark(apps=1, containers=2, cron_jobs=0).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 2)
+            scale_up = benchmark.measure("scale_up", lambda: (benchmark.change_apps(containers_per={"server": 4}),
+                                                              benchmark.check_in()), 2)
+            scale_down = benchmark.measure("scale_down", lambda: (benchmark.change_apps(containers_per={"server": 1}),
+                                                                  benchmark.check_in()), 3)
+            running_containers = benchmark.docker_engine.running_containers()
+        finally:
+            benchmark.stop()
+        self.assertEqual(scale_up["docker_calls_by_operation"]["create_container"], 2)
+        self.assertNotIn("stop_container", scale_up["docker_calls_by_operation"])
+        self.assertEqual(scale_up["running_containers"], 4)
+        self.assertEqual(scale_down["docker_calls_by_operation"]["stop_container"], 3)
+        self.assertNotIn("create_container", scale_down["docker_calls_by_operation"])
+        self.assertEqual([container["Name"] for container in running_containers], ["/app0-1"])
+
+    def test_create_before_stop_restart_swaps_the_containers(self):
+        benchmark = ReconcileBenchmark(apps=2, containers=2, cron_jobs=0, create_before_stop=True).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 4)
+            result = benchmark.measure("restart_check_in", lambda: (benchmark.change_apps(env_vars={"ENV": "swap"}),
+                                                                    benchmark.check_in()), 4)
+            running_containers = benchmark.docker_engine.running_containers()
+            all_containers = list(benchmark.docker_engine.containers.values())
+        finally:
+            benchmark.stop()
+        # each new container is created under a temporary name & renamed to it's final name once the old one stopped
+        self.assertEqual(result["docker_calls_by_operation"]["create_container"], 4)
+        self.assertEqual(result["docker_calls_by_operation"]["rename_container"], 8)
+        self.assertEqual(result["docker_calls_by_operation"]["remove_container"], 4)
+        self.assertEqual(sorted(container["Name"] for container in running_containers),
+                         ["/app0-1", "/app0-2", "/app1-1", "/app1-2"])
+        self.assertEqual(len(all_containers), 4)
+        self.assertTrue(all(container["Config"]["Env"] == ["ENV=swap"] for container in running_containers))
+
+    def test_create_before_stop_rolls_back_a_container_which_failed_to_start(self):
+        benchmark = ReconcileBenchmark(apps=1, containers=1, cron_jobs=0, create_before_stop=True).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 1)
+            # another container holds the host port the new config of the app binds
+            with benchmark.output():
+                worker.docker_socket.run_container("squatter", "squatter", "registry.example.com/team/squatter",
+                                                   {80: 10050}, [80], [], networks=["nebula"])
+            result = benchmark.measure("restart_check_in", lambda: (
+                benchmark.change_apps(starting_ports=[{"10050": "80"}], env_vars={"ENV": "swap"}),
+                benchmark.check_in()), 1)
+            app_container = benchmark.docker_engine.find_container("app0-1")
+            all_containers = list(benchmark.docker_engine.containers.values())
+        finally:
+            benchmark.stop()
+        # the new container is removed & the old container is back under it's name & running again
+        self.assertEqual(result["docker_calls_by_operation"]["start_container"], 2)
+        self.assertTrue(app_container["State"]["Running"])
+        self.assertEqual(app_container["Config"]["Env"], ["ENV=benchmark"])
+        self.assertEqual(sorted(container["Name"] for container in all_containers), ["/app0-1", "/squatter"])
+
+    def test_roll_halts_when_the_new_containers_never_become_ready(self):
+        benchmark = ReconcileBenchmark(apps=1, containers=3, cron_jobs=0).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 3)
+            old_containers = dict((container["Name"], container["Id"])
+                                  for container in benchmark.docker_engine.running_containers())
+            # the new image never passes it's healthcheck
+            benchmark.docker_engine.image_health["registry.example.com/team/app0:2.0"] = "unhealthy"
+            worker.rolling_restart_ready_timeout = 0.5
+            result = benchmark.measure("roll_check_in", lambda: (
+                benchmark.change_apps(rolling_restart=True, docker_image="registry.example.com/team/app0:2.0"),
+                benchmark.check_in()), 3)
+            running_containers = dict((container["Name"], container)
+                                      for container in benchmark.docker_engine.running_containers())
+        finally:
+            benchmark.stop()
+        # only the first batch was rolled, the old containers of the other slots are untouched
+        self.assertEqual(result["docker_calls_by_operation"]["stop_container"], 1)
+        self.assertEqual(result["docker_calls_by_operation"]["create_container"], 1)
+        self.assertEqual(running_containers["/app0-1"]["Config"]["Image"], "registry.example.com/team/app0:2.0")
+        self.assertEqual(running_containers["/app0-2"]["Id"], old_containers["/app0-2"])
+        self.assertEqual(running_containers["/app0-3"]["Id"], old_containers["/app0-3"])
@@ -0,0 +1,86 @@
+from unittest import TestCase
+from functions.misc.check_in_scheduler import *
+from test.benchmarks.check_in_simulation import CheckInSimulation
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CheckInSchedulerTests(TestCase):
+
+    def create_scheduler(self, **scheduler_options):
+        self.clock = FakeClock()
+        return CheckInScheduler(clock=self.clock, random_generator=random.Random(1), **scheduler_options)
+
+    def test_first_check_in_is_spread_over_the_interval(self):
+        scheduler = self.create_scheduler(check_in_interval=30)
+        self.assertTrue(0 <= scheduler.next_delay() <= 30)
+        scheduler = self.create_scheduler(check_in_interval=30, initial_splay=False, jitter=0)
+        self.assertEqual(scheduler.next_delay(), 30)
+
+    def test_jitter(self):
+        scheduler = self.create_scheduler(check_in_interval=30, initial_splay=False, jitter=0.2)
+        delays = [scheduler.next_delay() for _ in range(100)]
+        self.assertTrue(all(24 <= delay <= 36 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_fast_check_ins_after_a_change(self):
+        scheduler = self.create_scheduler(check_in_interval=30, initial_splay=False, jitter=0, fast_interval=5,
+                                          fast_duration=60)
+        scheduler.check_in_succeeded(changed=True)
+        self.assertEqual(scheduler.next_delay(), 5)
+        self.clock.now = 61
+        self.assertEqual(scheduler.next_delay(), 30)
+
+    def test_idle_backoff_is_capped(self):
+        scheduler = self.create_scheduler(check_in_interval=30, initial_splay=False, jitter=0, idle_after=2,
+                                          idle_backoff=2, max_interval=100)
+        delays = []
+        for _ in range(5):
+            scheduler.check_in_succeeded(changed=False)
+            delays.append(scheduler.next_delay())
+        self.assertEqual(delays, [30, 30, 60, 100, 100])
+        scheduler.check_in_succeeded(changed=True)
+        self.clock.now = 1000
+        self.assertEqual(scheduler.next_delay(), 30)
+
+    def test_idle_backoff_is_opt_in(self):
+        scheduler = self.create_scheduler(check_in_interval=30, initial_splay=False, jitter=0, idle_after=2)
+        delays = []
+        for _ in range(20):
+            scheduler.check_in_succeeded(changed=False)
+            delays.append(scheduler.next_delay())
+        self.assertEqual(set(delays), {30})
+
+    def test_slow_manager_backoff(self):
+        scheduler = self.create_scheduler(check_in_interval=30, initial_splay=False, jitter=0, slow_threshold=5)
+        scheduler.check_in_succeeded(duration=10)
+        self.assertEqual(scheduler.next_delay(), 60)
+        scheduler.check_in_succeeded(duration=1)
+        self.assertEqual(scheduler.next_delay(), 30)
+
+    def test_error_backoff(self):
+        scheduler = self.create_scheduler(check_in_interval=30, initial_splay=False, jitter=0, error_backoff_base=1,
+                                          error_backoff_max=8)
+        backoffs = []
+        for _ in range(6):
+            scheduler.check_in_failed()
+            backoffs.append(scheduler.next_delay())
+        for backoff, backoff_cap in zip(backoffs, [1, 2, 4, 8, 8, 8]):
+            self.assertTrue(backoff_cap / 2 <= backoff <= backoff_cap)
+        scheduler.check_in_succeeded()
+        self.assertEqual(scheduler.next_delay(), 30)
+
+    def test_simulation_spreads_a_fleet_which_booted_together(self):
+        simulation_options = {"workers": 300, "duration": 600, "change_every": 300}
+        fixed_results = CheckInSimulation(fixed=True, **simulation_options).run()
+        adaptive_results = CheckInSimulation(**simulation_options).run()
+        self.assertEqual(fixed_results["p99_requests_per_second"], 300)
+        self.assertLess(adaptive_results["p99_requests_per_second"], 100)
+        self.assertIsNotNone(adaptive_results["mean_change_detection_seconds"])
@@ -0,0 +1,80 @@
+from unittest import TestCase
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from test.benchmarks.reconcile_benchmark import ReconcileBenchmark
+from functions.docker_engine.docker_engine import DockerFunctions
+from functions.docker_engine.container_inventory import *
+import contextlib, io, time
+
+
+class ContainerInventoryTests(TestCase):
+
+    def setUp(self):
+        self.docker_engine = FakeDockerEngine().start()
+        self.docker_functions = DockerFunctions(base_url=self.docker_engine.base_url)
+        self.inventory = ContainerInventory(self.docker_functions, reconnect_wait=0.1)
+
+    def tearDown(self):
+        self.inventory.stop()
+        self.docker_engine.stop()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while condition() is False and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_inventory_follows_docker_events(self):
+        self.inventory.start()
+        # containers changed by something other then the worker only reach the inventory through the events stream
+        self.docker_functions.cli.create_container(image="nginx", name="app-1",
+                                                   labels={"orchestrator": "nebula", "container_type": "app",
+                                                           "app_name": "app"})
+        self.docker_functions.cli.start("app-1")
+        self.assertTrue(self.wait_for(lambda: len(self.inventory.list_containers("app", show_all_containers=False)) ==
+                                      1))
+        self.docker_functions.cli.stop("app-1")
+        self.assertTrue(self.wait_for(lambda: self.inventory.list_containers("app")[0]["State"] == "exited"))
+        self.docker_functions.cli.remove_container("app-1")
+        self.assertTrue(self.wait_for(lambda: self.inventory.list_containers("app") == []))
+
+    def test_worker_changes_are_written_through(self):
+        self.inventory.start()
+        self.docker_functions.container_inventory = self.inventory
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.docker_functions.run_container("app", "app-1", "nginx", {}, [], [], networks=["nebula"])
+            self.assertEqual([container["State"] for container in self.docker_functions.list_containers("app")],
+                             ["running"])
+            self.docker_functions.stop_and_remove_container("app-1")
+            self.assertEqual(self.docker_functions.list_containers("app"), [])
+
+    def test_apply_health_event(self):
+        self.inventory.start()
+        self.docker_functions.cli.create_container(image="nginx", name="app-1",
+                                                   labels={"orchestrator": "nebula", "container_type": "app",
+                                                           "app_name": "app"})
+        self.docker_functions.cli.start("app-1")
+        container_id = self.wait_for(lambda: len(self.inventory.list_containers("app")) == 1) and \
+            self.inventory.list_containers("app")[0]["Id"]
+        self.inventory.apply_event({"Action": "health_status: unhealthy", "Actor": {"ID": container_id}})
+        self.assertEqual([container["Health"] for container in self.inventory.list_containers("app")], ["unhealthy"])
+
+    def test_health_backstop_asks_docker_rather_then_the_inventory(self):
+        self.inventory.start()
+        self.docker_functions.container_inventory = self.inventory
+        self.docker_engine.reset_call_counts()
+        self.docker_functions.list_unhealthy_containers()
+        self.assertEqual(self.docker_engine.reset_call_counts()["list_containers"], 1)
+
+    def test_reconcile_lists_containers_from_the_inventory(self):
+        benchmark = ReconcileBenchmark(apps=4, containers=2, cron_jobs=0, container_inventory=True).start()
+        try:
+            benchmark.measure("boot", benchmark.boot, 8)
+            benchmark.measure("settle", benchmark.docker_engine.running_containers, 0)
+            result = benchmark.measure("stop_check_in", lambda: (benchmark.change_apps(running=False),
+                                                                 benchmark.check_in()), 8)
+        finally:
+            benchmark.stop()
+        self.assertEqual(result["running_containers"], 0)
+        self.assertEqual(result["docker_calls_by_operation"]["stop_container"], 8)
+        # at most a single refresh of the containers created on boot rather then a list call per app
+        self.assertLessEqual(result["docker_calls_by_operation"].get("list_containers", 0), 1)
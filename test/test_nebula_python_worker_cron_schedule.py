@@ -1,6 +1,7 @@
 from unittest import TestCase
-from functions.misc.cron_schedule import CronJobs
-from datetime import datetime
+from functions.misc.cron_schedule import CronJobs, CronScheduler
+from datetime import datetime, timedelta
+from threading import Event
 
 
 class CronTests(TestCase):
@@ -28,3 +29,40 @@ class CronTests(TestCase):
         # test removing a class
         test_cron_object.remove_cron_job("test_cron")
         self.assertEqual(test_cron_object.cron_jobs, {})
+
+    def test_cron_next_runtime_skips_missed_runs(self):
+        test_cron_object = CronJobs()
+        test_cron_object.add_cron_job("test_cron", "* * * * *")
+
+        # a next runtime far in the past is fast forwarded to the first runtime after now
+        test_cron_object.cron_next_runs["test_cron"] = datetime.now() - timedelta(days=2)
+        test_cron_object.cron_iterators["test_cron"].set_current(datetime.now() - timedelta(days=2))
+        test_next_run_reply = test_cron_object.return_cron_job_next_runtime("test_cron")
+        self.assertGreater(test_next_run_reply, datetime.now())
+        self.assertLessEqual(test_next_run_reply, datetime.now() + timedelta(minutes=1))
+
+    def test_cron_scheduler(self):
+        test_cron_ran = Event()
+        test_cron_runs = []
+
+        def test_run_cron_job(cron_job_name):
+            test_cron_runs.append(cron_job_name)
+            test_cron_ran.set()
+
+        # a cron_job removed before it's due never runs while a per second cron_job runs within a second
+        test_scheduler = CronScheduler(test_run_cron_job)
+        test_scheduler.start()
+        test_scheduler.add_cron_job("removed_cron", "* * * * * *")
+        test_scheduler.remove_cron_job("removed_cron")
+        test_scheduler.add_cron_job("test_cron", "* * * * * *")
+        self.assertTrue(test_cron_ran.wait(timeout=2))
+        test_scheduler.remove_cron_job("test_cron")
+        self.assertEqual(set(test_cron_runs), {"test_cron"})
+        self.assertEqual(test_scheduler.cron_jobs, {})
+
+    def test_cron_jobs_due_within(self):
+        test_scheduler = CronScheduler(lambda cron_job_name: None)
+        test_scheduler.add_cron_job("every_minute", "* * * * *")
+        test_scheduler.add_cron_job("yearly", "0 0 1 1 *")
+        self.assertIn("every_minute", test_scheduler.cron_jobs_due_within(60))
+        self.assertEqual(test_scheduler.cron_jobs_due_within(400 * 24 * 3600), ["every_minute", "yearly"])
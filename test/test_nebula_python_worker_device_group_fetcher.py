@@ -0,0 +1,70 @@
+from unittest import TestCase
+from functions.misc.device_group_fetcher import *
+from test.fakes.fake_nebula_manager import FakeNebulaManager
+from test.benchmarks.reconcile_benchmark import create_benchmark_app, create_benchmark_cron_job
+from NebulaPythonSDK import Nebula
+import json
+
+TEST_DEVICE_GROUP = "test"
+
+
+def create_device_group_info(apps=100, device_group_id=1):
+    return {
+        "apps": [create_benchmark_app(app_number, 2) for app_number in range(apps)],
+        "apps_list": ["app" + str(app_number) for app_number in range(apps)],
+        "cron_jobs": [create_benchmark_cron_job(0)], "cron_jobs_list": ["cron0"],
+        "device_group_id": device_group_id, "prune_id": 1
+    }
+
+
+class DeviceGroupFetcherTests(TestCase):
+
+    def create_fetcher(self, **manager_options):
+        nebula_manager = FakeNebulaManager(**manager_options).start()
+        self.addCleanup(nebula_manager.stop)
+        nebula_manager.set_device_group_info(TEST_DEVICE_GROUP, create_device_group_info())
+        fetcher = DeviceGroupFetcher(Nebula(host_uri=nebula_manager.host_uri, username="test", password="test"))
+        self.addCleanup(fetcher.close)
+        return nebula_manager, fetcher
+
+    def test_unchanged_device_group_costs_a_304(self):
+        nebula_manager, fetcher = self.create_fetcher()
+        first_reply = fetcher.list_device_group_info(TEST_DEVICE_GROUP)
+        self.assertEqual(first_reply["status_code"], 200)
+        self.assertNotIn("not_modified", first_reply)
+        first_reply_bytes = nebula_manager.bytes_sent
+        for _ in range(10):
+            reply = fetcher.list_device_group_info(TEST_DEVICE_GROUP)
+            self.assertEqual(reply["status_code"], 200)
+            self.assertTrue(reply["not_modified"])
+            self.assertIs(reply["reply"], first_reply["reply"])
+        self.assertEqual(nebula_manager.reply_counts[304], 10)
+        self.assertEqual(nebula_manager.bytes_sent, first_reply_bytes)
+        # a change is fetched in full
+        nebula_manager.set_device_group_info(TEST_DEVICE_GROUP, create_device_group_info(device_group_id=2))
+        reply = fetcher.list_device_group_info(TEST_DEVICE_GROUP)
+        self.assertNotIn("not_modified", reply)
+        self.assertEqual(reply["reply"]["device_group_id"], 2)
+
+    def test_replies_are_gzipped_over_a_single_connection(self):
+        nebula_manager, fetcher = self.create_fetcher(etags=False)
+        reply = fetcher.list_device_group_info(TEST_DEVICE_GROUP)
+        self.assertEqual(reply["reply"], create_device_group_info())
+        self.assertLess(nebula_manager.bytes_sent * 5, len(json.dumps(reply["reply"])))
+        for _ in range(5):
+            fetcher.list_device_group_info(TEST_DEVICE_GROUP)
+        self.assertEqual(len(nebula_manager.client_addresses), 1)
+
+    def test_unchanged_bytes_are_not_parsed_without_etags(self):
+        nebula_manager, fetcher = self.create_fetcher(etags=False, gzip_replies=False)
+        first_reply = fetcher.list_device_group_info(TEST_DEVICE_GROUP)
+        reply = fetcher.list_device_group_info(TEST_DEVICE_GROUP)
+        self.assertEqual(nebula_manager.reply_counts[200], 2)
+        self.assertTrue(reply["not_modified"])
+        self.assertIs(reply["reply"], first_reply["reply"])
+
+    def test_other_replies_and_calls_pass_through(self):
+        nebula_manager, fetcher = self.create_fetcher()
+        self.assertEqual(fetcher.list_device_group_info("missing"),
+                         {"status_code": 403, "reply": {"device_group_exists": False}})
+        self.assertEqual(fetcher.check_api()["reply"], {"api_available": True})
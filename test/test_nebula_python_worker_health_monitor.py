@@ -0,0 +1,65 @@
+from unittest import TestCase
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from functions.docker_engine.docker_engine import DockerFunctions
+from functions.docker_engine.health_monitor import *
+import contextlib, io, time
+
+NEBULA_LABELS = {"orchestrator": "nebula", "container_type": "app", "app_name": "app"}
+
+
+class HealthMonitorTests(TestCase):
+
+    def setUp(self):
+        self.docker_engine = FakeDockerEngine().start()
+        self.addCleanup(self.docker_engine.stop)
+        self.docker_functions = DockerFunctions(base_url=self.docker_engine.base_url)
+        self.health_monitor = HealthMonitor(self.docker_functions, reconcile_interval=3600, reconnect_wait=0.1)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while condition() is False and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def run_test_container(self, container_name, labels=NEBULA_LABELS):
+        self.docker_functions.cli.create_container(image="nginx", name=container_name, labels=labels)
+        self.docker_functions.cli.start(container_name)
+        self.docker_engine.set_container_health(container_name, "healthy")
+
+    def restarts(self):
+        return self.docker_engine.call_counts["restart_container"]
+
+    # starts the monitor & waits for it's events stream to be open so no event sent after it is missed
+    def start_health_monitor(self):
+        self.health_monitor.start()
+        self.assertTrue(self.wait_for(lambda: len(self.docker_engine.event_subscribers) > 0))
+
+    def test_unhealthy_event_restarts_the_container_once(self):
+        self.run_test_container("app-1")
+        self.start_health_monitor()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.docker_engine.set_container_health("app-1", "unhealthy")
+            self.assertTrue(self.wait_for(lambda: self.restarts() == 1))
+            time.sleep(0.2)
+        self.assertEqual(self.restarts(), 1)
+        self.assertEqual(self.docker_engine.find_container("app-1")["State"]["Health"]["Status"], "starting")
+
+    def test_healthy_and_non_nebula_containers_are_ignored(self):
+        self.run_test_container("app-1")
+        self.run_test_container("other-1", labels={"container_type": "app"})
+        self.start_health_monitor()
+        self.docker_engine.set_container_health("app-1", "healthy")
+        self.docker_engine.set_container_health("other-1", "unhealthy")
+        self.health_monitor.reconcile_unhealthy_containers()
+        time.sleep(0.2)
+        self.assertEqual(self.restarts(), 0)
+
+    def test_backstop_restarts_a_container_whose_event_was_missed(self):
+        self.run_test_container("app-1")
+        self.run_test_container("app-2")
+        self.docker_engine.set_container_health("app-2", "unhealthy", emit_event=False)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.health_monitor.reconcile_unhealthy_containers()
+        self.assertEqual(self.restarts(), 1)
+        self.assertEqual(self.docker_engine.find_container("app-1")["State"]["Health"]["Status"], "healthy")
+        self.assertEqual(self.docker_engine.find_container("app-2")["State"]["Health"]["Status"], "starting")
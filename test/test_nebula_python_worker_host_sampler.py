@@ -0,0 +1,51 @@
+from unittest import TestCase
+from functions.misc.host_sampler import *
+from functions.reporting.reporting import ReportingDocument
+from test.benchmarks.report_size_benchmark import BenchmarkDockerConnection
+import os, tempfile
+
+
+class HostSamplerTests(TestCase):
+
+    def write_proc_file(self, contents):
+        proc_file, proc_file_path = tempfile.mkstemp()
+        with os.fdopen(proc_file, "w") as proc_file_object:
+            proc_file_object.write(contents)
+        self.addCleanup(os.remove, proc_file_path)
+        return proc_file_path
+
+    def test_read_cpu_times(self):
+        proc_stat_path = self.write_proc_file("cpu  100 10 50 800 40 0 0 0 5 0\ncpu0 100 10 50 800 40 0 0 0 5 0\n")
+        self.assertEqual(read_cpu_times(proc_stat_path), (160, 1000))
+
+    def test_read_memory(self):
+        proc_meminfo_path = self.write_proc_file("MemTotal:        8192000 kB\nMemFree:         1024000 kB\n"
+                                                 "MemAvailable:    4096000 kB\nBuffers:          102400 kB\n"
+                                                 "Cached:          2048000 kB\nSReclaimable:     102400 kB\n")
+        self.assertEqual(read_memory(proc_meminfo_path), (8000, 4800, 1000, 4000))
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_windows(self):
+        host_sampler = HostSampler(buffer_size=3)
+        for cpu_percent in (10.0, 20.0, 30.0, 40.0):
+            host_sampler.samples.append(HostSample(time.monotonic(), cpu_percent, 8000, 4000, 1000, 3000, 100000,
+                                                   50000, 50000, 0.5))
+        # the ring buffer only keeps the last buffer_size samples
+        self.assertEqual(host_sampler.window()["cpu_percent"], {"min": 20.0, "avg": 30.0, "max": 40.0, "p95": 40.0})
+        self.assertEqual(host_sampler.pop_window()["samples"], 3)
+        self.assertIsNone(host_sampler.pop_window())
+        self.assertEqual(host_sampler.latest().cpu_percent, 40.0)
+
+    def test_report_reads_the_sampler(self):
+        host_sampler = HostSampler()
+        host_sampler.sample()
+        host_sampler.sample()
+        reporting_object = ReportingDocument(BenchmarkDockerConnection(1), "test", host_sampler_object=host_sampler)
+        report = reporting_object.current_status_report({}, False)
+        self.assertEqual(report["host_stats_window"]["samples"], 2)
+        self.assertEqual(report["cpu_usage"]["used_percent"], report["host_stats_window"]["cpu_percent"]["avg"])
+        self.assertEqual(report["memory_usage"]["total"], host_sampler.latest().memory_total_mb)
+        self.assertEqual(sorted(report["root_disk_usage"]), ["free", "total", "used"])
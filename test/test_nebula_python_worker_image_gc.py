@@ -0,0 +1,73 @@
+from unittest import TestCase
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from functions.docker_engine.docker_engine import DockerFunctions
+from functions.docker_engine.image_gc import *
+import contextlib, io
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+class ImageGarbageCollectorTests(TestCase):
+
+    def setUp(self):
+        self.docker_engine = FakeDockerEngine(image_size_mb=100).start()
+        self.addCleanup(self.docker_engine.stop)
+        self.docker_functions = DockerFunctions(base_url=self.docker_engine.base_url)
+        self.clock = FakeClock()
+        # 500mb of the 1000mb disk is taken by other things then images
+        self.other_disk_usage = 500
+        with contextlib.redirect_stdout(io.StringIO()):
+            for image_name in ("used", "old", "older", "newer"):
+                self.docker_functions.pull_image("registry.example.com/" + image_name, version_tag="1.0")
+        self.docker_functions.cli.create_container(image="registry.example.com/used:1.0", name="used-1")
+
+    def disk_usage(self):
+        used = self.other_disk_usage + self.docker_engine.images_size_mb()
+        return {"total": 1000, "used": used, "free": 1000 - used}
+
+    def create_image_gc(self, protected_images=()):
+        image_gc = ImageGarbageCollector(self.docker_functions, high_water_mark=85, low_water_mark=70,
+                                         protected_images_function=lambda: protected_images,
+                                         disk_usage_function=self.disk_usage, clock=self.clock)
+        self.clock.now += 1000
+        image_gc.image_used("registry.example.com/old:1.0")
+        self.clock.now += 1000
+        image_gc.image_used("registry.example.com/newer:1.0")
+        self.clock.now += 1000
+        return image_gc
+
+    def local_images(self):
+        return sorted(image_tag for image in self.docker_functions.list_images() for image_tag in image_tags(image))
+
+    def collect(self, image_gc):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return image_gc.collect()
+
+    def test_least_recently_used_images_are_removed_down_to_the_low_water_mark(self):
+        image_gc = self.create_image_gc()
+        # 900mb used, the never used image goes first (it counts as last used when it was created) then the
+        # least recently used one
+        self.assertEqual(len(self.collect(image_gc)), 2)
+        self.assertEqual(self.local_images(), ["registry.example.com/newer:1.0", "registry.example.com/used:1.0"])
+        self.assertEqual(self.disk_usage()["used"], 700)
+
+    def test_nothing_is_removed_under_the_high_water_mark(self):
+        self.other_disk_usage = 400
+        self.assertEqual(self.collect(self.create_image_gc()), [])
+        self.assertEqual(len(self.local_images()), 4)
+
+    def test_protected_and_recently_used_images_are_kept(self):
+        self.other_disk_usage = 550
+        image_gc = self.create_image_gc(protected_images=["registry.example.com/older:1.0"])
+        image_gc.image_used("registry.example.com/newer:1.0")
+        # only the old image can be removed so the disk stays over the low water mark
+        self.assertEqual(len(self.collect(image_gc)), 1)
+        self.assertEqual(self.local_images(), ["registry.example.com/newer:1.0", "registry.example.com/older:1.0",
+                                               "registry.example.com/used:1.0"])
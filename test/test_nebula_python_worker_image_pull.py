@@ -0,0 +1,36 @@
+from unittest import TestCase
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from functions.docker_engine.docker_engine import DockerFunctions
+from functions.docker_engine.image_pull import *
+import contextlib, io
+
+TEST_IMAGE = "registry.example.com/team/app"
+
+
+class ImagePullManagerTests(TestCase):
+
+    def setUp(self):
+        self.docker_engine = FakeDockerEngine().start()
+        self.addCleanup(self.docker_engine.stop)
+        self.image_puller = ImagePullManager(DockerFunctions(base_url=self.docker_engine.base_url))
+
+    def pull_image(self, use_digest_cache=True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.image_puller.pull_image(TEST_IMAGE, version_tag="latest", use_digest_cache=use_digest_cache)
+
+    def test_up_to_date_images_are_not_pulled(self):
+        self.assertTrue(self.pull_image())
+        self.assertFalse(self.pull_image())
+        self.assertEqual(self.docker_engine.reset_call_counts()["pull_image"], 1)
+
+    def test_new_push_under_the_same_tag_is_pulled_when_skipping_the_digest_cache(self):
+        self.pull_image()
+        self.pull_image()
+        image_id = self.docker_engine.images[TEST_IMAGE + ":latest"]["id"]
+        self.docker_engine.push_image(TEST_IMAGE)
+        # the cached registry digest still hides the new push from repeated pulls
+        self.assertFalse(self.pull_image())
+        self.assertTrue(self.pull_image(use_digest_cache=False))
+        self.assertNotEqual(self.docker_engine.images[TEST_IMAGE + ":latest"]["id"], image_id)
+        # & the registry digest the pull checked is cached for the following pulls
+        self.assertFalse(self.pull_image())
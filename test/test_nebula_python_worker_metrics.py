@@ -0,0 +1,66 @@
+from unittest import TestCase
+from functions.misc.metrics import *
+from urllib.request import urlopen
+
+
+class FakeClient:
+
+    def containers(self, all=False):
+        return ["test"]
+
+    def create_host_config(self, **kwargs):
+        return kwargs
+
+    def stats(self, container, stream=True):
+        if stream is True:
+            return iter([{"id": container}])
+        return {"id": container}
+
+
+class MetricsTests(TestCase):
+
+    def test_metrics_exposition(self):
+        test_registry = MetricsRegistry()
+        test_counter = test_registry.counter("test_total", "a test counter", label_names=("result",))
+        test_counter.inc(result="fresh")
+        test_counter.inc(2, result="fresh")
+        self.assertIs(test_registry.counter("test_total", "a test counter", label_names=("result",)), test_counter)
+        test_registry.gauge("test_gauge", "a test gauge").set_function(lambda: 7)
+        test_histogram = test_registry.histogram("test_seconds", "a test histogram", buckets=(0.1, 1))
+        test_histogram.observe(0.05)
+        test_histogram.observe(0.5)
+        test_histogram.observe(5)
+        exposition = test_registry.exposition()
+        self.assertIn('test_total{result="fresh"} 3', exposition)
+        self.assertIn("# TYPE test_gauge gauge\ntest_gauge 7", exposition)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', exposition)
+        self.assertIn('test_seconds_bucket{le="1"} 2', exposition)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', exposition)
+        self.assertIn("test_seconds_sum 5.55", exposition)
+        self.assertIn("test_seconds_count 3", exposition)
+
+    def test_instrumented_proxy_times_calls(self):
+        test_histogram = Histogram("test_api_seconds", "a test histogram", label_names=("operation",))
+        test_client = InstrumentedProxy(FakeClient(), test_histogram, ("containers", "stats"))
+        self.assertEqual(test_client.containers(all=True), ["test"])
+        self.assertEqual(test_histogram.values[("containers",)][2], 1)
+        self.assertEqual(test_client.stats("a", stream=False), {"id": "a"})
+        self.assertEqual(test_histogram.values[("stats",)][2], 1)
+
+    def test_instrumented_proxy_leaves_out_helpers_and_streams(self):
+        test_histogram = Histogram("test_api_seconds", "a test histogram", label_names=("operation",))
+        test_client = InstrumentedProxy(FakeClient(), test_histogram, ("containers", "stats"))
+        self.assertEqual(test_client.create_host_config(privileged=True), {"privileged": True})
+        self.assertEqual(list(test_client.stats("a", stream=True)), [{"id": "a"}])
+        self.assertEqual(test_histogram.values, {})
+
+    def test_metrics_server(self):
+        metrics.counter("nebula_worker_test_scrapes_total", "a test counter").inc()
+        test_server = start_metrics_server(0, host="127.0.0.1")
+        try:
+            response = urlopen("http://127.0.0.1:" + str(test_server.server_address[1]) + "/metrics", timeout=5)
+            self.assertEqual(response.status, 200)
+            self.assertIn("nebula_worker_test_scrapes_total 1", response.read().decode("utf-8"))
+        finally:
+            test_server.shutdown()
+            test_server.server_close()
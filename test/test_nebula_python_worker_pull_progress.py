@@ -0,0 +1,79 @@
+from unittest import TestCase
+from functions.docker_engine.pull_progress import *
+import contextlib, io
+
+TEST_IMAGE = "registry.example.com/team/app:1.0"
+TEST_DIGEST = "sha256:0123456789abcdef"
+
+
+# a synthetic pull progress stream of an image with a cached layer & two layers pulled in interleaved progress events
+def create_progress_stream():
+    return [
+        {"status": "Pulling from team/app", "id": "1.0"},
+        {"status": "Already exists", "id": "layer-a"},
+        {"status": "Pulling fs layer", "id": "layer-b"},
+        {"status": "Pulling fs layer", "id": "layer-c"},
+        {"status": "Downloading", "id": "layer-b", "progressDetail": {"current": 100, "total": 1000}},
+        {"status": "Downloading", "id": "layer-c", "progressDetail": {"current": 50, "total": 500}},
+        {"status": "Downloading", "id": "layer-b", "progressDetail": {"current": 600, "total": 1000}},
+        {"status": "Download complete", "id": "layer-c"},
+        {"status": "Download complete", "id": "layer-b"},
+        {"status": "Extracting", "id": "layer-b", "progressDetail": {"current": 400, "total": 1000}},
+        {"status": "Pull complete", "id": "layer-b"},
+        {"status": "Pull complete", "id": "layer-c"},
+        {"status": "Digest: " + TEST_DIGEST},
+        {"status": "Status: Downloaded newer image for " + TEST_IMAGE}
+    ]
+
+
+class PullProgressTrackerTests(TestCase):
+
+    def test_bytes_are_aggregated_per_layer(self):
+        pull_progress = PullProgressTracker(TEST_IMAGE, summary_interval=3600)
+        for progress_event in create_progress_stream()[:7]:
+            pull_progress.update(progress_event)
+        # repeated progress events of a layer replace it's previous progress rather then adding to it
+        self.assertEqual(pull_progress.layers["layer-b"]["downloaded"], 600)
+        self.assertEqual(pull_progress.summary()["bytes_downloaded"], 650)
+        for progress_event in create_progress_stream()[7:]:
+            pull_progress.update(progress_event)
+        summary = pull_progress.summary()
+        self.assertEqual(summary["bytes_downloaded"], 1500)
+        self.assertEqual(summary["bytes_extracted"], 1500)
+        self.assertEqual((summary["layers"], summary["cached_layers"], summary["fresh_layers"],
+                          summary["complete_layers"]), (3, 1, 2, 3))
+
+    def test_summary_is_throttled_to_the_summary_interval(self):
+        pull_progress = PullProgressTracker(TEST_IMAGE, summary_interval=3600)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for progress_event in create_progress_stream()[:7]:
+                pull_progress.update(progress_event)
+            self.assertEqual(output.getvalue(), "")
+            # once summary_interval passed the next event prints a single summary & the interval starts over
+            pull_progress.last_summary_time -= 3600
+            for progress_event in create_progress_stream()[7:]:
+                pull_progress.update(progress_event)
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["pulling image " + TEST_IMAGE + " - 1/3 layers complete (1 cached), 0MB downloaded"])
+
+    def test_finish_returns_the_final_record(self):
+        pull_progress = PullProgressTracker(TEST_IMAGE, summary_interval=3600)
+        for progress_event in create_progress_stream():
+            pull_progress.update(progress_event)
+        pull_record = pull_progress.finish()
+        self.assertEqual(pull_record["image"], TEST_IMAGE)
+        self.assertEqual(pull_record["digest"], TEST_DIGEST)
+        self.assertEqual(pull_record["status"], "Downloaded newer image for " + TEST_IMAGE)
+        self.assertIsNone(pull_record["error"])
+        self.assertEqual(pull_record["bytes_downloaded"], 1500)
+        self.assertEqual((pull_record["fresh_layers"], pull_record["cached_layers"]), (2, 1))
+        self.assertGreaterEqual(pull_record["duration_seconds"], 0)
+
+    def test_finish_records_a_failed_pull(self):
+        pull_progress = PullProgressTracker(TEST_IMAGE, summary_interval=3600)
+        pull_progress.update({"status": "Pulling fs layer", "id": "layer-b"})
+        pull_progress.update({"error": "manifest unknown", "errorDetail": {"message": "manifest unknown"}})
+        pull_record = pull_progress.finish()
+        self.assertEqual(pull_record["error"], "manifest unknown")
+        self.assertIsNone(pull_record["digest"])
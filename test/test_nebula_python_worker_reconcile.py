@@ -0,0 +1,148 @@
+from unittest import TestCase
+from functions.reconcile.device_group_diff import *
+from functions.reconcile.worker_state import *
+import copy, os, tempfile
+
+
+def create_test_app(app_name, app_id=1, running=True, rolling_restart=False):
+    return {
+        "app_name": app_name,
+        "app_id": app_id,
+        "running": running,
+        "rolling_restart": rolling_restart,
+        "docker_image": "nginx:alpine",
+        "containers_per": {"server": 1},
+        "starting_ports": [80],
+        "env_vars": {},
+        "volumes": [],
+        "devices": [],
+        "privileged": False,
+        "networks": ["nebula"]
+    }
+
+
+def create_test_cron_job(cron_job_name, cron_job_id=1, running=True, schedule="* * * * *"):
+    return {
+        "cron_job_name": cron_job_name,
+        "cron_job_id": cron_job_id,
+        "running": running,
+        "schedule": schedule,
+        "docker_image": "alpine:latest",
+        "env_vars": {},
+        "volumes": [],
+        "devices": [],
+        "privileged": False,
+        "networks": ["nebula"]
+    }
+
+
+def create_test_reply(apps, cron_jobs, device_group_id=1, prune_id=1):
+    return {
+        "apps": apps,
+        "apps_list": [app["app_name"] for app in apps],
+        "cron_jobs": cron_jobs,
+        "cron_jobs_list": [cron_job["cron_job_name"] for cron_job in cron_jobs],
+        "device_group_id": device_group_id,
+        "prune_id": prune_id
+    }
+
+
+class ReconcileTests(TestCase):
+
+    def test_unchanged_reply_is_a_noop(self):
+        reply = create_test_reply([create_test_app("app1")], [create_test_cron_job("cron1")])
+        local_index = DeviceGroupIndex(reply)
+        remote_index = DeviceGroupIndex(copy.deepcopy(reply))
+        plan = plan_device_group_changes(local_index, remote_index)
+        self.assertFalse(plan.changed)
+        self.assertEqual(len(plan), 0)
+        # an unchanged reply should never get indexed per app\cron_job
+        self.assertIsNone(remote_index._apps)
+        self.assertIsNone(remote_index._cron_jobs)
+
+    def test_app_changes(self):
+        local_reply = create_test_reply([create_test_app("stopped"), create_test_app("rolled"),
+                                         create_test_app("restarted"), create_test_app("unchanged"),
+                                         create_test_app("removed")], [])
+        remote_reply = create_test_reply([create_test_app("stopped", app_id=2, running=False),
+                                          create_test_app("rolled", app_id=2, rolling_restart=True),
+                                          create_test_app("restarted", app_id=2),
+                                          create_test_app("unchanged"),
+                                          create_test_app("added")], [], device_group_id=2)
+        plan = plan_device_group_changes(DeviceGroupIndex(local_reply), DeviceGroupIndex(remote_reply))
+        self.assertTrue(plan.changed)
+        self.assertEqual([(action.action, action.name) for action in plan], [
+            (STOP_APP, "stopped"),
+            (ROLL_APP, "rolled"),
+            (RESTART_APP, "restarted"),
+            (ADD_APP, "added"),
+            (REMOVE_APP, "removed")
+        ])
+
+    def test_app_id_only_change_forces_a_restart(self):
+        local_reply = create_test_reply([create_test_app("restarted"), create_test_app("changed")], [])
+        changed_app = create_test_app("changed", app_id=2)
+        changed_app["containers_per"] = {"server": 2}
+        remote_reply = create_test_reply([create_test_app("restarted", app_id=2), changed_app], [])
+        plan = plan_device_group_changes(DeviceGroupIndex(local_reply), DeviceGroupIndex(remote_reply))
+        self.assertEqual([(action.action, action.name, action.force) for action in plan], [
+            (RESTART_APP, "restarted", True),
+            (RESTART_APP, "changed", False)
+        ])
+
+    def test_app_changed_without_id_increase_is_ignored(self):
+        local_reply = create_test_reply([create_test_app("app1")], [])
+        remote_app = create_test_app("app1")
+        remote_app["docker_image"] = "nginx:latest"
+        plan = plan_device_group_changes(DeviceGroupIndex(local_reply),
+                                         DeviceGroupIndex(create_test_reply([remote_app], [])))
+        self.assertFalse(plan.changed)
+        self.assertEqual(len(plan), 0)
+
+    def test_cron_job_changes(self):
+        local_reply = create_test_reply([], [create_test_cron_job("updated"), create_test_cron_job("disabled"),
+                                             create_test_cron_job("removed")])
+        remote_reply = create_test_reply([], [create_test_cron_job("updated", cron_job_id=2, schedule="0 * * * *"),
+                                              create_test_cron_job("disabled", cron_job_id=2, running=False),
+                                              create_test_cron_job("added")], device_group_id=2, prune_id=2)
+        plan = plan_device_group_changes(DeviceGroupIndex(local_reply), DeviceGroupIndex(remote_reply))
+        self.assertTrue(plan.changed)
+        self.assertEqual([(action.action, action.name) for action in plan], [
+            (UPDATE_CRON_JOB, "updated"),
+            (REMOVE_CRON_JOB, "disabled"),
+            (ADD_CRON_JOB, "added"),
+            (REMOVE_CRON_JOB, "removed"),
+            (PRUNE_IMAGES, None)
+        ])
+
+    def test_large_device_group_single_change(self):
+        local_reply = create_test_reply([create_test_app("app" + str(x)) for x in range(500)],
+                                        [create_test_cron_job("cron" + str(x)) for x in range(500)])
+        remote_reply = copy.deepcopy(local_reply)
+        remote_reply["apps"][250]["app_id"] = 2
+        remote_index = DeviceGroupIndex(remote_reply)
+        plan = plan_device_group_changes(DeviceGroupIndex(local_reply), remote_index)
+        self.assertEqual([(action.action, action.name) for action in plan], [(RESTART_APP, "app250")])
+        self.assertEqual(remote_index.get_cron_job("cron499")["cron_job_name"], "cron499")
+        self.assertIsNone(remote_index.get_app("missing_app"))
+
+    def test_app_spec_fingerprint_ignores_non_spec_keys(self):
+        app = create_test_app("app1")
+        changed_app = create_test_app("app1", app_id=2, rolling_restart=True)
+        changed_app["containers_per"] = {"server": 3}
+        self.assertEqual(app_spec_fingerprint(app), app_spec_fingerprint(changed_app))
+        changed_app["env_vars"] = {"test": "changed"}
+        self.assertNotEqual(app_spec_fingerprint(app), app_spec_fingerprint(changed_app))
+
+    def test_worker_state_file(self):
+        with tempfile.TemporaryDirectory() as state_directory:
+            worker_state = WorkerStateFile(os.path.join(state_directory, "state", "worker_state.json"))
+            self.assertIsNone(worker_state.load())
+            device_group_info = {"status_code": 200, "reply": create_test_reply([create_test_app("app1")], [])}
+            worker_state.save(device_group_info)
+            self.assertEqual(worker_state.load(), device_group_info)
+
+    def test_worker_state_file_disabled_without_a_path(self):
+        worker_state = WorkerStateFile(None)
+        worker_state.save({"status_code": 200, "reply": create_test_reply([create_test_app("app1")], [])})
+        self.assertIsNone(worker_state.load())
@@ -0,0 +1,58 @@
+from unittest import TestCase
+from functions.misc.record_replay import *
+from functions.docker_engine.docker_engine import DockerFunctions
+from test.fakes.fake_docker_engine import FakeDockerEngine
+import contextlib, io, os, tempfile
+
+
+class FakeNebulaConnection:
+
+    def __init__(self):
+        self.device_group_id = 0
+
+    def list_device_group_info(self, device_group):
+        self.device_group_id += 1
+        return {"status_code": 200, "reply": {"device_group_id": self.device_group_id}}
+
+
+def run_test_app(docker_socket):
+    docker_socket.create_docker_network("nebula", "bridge")
+    docker_socket.pull_image("registry.example.com/team/app", version_tag="1.0")
+    docker_socket.run_containers([{
+        "app_name": "app", "container_name": "app-1", "image_name": "registry.example.com/team/app",
+        "bind_port": {80: 8000}, "ports": [80], "env_vars": {}, "version_tag": "1.0", "networks": ["nebula"]
+    }])
+    containers = docker_socket.list_containers("app")
+    docker_socket.stop_and_remove_containers([container["Id"] for container in containers])
+    return containers
+
+
+class RecordReplayTests(TestCase):
+
+    def test_record_and_replay(self):
+        with tempfile.TemporaryDirectory() as recording_directory, contextlib.redirect_stdout(io.StringIO()):
+            recording_path = os.path.join(recording_directory, "traffic.jsonl.gz")
+            docker_engine = FakeDockerEngine().start()
+            try:
+                traffic_recorder = TrafficRecorder(recording_path)
+                recorded_containers = run_test_app(DockerFunctions(base_url=docker_engine.base_url,
+                                                                   traffic_recorder=traffic_recorder))
+                nebula_connection = RecordingProxy(FakeNebulaConnection(), traffic_recorder, "manager")
+                recorded_replies = [nebula_connection.list_device_group_info("test") for _ in range(2)]
+                traffic_recorder.close()
+                recorded_engine_calls = sum(docker_engine.reset_call_counts().values())
+
+                traffic_replay = TrafficReplay(recording_path, speed=0)
+                replayed_containers = run_test_app(DockerFunctions(docker_client=ReplayProxy(traffic_replay,
+                                                                                             "docker")))
+                nebula_connection = ReplayProxy(traffic_replay, "manager")
+                replayed_replies = [nebula_connection.list_device_group_info("test") for _ in range(2)]
+                self.assertRaises(ReplayFinished, nebula_connection.list_device_group_info, "test")
+            finally:
+                docker_engine.stop()
+        self.assertEqual(len(recorded_containers), 1)
+        self.assertEqual(replayed_containers, recorded_containers)
+        self.assertEqual(replayed_replies, recorded_replies)
+        self.assertEqual(sum(docker_engine.call_counts.values()), 0)
+        self.assertEqual(traffic_replay.replayed_calls, traffic_replay.recorded_calls)
+        self.assertGreater(recorded_engine_calls, 0)
@@ -0,0 +1,230 @@
+from unittest import TestCase
+from functions.reporting.report_encoder import *
+from functions.reporting.report_sender import *
+from functions.reporting.report_spool import *
+from functions.reporting.kafka import *
+from kafka import codec
+from threading import Event
+import tempfile
+import time
+import os
+
+
+def create_test_report(containers, config_id=1):
+    return {
+        "device_group": "test",
+        "updated": False,
+        "current_device_group_config": {"reply": {"device_group_id": config_id}},
+        "apps_containers": [dict(container) for container in containers],
+        "cron_jobs_containers": []
+    }
+
+
+class BlockingKafkaConnection:
+
+    def __init__(self):
+        self.unblock = Event()
+        self.reports = []
+        self.flushed = False
+
+    def push_report(self, report, on_error=None):
+        self.unblock.wait(5)
+        self.reports.append(report)
+
+    def flush(self, timeout=None):
+        self.flushed = True
+
+
+class FlakyKafkaConnection:
+
+    def __init__(self, failed_sends=1):
+        self.failed_sends = failed_sends
+        self.reports = []
+
+    def send_report(self, report, timeout=10):
+        if self.failed_sends > 0:
+            self.failed_sends -= 1
+            raise Exception("kafka unreachable")
+        self.reports.append(report)
+
+    def flush(self, timeout=None):
+        pass
+
+
+class ReportEncoderTests(TestCase):
+
+    def test_compact_report_flow(self):
+        test_encoder = CompactReportEncoder(full_snapshot_every=3)
+        test_decoder = CompactReportDecoder()
+        first_container = {"id": "a", "name": "app-1", "cpu_percent": 1.0}
+        second_container = {"id": "b", "name": "app-2", "cpu_percent": 2.0}
+
+        # the first report is a snapshot holding everything
+        test_report = test_encoder.encode(create_test_report([first_container, second_container]))
+        self.assertEqual(test_report["report_type"], "snapshot")
+        self.assertEqual(test_report["report_format_version"], COMPACT_REPORT_FORMAT_VERSION)
+        self.assertIn("current_device_group_config", test_report)
+        self.assertEqual(len(test_decoder.decode(test_report)["apps_containers"]), 2)
+
+        # a delta only holds the changed keys of changed containers & no config if it didn't change
+        test_report = test_encoder.encode(create_test_report([dict(first_container, cpu_percent=5.0),
+                                                              second_container]))
+        self.assertEqual(test_report["report_type"], "delta")
+        self.assertNotIn("current_device_group_config", test_report)
+        self.assertEqual(test_report["apps_containers"], [{"id": "a", "cpu_percent": 5.0}])
+        test_decoded_report = test_decoder.decode(test_report)
+        self.assertEqual(test_decoded_report["current_device_group_config"],
+                         {"reply": {"device_group_id": 1}})
+        self.assertIn({"id": "a", "name": "app-1", "cpu_percent": 5.0}, test_decoded_report["apps_containers"])
+
+        # removed containers & config changes are carried in deltas
+        test_report = test_encoder.encode(create_test_report([second_container], config_id=2))
+        self.assertEqual(test_report["removed_containers"], ["a"])
+        self.assertIn("current_device_group_config", test_report)
+        test_decoded_report = test_decoder.decode(test_report)
+        self.assertEqual(test_decoded_report["apps_containers"], [second_container])
+        self.assertEqual(test_decoded_report["current_device_group_config"],
+                         {"reply": {"device_group_id": 2}})
+
+        # every full_snapshot_every reports a snapshot is sent again
+        self.assertEqual(test_encoder.encode(create_test_report([second_container]))["report_type"], "snapshot")
+
+    def test_decoder_rejects_deltas_after_a_gap(self):
+        test_encoder = CompactReportEncoder(full_snapshot_every=4)
+        test_decoder = CompactReportDecoder()
+        test_reports = [test_encoder.encode(create_test_report([{"id": "a", "cpu_percent": float(report_number)}]))
+                        for report_number in range(5)]
+        with self.assertRaises(ReportSequenceGap):
+            test_decoder.decode(test_reports[1])
+        test_decoder.decode(test_reports[0])
+        test_decoder.decode(test_reports[1])
+        with self.assertRaises(ReportSequenceGap):
+            test_decoder.decode(test_reports[1])
+        # once a delta was missed the deltas which follow it are rejected as well until the next snapshot
+        with self.assertRaises(ReportSequenceGap):
+            test_decoder.decode(test_reports[3])
+        with self.assertRaises(ReportSequenceGap):
+            test_decoder.decode(test_reports[2])
+        self.assertEqual(test_decoder.decode(test_reports[4])["apps_containers"], [{"id": "a", "cpu_percent": 4.0}])
+
+    def test_decoder_rejects_unknown_format(self):
+        with self.assertRaises(ValueError):
+            CompactReportDecoder().decode({"report_format": COMPACT_REPORT_FORMAT, "report_format_version": 99})
+
+
+class ReportSenderTests(TestCase):
+
+    def test_report_sender_drops_oldest_and_flushes(self):
+        test_kafka_connection = BlockingKafkaConnection()
+        test_sender = ReportSender(test_kafka_connection, queue_size=2, drop_policy="oldest")
+        for report_number in range(4):
+            test_sender.queue_report({"report": report_number})
+        self.assertEqual(test_sender.dropped_reports, 2)
+        test_sender.start()
+        test_kafka_connection.unblock.set()
+        test_sender.close(timeout=5)
+        self.assertEqual(test_kafka_connection.reports, [{"report": 2}, {"report": 3}])
+        self.assertTrue(test_kafka_connection.flushed)
+
+    def test_report_sender_drops_newest(self):
+        test_sender = ReportSender(BlockingKafkaConnection(), queue_size=2, drop_policy="newest")
+        for report_number in range(4):
+            test_sender.queue_report({"report": report_number})
+        self.assertEqual(list(test_sender.reports_queue), [{"report": 0}, {"report": 1}])
+
+
+    def test_dropped_report_forces_a_snapshot(self):
+        for drop_policy in ("oldest", "newest"):
+            test_encoder = CompactReportEncoder(full_snapshot_every=100)
+            test_sender = ReportSender(BlockingKafkaConnection(), queue_size=2, drop_policy=drop_policy,
+                                       report_encoder=test_encoder)
+            test_report_types = []
+            for report_number in range(4):
+                test_report = test_encoder.encode(create_test_report([{"id": "a", "cpu_percent": 1.0}]))
+                test_report_types.append(test_report["report_type"])
+                test_sender.queue_report(test_report)
+            self.assertEqual(test_report_types, ["snapshot", "delta", "delta", "snapshot"])
+
+    def test_failed_report_reaches_kafka_before_the_next_one(self):
+        with tempfile.TemporaryDirectory() as spool_directory:
+            test_kafka_connection = FlakyKafkaConnection(failed_sends=1)
+            test_spool = ReportSpool(spool_directory)
+            test_sender = ReportSender(test_kafka_connection, report_spool=test_spool, spool_retry_interval=0.05)
+            test_sender.queue_report({"report": 0})
+            test_sender.queue_report({"report": 1})
+            test_sender.start()
+            deadline = time.monotonic() + 5
+            while len(test_kafka_connection.reports) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            test_sender.close(timeout=5)
+            self.assertEqual(test_kafka_connection.reports, [{"report": 0}, {"report": 1}])
+            self.assertTrue(test_spool.is_empty())
+
+
+class ReportSpoolTests(TestCase):
+
+    def test_report_spool_replays_in_order_across_restarts(self):
+        with tempfile.TemporaryDirectory() as spool_directory:
+            test_spool = ReportSpool(spool_directory, segment_max_bytes=40, max_total_bytes=100000)
+            for report_number in range(5):
+                test_spool.append({"report": report_number})
+            self.assertGreater(len(test_spool.segments), 1)
+            self.assertEqual(test_spool.peek(), {"report": 0})
+            test_spool.pop()
+            self.assertEqual(test_spool.peek(), {"report": 1})
+
+            # an unpopped report is read again after a restart & new reports are appended after the spooled ones
+            test_spool = ReportSpool(spool_directory, segment_max_bytes=40, max_total_bytes=100000)
+            test_spool.append({"report": 5})
+            replayed_reports = []
+            while test_spool.peek() is not None:
+                replayed_reports.append(test_spool.peek()["report"])
+                test_spool.pop()
+            self.assertEqual(replayed_reports, [1, 2, 3, 4, 5])
+            self.assertTrue(test_spool.is_empty())
+
+    def test_report_spool_evicts_oldest_segments(self):
+        with tempfile.TemporaryDirectory() as spool_directory:
+            test_spool = ReportSpool(spool_directory, segment_max_bytes=20, max_total_bytes=60)
+            for report_number in range(10):
+                test_spool.append({"report": report_number})
+            self.assertLessEqual(test_spool.total_bytes(), 60)
+            self.assertEqual(test_spool.peek(), {"report": 6})
+
+    def test_report_spool_byte_count_matches_the_segments_on_disk(self):
+        with tempfile.TemporaryDirectory() as spool_directory:
+            test_spool = ReportSpool(spool_directory, segment_max_bytes=20, max_total_bytes=60)
+            for report_number in range(10):
+                test_spool.append({"report": report_number})
+            # reading past the oldest segment removes it
+            for report_number in range(2):
+                test_spool.peek()
+                test_spool.pop()
+            test_spool.peek()
+            segments_bytes = sum(os.path.getsize(test_spool.segment_path(segment_name))
+                                 for segment_name in test_spool.segments)
+            self.assertEqual(test_spool.total_bytes(), segments_bytes)
+            self.assertEqual(ReportSpool(spool_directory).total_bytes(), segments_bytes)
+
+    def test_report_spool_eviction_forces_a_snapshot(self):
+        with tempfile.TemporaryDirectory() as spool_directory:
+            test_encoder = CompactReportEncoder(full_snapshot_every=100)
+            test_spool = ReportSpool(spool_directory, segment_max_bytes=400, max_total_bytes=800)
+            ReportSender(BlockingKafkaConnection(), report_spool=test_spool, report_encoder=test_encoder)
+            test_report_types = []
+            while test_spool.evicted_segments == 0:
+                test_report = test_encoder.encode(create_test_report([{"id": "a", "cpu_percent": 1.0}]))
+                test_report_types.append(test_report["report_type"])
+                test_spool.append(test_report)
+            self.assertEqual(test_report_types.count("snapshot"), 1)
+            self.assertEqual(test_encoder.encode(create_test_report([]))["report_type"], "snapshot")
+
+
+class KafkaCompressionTypeTests(TestCase):
+
+    def test_compression_types_without_their_library_are_rejected(self):
+        self.assertTrue(kafka_compression_type_supported(None))
+        self.assertTrue(kafka_compression_type_supported("gzip"))
+        self.assertEqual(kafka_compression_type_supported("lz4"), codec.has_lz4())
+        self.assertEqual(kafka_compression_type_supported("zstd"), codec.has_zstd())
+        self.assertFalse(kafka_compression_type_supported("brotli"))
@@ -0,0 +1,86 @@
+from unittest import TestCase
+from test.fakes.fake_docker_engine import FakeDockerEngine
+from functions.docker_engine.docker_engine import DockerFunctions
+from functions.docker_engine.stats_collector import *
+import contextlib, io
+
+TEST_IMAGE = "registry.example.com/team/app"
+MB = 1024 * 1024
+
+
+def create_stats_sample(total_usage, system_cpu_usage, precpu_stats, memory_stats, online_cpus=2):
+    return {
+        "id": "a", "name": "/app-1", "read": "2021-07-01T00:00:01Z",
+        "cpu_stats": {"cpu_usage": {"total_usage": total_usage}, "system_cpu_usage": system_cpu_usage,
+                      "online_cpus": online_cpus},
+        "precpu_stats": precpu_stats,
+        "memory_stats": memory_stats
+    }
+
+
+class SummarizeContainerStatsTests(TestCase):
+
+    def test_cgroup_v1_sample(self):
+        summary = summarize_container_stats(create_stats_sample(
+            400000000, 2000000000,
+            {"cpu_usage": {"total_usage": 200000000}, "system_cpu_usage": 1000000000},
+            {"usage": 300 * MB, "limit": 1000 * MB, "stats": {"cache": 100 * MB, "inactive_file": 60 * MB}}))
+        self.assertEqual(summary["cpu_percent"], 40.0)
+        self.assertEqual(summary["memory_usage_bytes"], 200 * MB)
+        self.assertEqual(summary["memory_percent"], 20.0)
+
+    def test_cgroup_v2_sample(self):
+        summary = summarize_container_stats(create_stats_sample(
+            250000000, 2000000000,
+            {"cpu_usage": {"total_usage": 200000000}, "system_cpu_usage": 1000000000},
+            {"usage": 150 * MB, "limit": 400 * MB, "stats": {"inactive_file": 50 * MB, "active_file": 10 * MB}},
+            online_cpus=4))
+        self.assertEqual(summary["cpu_percent"], 20.0)
+        self.assertEqual(summary["memory_usage_bytes"], 100 * MB)
+        self.assertEqual(summary["memory_percent"], 25.0)
+
+    def test_first_sample_has_no_cpu_usage(self):
+        for precpu_stats in ({}, {"cpu_usage": {"total_usage": 0}, "throttling_data": {}}):
+            summary = summarize_container_stats(create_stats_sample(
+                400000000, 2000000000, precpu_stats, {"usage": 100 * MB, "limit": 1000 * MB, "stats": {}}))
+            self.assertEqual(summary["cpu_percent"], 0.0)
+            self.assertEqual(summary["memory_usage_bytes"], 100 * MB)
+
+
+class ContainerStatsCollectorTests(TestCase):
+
+    def setUp(self):
+        self.docker_engine = FakeDockerEngine().start()
+        self.addCleanup(self.docker_engine.stop)
+        self.docker_socket = DockerFunctions(base_url=self.docker_engine.base_url)
+        self.stats_docker_socket = DockerFunctions(base_url=self.docker_engine.base_url, max_pool_size=2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.docker_socket.create_docker_network("nebula", "bridge")
+            for container_number in range(1, 4):
+                self.docker_socket.run_container("app", "app-" + str(container_number), TEST_IMAGE, {}, [], {},
+                                                 networks=["nebula"])
+
+    def test_full_stats_cache_is_reported_once(self):
+        stats_collector = ContainerStatsCollector(self.docker_socket, max_cached_containers=2,
+                                                  stats_docker_connection_object=self.stats_docker_socket)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            for _ in range(3):
+                stats_collector.sync_subscriptions()
+        self.assertEqual(output.getvalue().count("stats cache is full"), 1)
+        self.assertLessEqual(len(stats_collector.subscriptions), 2)
+
+    def test_stats_are_streamed_over_the_stats_connection(self):
+        stream_calls = []
+        stream_container_stats = self.stats_docker_socket.stream_container_stats
+        self.stats_docker_socket.stream_container_stats = \
+            lambda container_id: stream_calls.append(container_id) or stream_container_stats(container_id)
+        stats_collector = ContainerStatsCollector(self.docker_socket,
+                                                  stats_docker_connection_object=self.stats_docker_socket)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            stats_collector.sync_subscriptions()
+            deadline = time.monotonic() + 10
+            while len(stream_calls) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(sorted(stream_calls),
+                         sorted(container["Id"] for container in self.docker_engine.running_containers()))
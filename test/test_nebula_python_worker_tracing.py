@@ -0,0 +1,47 @@
+from unittest import TestCase
+from functions.misc.tracing import *
+import json
+
+
+@trace_methods
+class TracedTestClass:
+
+    def stop_container(self, container_name):
+        with tracer.span("kill_fallback", container_name=container_name):
+            return container_name
+
+
+@traced()
+def traced_test_function(app_json, force_pull=True):
+    return TracedTestClass().stop_container(app_json["app_name"] + "-1")
+
+
+class TracingTests(TestCase):
+
+    def tearDown(self):
+        tracer.configure(enabled=False)
+
+    def test_nested_spans(self):
+        tracer.configure(enabled=True, buffer_size=100)
+        self.assertEqual(traced_test_function({"app_name": "test", "docker_image": "nginx"}), "test-1")
+        spans = {span["name"]: span for span in tracer.list_spans()}
+        self.assertEqual(spans["traced_test_function"]["attributes"], {"app_name": "test", "docker_image": "nginx"})
+        self.assertEqual(spans["TracedTestClass.stop_container"]["attributes"], {"container_name": "test-1"})
+        self.assertEqual(spans["TracedTestClass.stop_container"]["parent_id"],
+                         spans["traced_test_function"]["span_id"])
+        self.assertEqual(spans["kill_fallback"]["parent_id"], spans["TracedTestClass.stop_container"]["span_id"])
+        chrome_trace = json.loads(tracer.dump(trace_format="chrome"))
+        self.assertIn("traced_test_function", [event["name"] for event in chrome_trace["traceEvents"]])
+
+    def test_tracing_disabled_records_nothing(self):
+        tracer.configure(enabled=False, buffer_size=100)
+        spans_before = len(tracer.list_spans())
+        traced_test_function({"app_name": "test"})
+        self.assertIs(tracer.span("test"), NOOP_SPAN)
+        self.assertEqual(len(tracer.list_spans()), spans_before)
+
+    def test_ring_buffer_is_bounded(self):
+        tracer.configure(enabled=True, buffer_size=5)
+        for _ in range(10):
+            traced_test_function({"app_name": "test"})
+        self.assertEqual(len(tracer.list_spans()), 5)
@@ -1,17 +1,40 @@
 from NebulaPythonSDK import Nebula
 from functions.reporting.reporting import *
 from functions.reporting.kafka import *
+from functions.reporting.report_sender import *
+from functions.reporting.report_spool import *
 from functions.docker_engine.docker_engine import *
+from functions.docker_engine.health_monitor import *
+from functions.docker_engine.stats_collector import *
+from functions.docker_engine.image_pull import *
+from functions.docker_engine.async_docker_engine import *
+from functions.docker_engine.container_inventory import *
+from functions.docker_engine.image_gc import *
 from functions.misc.server import *
+from functions.misc.host_sampler import *
+from functions.misc.metrics import *
+from functions.misc.tracing import *
+from functions.misc.record_replay import *
 from functions.misc.cron_schedule import *
+from functions.misc.check_in_scheduler import *
+from functions.misc.device_group_fetcher import *
+from functions.reconcile.device_group_diff import *
+from functions.reconcile.app_executor import *
+from functions.reconcile.worker_state import *
 from threading import Thread
 from random import randint
-from retrying import retry
 from parse_it import ParseIt
-import os, sys, time
+import os, sys, time, signal
+
+
+# suffix of the temporary name new containers are created under when they are created before the old ones are stopped
+SWAP_CONTAINER_SUFFIX = "-nebula-swap"
+# suffix of the name old containers are kept stopped under until their replacement started
+SWAP_OLD_CONTAINER_SUFFIX = "-nebula-swap-old"
 
 
 # split container image name to the registry, image & version used with default of docker hub if registry not set.
+@traced()
 def split_container_name_version(image_name):
     try:
         image_registry_name, image_name = image_name.rsplit("/", 1)
@@ -29,13 +52,25 @@ def split_container_name_version(image_name):
 
 
 # update\release\restart function
-def restart_containers(app_json, force_pull=True):
+@traced()
+def restart_containers(app_json, force_pull=True, force_restart=False):
     image_registry_name, image_name, version_name = split_container_name_version(app_json["docker_image"])
     # wait between zero to max_restart_wait_in_seconds seconds before rolling - avoids roaring horde of the registry
-    time.sleep(randint(0, max_restart_wait_in_seconds))
-    # pull image to speed up downtime between stop & start
+    with tracer.span("restart_jitter_sleep", app_name=app_json["app_name"]):
+        time.sleep(randint(0, max_restart_wait_in_seconds))
+    # pull image to speed up downtime between stop & start, the registry is always checked for a newer image under the
+    # same tag rather then trusting the cached registry digest as a restart is how a new push of a tag is deployed
     if force_pull is True:
-        docker_socket.pull_image(image_name, version_tag=version_name)
+        image_puller.pull_image(image_name, version_tag=version_name, use_digest_cache=False)
+    # only add\remove containers if nothing but the number of containers changed (or skip it if nothing did), unless
+    # the restart was explicitly asked for
+    if force_restart is False and scale_containers(app_json, image_name, version_name) is True:
+        return
+    # create the new containers ahead of time so only the stop & start of each container counts as downtime, falls
+    # back to stopping & then starting the containers if the new containers couldn't be created ahead of time
+    if restart_create_before_stop is True and app_json["running"] is True:
+        if swap_containers(app_json, image_name, version_name) is True:
+            return
     # stop running containers
     stop_containers(app_json)
     # start new containers
@@ -43,59 +78,134 @@ def restart_containers(app_json, force_pull=True):
     return
 
 
+# replace the containers of an app by creating all of the new containers under temporary names first & then per slot
+# stopping the old container, renaming the new container to it's final name & starting it, returns False without
+# touching the running containers if creating the new containers failed
+@traced()
+def swap_containers(app_json, image_name, version_name):
+    containers_by_name = {}
+    leftover_containers = []
+    for container in docker_socket.list_containers(app_json["app_name"], container_type="app"):
+        container_name = container["Names"][0].lstrip("/")
+        if container_name.endswith(SWAP_CONTAINER_SUFFIX) or container_name.endswith(SWAP_OLD_CONTAINER_SUFFIX):
+            leftover_containers.append(container["Id"])
+        else:
+            containers_by_name[container_name] = container
+    # remove new containers which were left behind by an earlier swap that got interrupted
+    docker_socket.stop_and_remove_containers(leftover_containers)
+
+    containers_to_run = []
+    for container_number in range(1, containers_required(app_json) + 1):
+        container_to_run = app_container_run(app_json, container_number, image_name, version_name)
+        swap_container_name = container_to_run["container_name"] + SWAP_CONTAINER_SUFFIX
+        if docker_socket.create_run_container(**dict(container_to_run, container_name=swap_container_name),
+                                              exit_on_failure=False) is None:
+            print("failed creating the new containers of app " + app_json["app_name"] +
+                  " ahead of time, falling back to stopping the old containers first")
+            docker_socket.stop_and_remove_containers([container_to_run["container_name"] + SWAP_CONTAINER_SUFFIX
+                                                      for container_to_run in containers_to_run])
+            return False
+        containers_to_run.append(container_to_run)
+
+    threads = []
+    for container_to_run in containers_to_run:
+        t = Thread(target=swap_container, args=(container_to_run,
+                                                containers_by_name.pop(container_to_run["container_name"], None)))
+        threads.append(t)
+        t.start()
+    for y in threads:
+        y.join()
+    # stop any old containers past the number of containers now needed
+    docker_socket.stop_and_remove_containers([container["Id"] for container in containers_by_name.values()])
+    return True
+
+
 # roll app function
-def roll_containers(app_json, force_pull=True):
+@traced()
+def roll_containers(app_json, force_pull=True, force_restart=False):
     image_registry_name, image_name, version_name = split_container_name_version(app_json["docker_image"])
     # wait between zero to max_restart_wait_in_seconds seconds before rolling - avoids roaring horde of the registry
-    time.sleep(randint(0, max_restart_wait_in_seconds))
-    # pull image to speed up downtime between stop & start
+    with tracer.span("restart_jitter_sleep", app_name=app_json["app_name"]):
+        time.sleep(randint(0, max_restart_wait_in_seconds))
+    # pull image to speed up downtime between stop & start, the registry is always checked for a newer image under the
+    # same tag rather then trusting the cached registry digest as a restart is how a new push of a tag is deployed
     if force_pull is True:
-        docker_socket.pull_image(image_name, version_tag=version_name)
+        image_puller.pull_image(image_name, version_tag=version_name, use_digest_cache=False)
     # list current containers
     containers_list = docker_socket.list_containers(app_json["app_name"], container_type="app")
-    # roll each container in turn - not threaded as the order is important when rolling
+    # only add\remove containers if nothing but the number of containers changed (or skip it if nothing did), unless
+    # the roll was explicitly asked for
+    if force_restart is False and \
+            scale_containers(app_json, image_name, version_name, containers_list=containers_list) is True:
+        return
+    # roll the containers in slot order, rolling_restart_batch_size containers at a time so no more then that many are
+    # ever unavailable, each batch only moves on once it's new containers are ready, if they aren't ready within
+    # rolling_restart_ready_timeout the roll halts leaving the old containers of the remaining batches running, the
+    # slots are sorted by number rather then by name as app-10 would otherwise come before app-2
     containers_needed = containers_required(app_json)
-    for idx, container in enumerate(sorted(containers_list, key=lambda k: k['Names'][0])):
-        docker_socket.stop_and_remove_container(container["Id"])
-        if idx < containers_needed:
-            port_binds = dict()
-            port_list = []
-            for x in app_json["starting_ports"]:
-                if isinstance(x, int):
-                    port_binds[x] = x + idx
-                    port_list.append(x)
-                elif isinstance(x, dict):
-                    for host_port, container_port in x.items():
-                        port_binds[int(container_port)] = int(host_port) + idx
-                        port_list.append(container_port)
-                else:
-                    print("starting ports can only a list containing intgers or dicts - dropping worker")
-                    os._exit(2)
-            docker_socket.run_container(app_json["app_name"], app_json["app_name"] + "-" + str(idx + 1), image_name,
-                                        port_binds, port_list, app_json["env_vars"], version_name, app_json["volumes"],
-                                        app_json["devices"], app_json["privileged"], app_json["networks"],
-                                        "unless-stopped")
-            # wait 5 seconds between container rolls to give each container time to start fully
-            time.sleep(5)
+    sorted_containers = sorted(containers_list, key=lambda k: (app_container_number(app_json, k) is None,
+                                                                app_container_number(app_json, k) or 0,
+                                                                k['Names'][0]))
+    batch_size = max(int(rolling_restart_batch_size), 1)
+    for batch_start in range(0, len(sorted_containers), batch_size):
+        batch_containers = sorted_containers[batch_start:batch_start + batch_size]
+        docker_socket.stop_and_remove_containers([container["Id"] for container in batch_containers])
+        containers_to_run = []
+        for idx in range(batch_start, batch_start + len(batch_containers)):
+            if idx < containers_needed:
+                containers_to_run.append(app_container_run(app_json, idx + 1, image_name, version_name))
+        docker_socket.run_containers(containers_to_run)
+        containers_ready = [docker_socket.wait_for_container_ready(container_to_run["container_name"],
+                                                                   timeout=rolling_restart_ready_timeout)
+                            for container_to_run in containers_to_run]
+        if False in containers_ready:
+            print("the new containers of app " + app_json["app_name"] + " weren't ready - halting it's roll leaving " +
+                  str(len(sorted_containers) - batch_start - len(batch_containers)) + " old containers running")
+            metrics.counter("nebula_worker_rolls_halted_total",
+                            "Rolling restarts halted as the new containers weren't ready in time").inc()
+            return
+    # start the slots the app grew by, there were no containers in them to roll
+    containers_to_run = [app_container_run(app_json, container_number, image_name, version_name)
+                         for container_number in range(len(sorted_containers) + 1, containers_needed + 1)]
+    if len(containers_to_run) > 0:
+        docker_socket.run_containers(containers_to_run)
+
+
+# swap a single slot - stop the old container if there is one & keep it aside under a temporary name, give the new
+# container it's final name & start it, if the new container fails to start it's removed & the old container is put
+# back & started again, returns False if the new container didn't start
+@traced()
+def swap_container(container_to_run, old_container):
+    container_name = container_to_run["container_name"]
+    if old_container is not None:
+        docker_socket.stop_container(old_container["Id"])
+        docker_socket.rename_container(old_container["Id"], container_name + SWAP_OLD_CONTAINER_SUFFIX)
+    docker_socket.rename_container(container_name + SWAP_CONTAINER_SUFFIX, container_name)
+    if docker_socket.start_and_connect_container(container_name, container_to_run["networks"]) is False:
+        if old_container is not None:
+            print("failed starting the new container " + container_name + " - rolling back to it's old container")
+            docker_socket.remove_container(container_name)
+            docker_socket.rename_container(old_container["Id"], container_name)
+            docker_socket.start_container(container_name)
+        return False
+    if old_container is not None:
+        docker_socket.remove_container(old_container["Id"])
+    return True
 
 
 # stop app function
+@traced()
 def stop_containers(app_json, container_type="app"):
     # list current containers
     containers_list = docker_socket.list_containers(app_json["app_name"], container_type=container_type,
                                                     show_all_containers=True)
     # stop running containers
-    threads = []
-    for container in containers_list:
-        t = Thread(target=docker_socket.stop_and_remove_container, args=(container["Id"],))
-        threads.append(t)
-        t.start()
-    for z in threads:
-        z.join()
+    docker_socket.stop_and_remove_containers([container["Id"] for container in containers_list])
     return
 
 
 # start cron container function
+@traced()
 def start_cron_job_container(cron_job_json, force_pull=True, container_type="cron_job"):
     # list current containers
     if cron_job_json["running"] is True:
@@ -103,28 +213,34 @@ def start_cron_job_container(cron_job_json, force_pull=True, container_type="cro
         containers_needed = 1
         # pull required image
         if force_pull is True:
-            docker_socket.pull_image(image_name, version_tag=version_name)
+            image_puller.pull_image(image_name, version_tag=version_name)
         # start new containers
         container_number = 1
-        threads = []
+        containers_to_run = []
         while container_number <= containers_needed:
-            t = Thread(target=docker_socket.run_container, args=(cron_job_json["cron_job_name"],
-                                                                 cron_job_json["cron_job_name"] + "-" +
-                                                                 str(int(time.time())) + "-" + str(container_number),
-                                                                 image_name, {}, [], cron_job_json["env_vars"],
-                                                                 version_name, cron_job_json["volumes"],
-                                                                 cron_job_json["devices"], cron_job_json["privileged"],
-                                                                 cron_job_json["networks"], None),
-                       kwargs={"container_type": container_type})
-            threads.append(t)
-            t.start()
+            containers_to_run.append({
+                "app_name": cron_job_json["cron_job_name"],
+                "container_name": cron_job_json["cron_job_name"] + "-" + str(int(time.time())) + "-" +
+                                  str(container_number),
+                "image_name": image_name,
+                "bind_port": {},
+                "ports": [],
+                "env_vars": cron_job_json["env_vars"],
+                "version_tag": version_name,
+                "volumes": cron_job_json["volumes"],
+                "devices": cron_job_json["devices"],
+                "privileged": cron_job_json["privileged"],
+                "networks": cron_job_json["networks"],
+                "restart_policy": None,
+                "container_type": container_type
+            })
             container_number = container_number + 1
-        for y in threads:
-            y.join()
+        docker_socket.run_containers(containers_to_run)
         return
 
 
 # start app function
+@traced()
 def start_containers(app_json, force_pull=True):
     # list current containers
     containers_list = docker_socket.list_containers(app_json["app_name"], container_type="app")
@@ -136,39 +252,53 @@ def start_containers(app_json, force_pull=True):
         containers_needed = containers_required(app_json)
         # pull required image
         if force_pull is True:
-            docker_socket.pull_image(image_name, version_tag=version_name)
+            image_puller.pull_image(image_name, version_tag=version_name)
         # start new containers
         container_number = 1
-        threads = []
+        containers_to_run = []
         while container_number <= containers_needed:
-            port_binds = dict()
-            port_list = []
-            for x in app_json["starting_ports"]:
-                if isinstance(x, int):
-                    port_binds[x] = x + container_number - 1
-                    port_list.append(x)
-                elif isinstance(x, dict):
-                    for host_port, container_port in x.items():
-                        port_binds[int(container_port)] = int(host_port) + container_number - 1
-                        port_list.append(container_port)
-                else:
-                    print("starting ports can only a list containing intgers or dicts - dropping worker")
-                    os._exit(2)
-            t = Thread(target=docker_socket.run_container, args=(app_json["app_name"], app_json["app_name"] + "-" +
-                                                                 str(container_number), image_name, port_binds,
-                                                                 port_list, app_json["env_vars"], version_name,
-                                                                 app_json["volumes"], app_json["devices"],
-                                                                 app_json["privileged"], app_json["networks"],
-                                                                 "unless-stopped"))
-            threads.append(t)
-            t.start()
+            containers_to_run.append(app_container_run(app_json, container_number, image_name, version_name))
             container_number = container_number + 1
-        for y in threads:
-            y.join()
+        docker_socket.run_containers(containers_to_run)
         return
 
 
+# return the run_container arguments of an app container in the given slot, each slot offsets the host ports by it's
+# number so containers of the same app don't collide on them
+@traced()
+def app_container_run(app_json, container_number, image_name, version_name):
+    port_binds = dict()
+    port_list = []
+    for x in app_json["starting_ports"]:
+        if isinstance(x, int):
+            port_binds[x] = x + container_number - 1
+            port_list.append(x)
+        elif isinstance(x, dict):
+            for host_port, container_port in x.items():
+                port_binds[int(container_port)] = int(host_port) + container_number - 1
+                port_list.append(container_port)
+        else:
+            print("starting ports can only a list containing intgers or dicts - dropping worker")
+            os._exit(2)
+    return {
+        "app_name": app_json["app_name"],
+        "container_name": app_json["app_name"] + "-" + str(container_number),
+        "image_name": image_name,
+        "bind_port": port_binds,
+        "ports": port_list,
+        "env_vars": app_json["env_vars"],
+        "version_tag": version_name,
+        "volumes": app_json["volumes"],
+        "devices": app_json["devices"],
+        "privileged": app_json["privileged"],
+        "networks": app_json["networks"],
+        "restart_policy": "unless-stopped",
+        "spec_hash": app_spec_fingerprint(app_json)
+    }
+
+
 # figure out how many containers are needed
+@traced()
 def containers_required(app_json):
     for scale_type, scale_amount in app_json["containers_per"].items():
         if scale_type == "cpu":
@@ -180,35 +310,286 @@ def containers_required(app_json):
     return containers_needed
 
 
+# check if the containers of an app are exactly the ones it's config asks for - a running container in each slot which
+# was created from the same app spec
+@traced()
+def containers_match_spec(app_json, containers_list):
+    spec_hash = app_spec_fingerprint(app_json)
+    required_container_names = set(app_json["app_name"] + "-" + str(container_number)
+                                   for container_number in range(1, containers_required(app_json) + 1))
+    container_names = [container["Names"][0].lstrip("/") for container in containers_list]
+    if len(container_names) != len(required_container_names) or set(container_names) != required_container_names:
+        return False
+    for container in containers_list:
+        if container["Labels"].get(SPEC_HASH_LABEL) != spec_hash or container["State"] != "running":
+            return False
+    return True
+
+
+# return the slot number of an app container from it's name, None if it's not named after a slot of the app
+def app_container_number(app_json, container):
+    container_name = container["Names"][0].lstrip("/")
+    slot_prefix = app_json["app_name"] + "-"
+    if container_name.startswith(slot_prefix) is False or container_name[len(slot_prefix):].isdigit() is False:
+        return None
+    return int(container_name[len(slot_prefix):])
+
+
+# check if the containers of an app only need scaling rather then replacing - the app is set to run & each of it's
+# containers is a running container in a slot of the app which was created from the same app spec & runs the current
+# local version of it's image (which a restart would have pulled)
+@traced()
+def containers_scalable(app_json, image_name, version_name, containers_list):
+    if app_json["running"] is False or len(containers_list) == 0:
+        return False
+    spec_hash = app_spec_fingerprint(app_json)
+    image_id = docker_socket.get_local_image_id(image_name + ":" + version_name)
+    if image_id is None:
+        return False
+    for container in containers_list:
+        if app_container_number(app_json, container) is None or container["State"] != "running" or \
+                container["Labels"].get(SPEC_HASH_LABEL) != spec_hash or container.get("ImageID") != image_id:
+            return False
+    return True
+
+
+# scale an app in place - start only the missing slots & stop only the surplus highest numbered slots leaving every
+# other container as is, returns False without touching anything if the containers need replacing instead
+@traced()
+def scale_containers(app_json, image_name, version_name, containers_list=None):
+    if containers_list is None:
+        containers_list = docker_socket.list_containers(app_json["app_name"], container_type="app")
+    if containers_scalable(app_json, image_name, version_name, containers_list) is False:
+        return False
+    containers_needed = containers_required(app_json)
+    containers_by_number = dict((app_container_number(app_json, container), container)
+                                for container in containers_list)
+    missing_container_numbers = [container_number for container_number in range(1, containers_needed + 1)
+                                 if container_number not in containers_by_number]
+    surplus_container_numbers = sorted([container_number for container_number in containers_by_number
+                                        if container_number > containers_needed], reverse=True)
+    if len(missing_container_numbers) == 0 and len(surplus_container_numbers) == 0:
+        print("app " + app_json["app_name"] + " containers already match it's config, skipping restarting them")
+        metrics.counter("nebula_worker_restarts_skipped_total",
+                        "App restarts\\rolls skipped as the app containers already matched it's config").inc()
+        return True
+    print("scaling app " + app_json["app_name"] + " from " + str(len(containers_list)) + " to " +
+          str(containers_needed) + " containers")
+    docker_socket.stop_and_remove_containers([containers_by_number[container_number]["Id"]
+                                              for container_number in surplus_container_numbers])
+    docker_socket.run_containers([app_container_run(app_json, container_number, image_name, version_name)
+                                  for container_number in missing_container_numbers])
+    metrics.counter("nebula_worker_app_scales_total", "App restarts\\rolls done by only adding\\removing containers",
+                    label_names=("direction",)).inc(direction="up" if len(missing_container_numbers) > 0 else "down")
+    return True
+
+
+# adopt the app containers which already match the device_group config & only replace the rest, used on boot instead
+# of stopping every container so restarting the worker doesn't restart the apps it manages
+@traced()
+def adopt_containers(device_group_info_reply):
+    containers_by_app = {}
+    for container in docker_socket.list_containers(container_type="app"):
+        containers_by_app.setdefault(container["Labels"].get("app_name"), []).append(container)
+    for nebula_app in device_group_info_reply["apps"]:
+        app_containers = containers_by_app.pop(nebula_app["app_name"], [])
+        if nebula_app["running"] is False:
+            if len(app_containers) > 0:
+                print("stopping app " + nebula_app["app_name"] + " as it's set to not run")
+                app_reconcile_executor.submit(nebula_app["app_name"], stop_containers, nebula_app)
+        elif len(app_containers) == 0:
+            print(("initial start of " + nebula_app["app_name"] + " app"))
+            app_reconcile_executor.submit(nebula_app["app_name"], start_containers, nebula_app)
+        elif containers_match_spec(nebula_app, app_containers) is True:
+            print("adopting the " + str(len(app_containers)) + " running containers of app " +
+                  nebula_app["app_name"])
+        else:
+            print("replacing the containers of app " + nebula_app["app_name"] + " as they don't match it's config")
+            app_reconcile_executor.submit(nebula_app["app_name"], restart_containers, nebula_app)
+    # remove the containers of apps which are no longer part of the device_group
+    leftover_containers = [container["Id"] for app_containers in containers_by_app.values()
+                           for container in app_containers]
+    if len(leftover_containers) > 0:
+        print("removing " + str(len(leftover_containers)) + " containers of apps no longer in the device_group")
+        docker_socket.stop_and_remove_containers(leftover_containers)
+
+
+# start all apps that are set to running on boot & wait until they started, if adopt is True the containers which
+# already match their config are adopted rather then stopped & started again
+@traced()
+def start_apps_on_boot(device_group_info_reply, adopt=False):
+    if adopt is True:
+        adopt_containers(device_group_info_reply)
+    else:
+        for nebula_app in device_group_info_reply["apps"]:
+            if nebula_app["running"] is True:
+                print(("initial start of " + nebula_app["app_name"] + " app"))
+                app_reconcile_executor.submit(nebula_app["app_name"], start_containers, nebula_app)
+    app_reconcile_executor.wait_until_idle()
+
+
+# add all cron_jobs that are included in the device_group to this worker schedule
+def schedule_cron_jobs(device_group_info_reply):
+    for nebula_cron_job in device_group_info_reply["cron_jobs"]:
+        if nebula_cron_job["running"] is True:
+            print(("adding cron of " + nebula_cron_job["cron_job_name"] + " cron job"))
+            cron_job_configs[nebula_cron_job["cron_job_name"]] = nebula_cron_job
+            cron_scheduler.add_cron_job(nebula_cron_job["cron_job_name"], nebula_cron_job["schedule"])
+            print(("added initial cron of " + nebula_cron_job["cron_job_name"] + " cron job"))
+
+
+# diff the device_group configuration against the locally applied one & apply the add\stop\restart\roll\cron changes
+# the diff found in the order they were planned, if the whole reply is unchanged this costs a single hash comparison &
+# if the manager reported it's unchanged since the last check-in the index of the last check-in
+# (remote_device_group_index) is reused without even hashing it, returns the reconcile plan & the index of the remote
+# device_group configuration
+@traced()
+def reconcile_device_group(local_device_group_index, remote_device_group_info, remote_device_group_index=None):
+    if remote_device_group_info.get("not_modified") is not True or remote_device_group_index is None:
+        remote_device_group_index = DeviceGroupIndex(remote_device_group_info["reply"])
+    reconcile_plan = plan_device_group_changes(local_device_group_index, remote_device_group_index)
+    for reconcile_action in reconcile_plan:
+        apply_reconcile_action(reconcile_action)
+    return reconcile_plan, remote_device_group_index
+
+
 # prune unused images
+@traced()
 def prune_images():
     docker_socket.prune_images()
 
 
+# the images of the cron_jobs which are due to run in the next seconds seconds, the image gc doesn't remove them as
+# they are about to be needed
+def cron_job_images_due_within(seconds):
+    cron_job_images = []
+    for cron_job_name in cron_scheduler.cron_jobs_due_within(seconds):
+        cron_job_config = cron_job_configs.get(cron_job_name)
+        if cron_job_config is not None:
+            image_registry_name, image_name, version_name = split_container_name_version(
+                cron_job_config["docker_image"])
+            cron_job_images.append(image_name + ":" + str(version_name))
+    return cron_job_images
+
+
 # prune exited containers
+@traced()
 def prune_exited_containers(filters=None):
     return docker_socket.prune_exited_containers(filters=filters)
 
 
-# loop forever and in any case where a container healthcheck shows a container as unhealthy restart it
-def restart_unhealthy_containers():
+# run a cron_job container once it's scheduled time arrives, called by the cron scheduler in a thread of it's own
+@traced()
+def run_scheduled_cron_job(cron_job_name):
+    cron_job_config = cron_job_configs.get(cron_job_name)
+    if cron_job_config is None:
+        return
+    start_cron_job_container(cron_job_config)
+    # clean previous completed cron containers
+    prune_exited_containers(filters={"label": ["orchestrator=nebula", "container_type=cron_job"]})
+
+
+# apply a single action of a device_group reconcile plan
+@traced()
+def apply_reconcile_action(reconcile_action):
+    # app operations are handed to the app reconcile executor so independent apps are changed in parallel without
+    # blocking the check-in loop
+    if reconcile_action.action == ADD_APP:
+        print("restarting app " + reconcile_action.name + " do to changes in the app configuration")
+        app_reconcile_executor.submit(reconcile_action.name, restart_containers, reconcile_action.config)
+    elif reconcile_action.action == STOP_APP:
+        print("stopping app " + reconcile_action.name + " do to changes in the app configuration")
+        app_reconcile_executor.submit(reconcile_action.name, stop_containers, reconcile_action.config)
+    elif reconcile_action.action == ROLL_APP:
+        print("rolling app " + reconcile_action.name + " do to changes in the app configuration")
+        app_reconcile_executor.submit(reconcile_action.name, roll_containers, reconcile_action.config,
+                                      force_restart=reconcile_action.force or restart_skip_unchanged is False)
+    elif reconcile_action.action == RESTART_APP:
+        print("restarting app " + reconcile_action.name + " do to changes in the app configuration")
+        app_reconcile_executor.submit(reconcile_action.name, restart_containers, reconcile_action.config,
+                                      force_restart=reconcile_action.force or restart_skip_unchanged is False)
+    elif reconcile_action.action == REMOVE_APP:
+        print("removing app " + reconcile_action.name + " do to changes in the app configuration")
+        app_reconcile_executor.submit(reconcile_action.name, stop_containers, reconcile_action.config)
+    elif reconcile_action.action == ADD_CRON_JOB or reconcile_action.action == UPDATE_CRON_JOB:
+        print("updating cron_job " + reconcile_action.name + " schedule do to changes in the app configuration")
+        cron_job_configs[reconcile_action.name] = reconcile_action.config
+        cron_scheduler.update_cron_job(reconcile_action.name, reconcile_action.config["schedule"])
+    elif reconcile_action.action == REMOVE_CRON_JOB:
+        print("removing cron_job " + reconcile_action.name + " schedule do to changes in the app configuration")
+        cron_scheduler.remove_cron_job(reconcile_action.name)
+        cron_job_configs.pop(reconcile_action.name, None)
+    elif reconcile_action.action == PRUNE_IMAGES:
+        # wait for in flight app changes first so images which were just pulled but not yet used won't be pruned
+        print("pruning images do to changes in the app configuration")
+        app_reconcile_executor.wait_until_idle()
+        prune_images()
+
+
+# get the device_group info, failures are retried by the callers with the check-in scheduler backoff
+@traced()
+def get_device_group_info(nebula_connection_object, device_group_to_get_info):
+    with metrics.histogram("nebula_worker_manager_fetch_duration_seconds",
+                           "Latency of getting the device_group info from the nebula manager").time():
+        return nebula_connection_object.list_device_group_info(device_group_to_get_info)
+
+
+# get the device_group info retrying failed attempts, used on boot where there is no device_group config to keep
+# running meanwhile so it gives up after attempts failed attempts in a row, the waits between them grow exponentially
+# from 0.2 seconds up to max_wait seconds which by default keeps the whole retry budget to about 8 seconds
+def get_device_group_info_with_retries(nebula_connection_object, device_group_to_get_info, attempts=10, max_wait=1):
+    failed_attempts = 0
+    while True:
+        try:
+            device_group_info = get_device_group_info(nebula_connection_object, device_group_to_get_info)
+            check_in_scheduler.check_in_succeeded()
+            return device_group_info
+        except ReplayFinished:
+            raise
+        except Exception as e:
+            failed_attempts += 1
+            if failed_attempts >= attempts:
+                raise
+            print(e, file=sys.stderr)
+            print("failed getting the device_group info from the nebula manager - retrying")
+            time.sleep(min(0.2 * 2 ** failed_attempts, max_wait))
+
+
+# register the gauges of the host figures, they are read from the latest host sample on each scrape of the metrics
+# endpoint
+def register_host_metrics(host_sampler):
+    metrics.gauge("nebula_worker_host_cpu_cores", "Number of cpu cores on the host").set_function(
+        get_number_of_cpu_cores)
+    metrics.gauge("nebula_worker_host_cpu_usage_percent", "Cpu usage percentage of the host").set_function(
+        lambda: host_sampler.latest().cpu_percent)
+    metrics.gauge("nebula_worker_host_memory_total_mb", "Total memory of the host in mb").set_function(
+        lambda: host_sampler.latest().memory_total_mb)
+    metrics.gauge("nebula_worker_host_memory_used_mb", "Used memory of the host in mb").set_function(
+        lambda: host_sampler.latest().memory_used_mb)
+    metrics.gauge("nebula_worker_host_memory_available_mb", "Available memory of the host in mb").set_function(
+        lambda: host_sampler.latest().memory_available_mb)
+    metrics.gauge("nebula_worker_host_root_disk_total_mb", "Total size of the host root disk in mb").set_function(
+        lambda: host_sampler.latest().root_disk_total_mb)
+    metrics.gauge("nebula_worker_host_root_disk_used_mb", "Used space of the host root disk in mb").set_function(
+        lambda: host_sampler.latest().root_disk_used_mb)
+    metrics.gauge("nebula_worker_host_load_1m", "1 minute load average of the host").set_function(
+        lambda: host_sampler.latest().load_1m)
+
+
+# dump the recorded tracing spans to a file on SIGUSR1
+def dump_trace(signal_number, frame):
     try:
-        while True:
-            time.sleep(10)
-            nebula_containers = docker_socket.list_containers(container_type="app")
-            for nebula_container in nebula_containers:
-                if docker_socket.check_container_healthy(nebula_container["Id"]) is False:
-                    docker_socket.restart_container(nebula_container["Id"])
+        tracer.dump_to_file(tracing_dump_path, trace_format=tracing_dump_format)
     except Exception as e:
         print(e, file=sys.stderr)
-        print("failed checking containers health")
-        os._exit(2)
+        print("failed dumping tracing spans to " + tracing_dump_path)
 
 
-# retry getting the device_group info
-@retry(wait_exponential_multiplier=200, wait_exponential_max=1000, stop_max_attempt_number=10)
-def get_device_group_info(nebula_connection_object, device_group_to_get_info):
-    return nebula_connection_object.list_device_group_info(device_group_to_get_info)
+# flush the queued reports to kafka before exiting on SIGTERM
+def flush_reports_and_exit(signal_number, frame):
+    print("received SIGTERM - flushing queued reports to kafka before exiting")
+    report_sender.close(timeout=reporting_flush_timeout)
+    os._exit(0)
 
 
 if __name__ == "__main__":
@@ -230,13 +611,44 @@ if __name__ == "__main__":
         nebula_manager_uri = parser.read_configuration_variable("nebula_manager_uri", default_value=None)
         nebula_manager_request_timeout = parser.read_configuration_variable("nebula_manager_request_timeout",
                                                                             default_value=60)
+        nebula_manager_conditional_fetch = parser.read_configuration_variable("nebula_manager_conditional_fetch",
+                                                                              default_value=True)
         nebula_manager_check_in_time = parser.read_configuration_variable("nebula_manager_check_in_time",
                                                                           default_value=30)
+        check_in_jitter = parser.read_configuration_variable("check_in_jitter", default_value=0.2)
+        check_in_initial_splay = parser.read_configuration_variable("check_in_initial_splay", default_value=True)
+        check_in_fast_interval = parser.read_configuration_variable("check_in_fast_interval", default_value=10)
+        check_in_fast_duration = parser.read_configuration_variable("check_in_fast_duration", default_value=60)
+        check_in_idle_after = parser.read_configuration_variable("check_in_idle_after", default_value=10)
+        check_in_idle_backoff = parser.read_configuration_variable("check_in_idle_backoff", default_value=1)
+        check_in_max_interval = parser.read_configuration_variable("check_in_max_interval", default_value=None)
+        check_in_slow_threshold = parser.read_configuration_variable("check_in_slow_threshold", default_value=5)
+        check_in_error_backoff_base = parser.read_configuration_variable("check_in_error_backoff_base",
+                                                                         default_value=1)
+        check_in_error_backoff_max = parser.read_configuration_variable("check_in_error_backoff_max",
+                                                                        default_value=300)
+        boot_retry_attempts = parser.read_configuration_variable("boot_retry_attempts", default_value=10)
+        boot_retry_max_wait = parser.read_configuration_variable("boot_retry_max_wait", default_value=1)
         registry_auth_user = parser.read_configuration_variable("registry_auth_user", default_value=None)
         registry_auth_password = parser.read_configuration_variable("registry_auth_password", default_value=None)
         registry_host = parser.read_configuration_variable("registry_host", default_value="https://index.docker.io/v1/")
         max_restart_wait_in_seconds = parser.read_configuration_variable("max_restart_wait_in_seconds", default_value=0)
         device_group = parser.read_configuration_variable("device_group", required=True)
+        reconcile_max_concurrency = parser.read_configuration_variable("reconcile_max_concurrency", default_value=4)
+        image_digest_cache_ttl = parser.read_configuration_variable("image_digest_cache_ttl", default_value=300)
+        image_pull_progress_interval = parser.read_configuration_variable("image_pull_progress_interval",
+                                                                          default_value=5)
+        docker_async_backend = parser.read_configuration_variable("docker_async_backend", default_value=False)
+        docker_async_max_connections = parser.read_configuration_variable("docker_async_max_connections",
+                                                                          default_value=32)
+        rolling_restart_batch_size = parser.read_configuration_variable("rolling_restart_batch_size", default_value=1)
+        rolling_restart_ready_timeout = parser.read_configuration_variable("rolling_restart_ready_timeout",
+                                                                           default_value=60)
+        restart_create_before_stop = parser.read_configuration_variable("restart_create_before_stop",
+                                                                        default_value=False)
+        restart_skip_unchanged = parser.read_configuration_variable("restart_skip_unchanged", default_value=True)
+        health_check_reconcile_interval = parser.read_configuration_variable("health_check_reconcile_interval",
+                                                                             default_value=60)
 
         # the following config variables are for configuring Nebula workers optional reporting, being optional none of it
         # is mandatory
@@ -258,6 +670,97 @@ if __name__ == "__main__":
         kafka_sasl_kerberos_domain_name = parser.read_configuration_variable("kafka_sasl_kerberos_domain_name",
                                                                              default_value="kafka")
         kafka_topic = parser.read_configuration_variable("kafka_topic", default_value="nebula-reports")
+        report_format = parser.read_configuration_variable("report_format", default_value="full")
+        report_full_snapshot_every = parser.read_configuration_variable("report_full_snapshot_every",
+                                                                        default_value=10)
+        reporting_stats_sync_interval = parser.read_configuration_variable("reporting_stats_sync_interval",
+                                                                           default_value=10)
+        reporting_stats_max_containers = parser.read_configuration_variable("reporting_stats_max_containers",
+                                                                            default_value=1000)
+        kafka_compression_type = parser.read_configuration_variable("kafka_compression_type", default_value=None)
+        if kafka_compression_type_supported(kafka_compression_type) is False:
+            print("kafka_compression_type " + str(kafka_compression_type) + " isn't supported - it has to be one of "
+                  "gzip, snappy, lz4 or zstd & the python-snappy, lz4 or zstandard package it requires has to be "
+                  "installed")
+            os._exit(2)
+        kafka_linger_ms = parser.read_configuration_variable("kafka_linger_ms", default_value=0)
+        kafka_batch_size = parser.read_configuration_variable("kafka_batch_size", default_value=16384)
+        kafka_buffer_memory = parser.read_configuration_variable("kafka_buffer_memory", default_value=33554432)
+        kafka_max_block_ms = parser.read_configuration_variable("kafka_max_block_ms", default_value=60000)
+        reporting_queue_size = parser.read_configuration_variable("reporting_queue_size", default_value=100)
+        reporting_queue_drop_policy = parser.read_configuration_variable("reporting_queue_drop_policy",
+                                                                         default_value="oldest")
+        reporting_flush_timeout = parser.read_configuration_variable("reporting_flush_timeout", default_value=10)
+        reporting_spool_directory = parser.read_configuration_variable("reporting_spool_directory", default_value=None)
+        reporting_spool_segment_max_bytes = parser.read_configuration_variable("reporting_spool_segment_max_bytes",
+                                                                               default_value=1048576)
+        reporting_spool_max_bytes = parser.read_configuration_variable("reporting_spool_max_bytes",
+                                                                       default_value=104857600)
+        reporting_spool_retry_interval = parser.read_configuration_variable("reporting_spool_retry_interval",
+                                                                            default_value=5)
+        metrics_port = parser.read_configuration_variable("metrics_port", default_value=None)
+        host_sample_interval = parser.read_configuration_variable("host_sample_interval", default_value=1)
+        host_sample_buffer_size = parser.read_configuration_variable("host_sample_buffer_size", default_value=3600)
+        record_traffic_file = parser.read_configuration_variable("record_traffic_file", default_value=None)
+        replay_traffic_file = parser.read_configuration_variable("replay_traffic_file", default_value=None)
+        replay_speed = parser.read_configuration_variable("replay_speed", default_value=1.0)
+        adopt_containers_on_boot = parser.read_configuration_variable("adopt_containers_on_boot", default_value=True)
+        container_inventory_enabled = parser.read_configuration_variable("container_inventory_enabled",
+                                                                         default_value=True)
+        container_inventory_resync_interval = parser.read_configuration_variable(
+            "container_inventory_resync_interval", default_value=300)
+        image_gc_enabled = parser.read_configuration_variable("image_gc_enabled", default_value=True)
+        image_gc_high_water_mark = parser.read_configuration_variable("image_gc_high_water_mark", default_value=85)
+        image_gc_low_water_mark = parser.read_configuration_variable("image_gc_low_water_mark", default_value=70)
+        image_gc_interval = parser.read_configuration_variable("image_gc_interval", default_value=60)
+        image_gc_min_unused_seconds = parser.read_configuration_variable("image_gc_min_unused_seconds",
+                                                                         default_value=300)
+        image_gc_cron_protect_seconds = parser.read_configuration_variable("image_gc_cron_protect_seconds",
+                                                                           default_value=900)
+        worker_state_file = parser.read_configuration_variable("worker_state_file", default_value=None)
+        tracing_enabled = parser.read_configuration_variable("tracing_enabled", default_value=False)
+        tracing_buffer_size = parser.read_configuration_variable("tracing_buffer_size", default_value=10000)
+        tracing_dump_path = parser.read_configuration_variable("tracing_dump_path",
+                                                               default_value="/tmp/nebula-worker-trace.json")
+        tracing_dump_format = parser.read_configuration_variable("tracing_dump_format", default_value="chrome")
+
+        # optionally record timed spans of the reconcile, docker & manager calls, they are dumped to tracing_dump_path
+        # on SIGUSR1 & served on /trace of the metrics endpoint
+        tracer.configure(enabled=tracing_enabled, buffer_size=tracing_buffer_size)
+        if tracing_enabled is True:
+            signal.signal(signal.SIGUSR1, dump_trace)
+
+        # sample the host usage in the background so reports & metrics read it from memory
+        host_sampler = HostSampler(sample_interval=host_sample_interval, buffer_size=host_sample_buffer_size)
+        host_sampler.start()
+
+        # optionally serve prometheus style metrics of the worker on http://<host>:<metrics_port>/metrics
+        if metrics_port is not None:
+            register_host_metrics(host_sampler)
+            start_metrics_server(int(metrics_port))
+
+        # optionally record the nebula manager replies & the docker API traffic to a file or replay such a recording
+        # instead of talking to a live manager & docker engine, the asyncio docker backend bypasses the recorded docker
+        # client & the containers inventory lists containers outside of the recorded calls so both are disabled while
+        # recording\replaying, as is the image gc which calls docker on a timer of it's own
+        traffic_recorder = None
+        traffic_replay = None
+        if replay_traffic_file is not None:
+            print("replaying recorded nebula manager & docker traffic from " + replay_traffic_file + " at x" +
+                  str(replay_speed) + " speed")
+            traffic_replay = TrafficReplay(replay_traffic_file, speed=replay_speed)
+            docker_async_backend = False
+            container_inventory_enabled = False
+            image_gc_enabled = False
+            # the check-ins are paced by the recorded timing of the manager replies
+            nebula_manager_check_in_time = 0
+            check_in_initial_splay = False
+        elif record_traffic_file is not None:
+            print("recording nebula manager & docker traffic to " + record_traffic_file)
+            traffic_recorder = TrafficRecorder(record_traffic_file)
+            docker_async_backend = False
+            container_inventory_enabled = False
+            image_gc_enabled = False
 
         # get number of cpu cores on host
         cpu_cores = get_number_of_cpu_cores()
@@ -266,7 +769,26 @@ if __name__ == "__main__":
         total_memory_size_in_mb = get_total_memory_size_in_mb()
 
         # work against docker socket
-        docker_socket = DockerFunctions()
+        # optionally start & stop batches of containers on an asyncio backend rather then with a thread per container
+        docker_async_socket = None
+        if docker_async_backend is True:
+            print("starting asyncio docker backend")
+            docker_async_socket = AsyncDockerFunctions(max_connections=docker_async_max_connections,
+                                                       pull_progress_interval=image_pull_progress_interval).start()
+        docker_socket = DockerFunctions(pull_progress_interval=image_pull_progress_interval,
+                                        async_backend=docker_async_socket, traffic_recorder=traffic_recorder,
+                                        docker_client=ReplayProxy(traffic_replay, "docker")
+                                        if traffic_replay is not None else None)
+
+        # list the containers from an in memory inventory kept fresh by the docker events stream rather then asking
+        # docker for each app separately
+        if container_inventory_enabled is True:
+            print("building the containers inventory")
+            container_inventory = ContainerInventory(docker_socket, resync_interval=container_inventory_resync_interval)
+            container_inventory.start()
+            docker_socket.container_inventory = container_inventory
+            metrics.gauge("nebula_worker_inventory_containers", "Containers in the containers inventory").set_function(
+                lambda: len(container_inventory.containers))
 
         # ensure default "nebula" named network exists
         docker_socket.create_docker_network("nebula", "bridge")
@@ -276,11 +798,33 @@ if __name__ == "__main__":
         docker_socket.registry_login(registry_host=registry_host, registry_user=registry_auth_user,
                                      registry_pass=registry_auth_password)
 
+        # pulls go through the pull manager which skips up to date images & dedups concurrent pulls of the same image
+        image_puller = ImagePullManager(docker_socket, digest_cache_ttl=image_digest_cache_ttl)
+
         # login to the nebula manager
         nebula_connection = Nebula(username=nebula_manager_auth_user, password=nebula_manager_auth_password,
                                    host=nebula_manager_host, port=nebula_manager_port, protocol=nebula_manager_protocol,
                                    host_uri=nebula_manager_uri, request_timeout=nebula_manager_request_timeout,
                                    token=nebula_manager_auth_token)
+        # get the device_group info over a keep-alive session with gzip & conditional requests so an unchanged
+        # device_group costs a 304 (or a bytes comparison) rather then downloading & parsing the whole config
+        if nebula_manager_conditional_fetch is True and traffic_replay is None:
+            nebula_connection = DeviceGroupFetcher(nebula_connection)
+        if traffic_replay is not None:
+            nebula_connection = ReplayProxy(traffic_replay, "manager")
+        elif traffic_recorder is not None:
+            nebula_connection = RecordingProxy(nebula_connection, traffic_recorder, "manager")
+
+        # decides the wait before each check-in - jittered, shorter for a while after a change, longer while nothing
+        # changes & backing off while the manager is slow or failing
+        check_in_scheduler = CheckInScheduler(check_in_interval=nebula_manager_check_in_time, jitter=check_in_jitter,
+                                              initial_splay=check_in_initial_splay,
+                                              fast_interval=check_in_fast_interval,
+                                              fast_duration=check_in_fast_duration, idle_after=check_in_idle_after,
+                                              idle_backoff=check_in_idle_backoff, max_interval=check_in_max_interval,
+                                              slow_threshold=check_in_slow_threshold,
+                                              error_backoff_base=check_in_error_backoff_base,
+                                              error_backoff_max=check_in_error_backoff_max)
 
         # make sure the nebula manager connects properly
         try:
@@ -297,46 +841,97 @@ if __name__ == "__main__":
                   "that the manager is online")
             os._exit(2)
 
-        # stop all nebula managed containers on start to ensure a clean slate to work on
-        print("stopping all preexisting nebula managed app containers in order to ensure a clean slate on boot")
-        stop_containers({"app_name": ""}, container_type="all")
+        # the last device_group config applied before the worker was restarted, if there is one, only kept if a
+        # worker_state_file is configured & it has to be on a volume mounted into the worker container for it to survive
+        # the worker container being recreated
+        worker_state = WorkerStateFile(worker_state_file)
+        previous_device_group_info = worker_state.load()
 
-        # get the initial device_group configuration and store it in memory
-        local_device_group_info = get_device_group_info(nebula_connection, device_group)
+        # unless adopting the containers which are already running stop all nebula managed containers on start to
+        # ensure a clean slate to work on
+        if adopt_containers_on_boot is False:
+            print("stopping all preexisting nebula managed app containers in order to ensure a clean slate on boot")
+            stop_containers({"app_name": ""}, container_type="all")
+
+        # get the initial device_group configuration and store it in memory, if the manager can't be reached keep
+        # running the last applied config until it can be
+        try:
+            local_device_group_info = get_device_group_info_with_retries(nebula_connection, device_group,
+                                                                         attempts=boot_retry_attempts,
+                                                                         max_wait=boot_retry_max_wait)
+        except ReplayFinished:
+            raise
+        except Exception as e:
+            if adopt_containers_on_boot is False or previous_device_group_info is None:
+                raise
+            print(e, file=sys.stderr)
+            print("failed getting the device_group info from the nebula manager - starting from the last applied "
+                  "device_group config")
+            local_device_group_info = previous_device_group_info
 
         # make sure the device_group exists in the nebula cluster
         while local_device_group_info["status_code"] == 403 and \
                 local_device_group_info["reply"]["device_group_exists"] is False:
             print(("device_group " + device_group + " doesn't exist in nebula cluster, waiting for it to be created"))
-            local_device_group_info = get_device_group_info(nebula_connection, device_group)
-            time.sleep(nebula_manager_check_in_time)
+            local_device_group_info = get_device_group_info_with_retries(nebula_connection, device_group,
+                                                                         attempts=boot_retry_attempts,
+                                                                         max_wait=boot_retry_max_wait)
+            time.sleep(check_in_scheduler.next_delay())
 
-        # start all apps that are set to running on boot
-        for nebula_app in local_device_group_info["reply"]["apps"]:
-            if nebula_app["running"] is True:
-                print(("initial start of " + nebula_app["app_name"] + " app"))
-                start_containers(nebula_app)
-                print(("completed initial start of " + nebula_app["app_name"] + " app"))
+        # start the executor which runs the changes of different apps in parallel
+        app_reconcile_executor = AppReconcileExecutor(max_concurrency=reconcile_max_concurrency)
+        metrics.gauge("nebula_worker_reconcile_queue_depth",
+                      "App changes either running or queued").set_function(app_reconcile_executor.in_flight)
 
-        # start the object which will manage cron_jobs
-        cron_job_object = CronJobs()
-        cron_next_run_dict = {}
+        # start all apps that are set to running on boot, adopting the containers which already match their config
+        start_apps_on_boot(local_device_group_info["reply"], adopt=adopt_containers_on_boot)
+        print("completed initial start of all apps")
+
+        # prune images if a prune was requested while the worker was down
+        if previous_device_group_info is not None and local_device_group_info["reply"]["prune_id"] > \
+                previous_device_group_info["reply"]["prune_id"]:
+            print("pruning images do to changes in the app configuration while the worker was down")
+            prune_images()
+        worker_state.save(local_device_group_info)
+
+        # start the scheduler which will run cron_jobs at their scheduled time independently of the check-in loop
+        cron_scheduler = CronScheduler(run_scheduled_cron_job)
+        cron_job_configs = {}
 
         # add all cron_jobs that are included in the device_group to this worker schedule
-        for nebula_cron_job in local_device_group_info["reply"]["cron_jobs"]:
-            if nebula_cron_job["running"] is True:
-                print(("adding cron of " + nebula_cron_job["cron_job_name"] + " cron job"))
-                cron_next_run_dict[nebula_cron_job["cron_job_name"]] = cron_job_object.add_cron_job(
-                    nebula_cron_job["cron_job_name"], nebula_cron_job["schedule"])
-                print(("added initial cron of " + nebula_cron_job["cron_job_name"] + " cron job"))
+        schedule_cron_jobs(local_device_group_info["reply"])
+        print("starting cron_jobs scheduler thread")
+        cron_scheduler.start()
+
+        # remove the least recently used images once the root disk fills up rather then waiting for a prune_id bump,
+        # keeping the images of cron_jobs which are about to run
+        if image_gc_enabled is True:
+            print("starting image gc thread")
+            image_gc = ImageGarbageCollector(docker_socket, high_water_mark=image_gc_high_water_mark,
+                                             low_water_mark=image_gc_low_water_mark, check_interval=image_gc_interval,
+                                             min_unused_seconds=image_gc_min_unused_seconds,
+                                             protected_images_function=lambda: cron_job_images_due_within(
+                                                 image_gc_cron_protect_seconds))
+            image_puller.image_gc = image_gc
+            image_gc.start()
 
-        # open a thread which is in charge of restarting any containers which health check shows them as unhealthy
-        print("starting work container health checking thread")
-        Thread(target=restart_unhealthy_containers).start()
+        # index the initial device_group configuration so each check-in only has to diff against it
+        local_device_group_index = DeviceGroupIndex(local_device_group_info["reply"])
+
+        # start the health monitor which restarts any containers which health check shows them as unhealthy, it reacts
+        # to the docker events stream & periodically reconciles against a single filtered list of unhealthy containers
+        print("starting work container health monitoring threads")
+        health_monitor = HealthMonitor(docker_socket, reconcile_interval=health_check_reconcile_interval)
+        health_monitor.start()
 
         # if the optional reporting system is configured start a kafka connection object that will be used to send the
         # reports to
         if kafka_bootstrap_servers is not None:
+            # the compact report format sends projected stats & deltas between periodic full snapshots, the report
+            # sender has the encoder send a snapshot next whenever a report is lost so consumers can resync
+            report_encoder = None
+            if report_format == "compact":
+                report_encoder = CompactReportEncoder(full_snapshot_every=report_full_snapshot_every)
             try:
                 print("creating reporting kafka connection object")
                 kafka_connection = KafkaConnection(kafka_bootstrap_servers,
@@ -351,7 +946,27 @@ if __name__ == "__main__":
                                                    ssl_crlfile=kafka_ssl_crlfile,
                                                    sasl_kerberos_service_name=kafka_sasl_kerberos_service_name,
                                                    sasl_kerberos_domain_name=kafka_sasl_kerberos_domain_name,
-                                                   topic=kafka_topic)
+                                                   topic=kafka_topic,
+                                                   compression_type=kafka_compression_type,
+                                                   linger_ms=kafka_linger_ms,
+                                                   batch_size=kafka_batch_size,
+                                                   buffer_memory=kafka_buffer_memory,
+                                                   max_block_ms=kafka_max_block_ms)
+                # reports are handed to kafka from a thread of their own so a slow broker never holds up the check-in
+                # loop, on SIGTERM whatever reports are still queued are flushed before exiting
+                # if configured reports kafka failed to deliver are spooled to disk & replayed once it recovers
+                report_spool = None
+                if reporting_spool_directory is not None:
+                    report_spool = ReportSpool(reporting_spool_directory,
+                                               segment_max_bytes=reporting_spool_segment_max_bytes,
+                                               max_total_bytes=reporting_spool_max_bytes)
+                report_sender = ReportSender(kafka_connection, queue_size=reporting_queue_size,
+                                             drop_policy=reporting_queue_drop_policy, report_spool=report_spool,
+                                             spool_retry_interval=reporting_spool_retry_interval,
+                                             report_encoder=report_encoder).start()
+                signal.signal(signal.SIGTERM, flush_reports_and_exit)
+                metrics.gauge("nebula_worker_reporting_queue_depth",
+                              "Reports waiting to be handed to kafka").set_function(report_sender.queue_depth)
             except Exception as e:
                 print(e, file=sys.stderr)
                 if reporting_fail_hard is False:
@@ -362,7 +977,22 @@ if __name__ == "__main__":
                     os._exit(2)
 
             try:
-                reporting_object = ReportingDocument(docker_socket, device_group)
+                # keep a streaming stats subscription per container in the background so building a report doesn't
+                # have to wait on docker sampling the stats of each container in turn, the streams get a docker client
+                # of their own so they don't hold on to the connections the reconcile calls use
+                print("starting container stats collector")
+                stats_docker_socket = DockerFunctions(traffic_recorder=traffic_recorder,
+                                                      docker_client=ReplayProxy(traffic_replay, "docker")
+                                                      if traffic_replay is not None else None,
+                                                      max_pool_size=reporting_stats_max_containers)
+                stats_collector = ContainerStatsCollector(docker_socket, sync_interval=reporting_stats_sync_interval,
+                                                          max_cached_containers=reporting_stats_max_containers,
+                                                          stats_docker_connection_object=stats_docker_socket)
+                stats_collector.start()
+                reporting_object = ReportingDocument(docker_socket, device_group,
+                                                     stats_collector_object=stats_collector,
+                                                     report_encoder=report_encoder,
+                                                     host_sampler_object=host_sampler)
             except Exception as e:
                 print(e, file=sys.stderr)
                 if reporting_fail_hard is False:
@@ -375,105 +1005,50 @@ if __name__ == "__main__":
         # loop forever
         print(("starting device_group " + device_group + " /info check loop, configured to check for changes every "
               + str(nebula_manager_check_in_time) + " seconds"))
+        check_in_interval_gauge = metrics.gauge("nebula_worker_check_in_interval_seconds",
+                                                "The wait before the next check-in")
+        remote_device_group_index = None
         while True:
 
-            # wait the configurable time before checking the device_group info page again
-            time.sleep(nebula_manager_check_in_time)
-
-            monotonic_id_increase = False
-
-            # get the device_group configuration
-            remote_device_group_info = get_device_group_info(nebula_connection, device_group)
-
-            # logic that checks if each of the app_id was increased and updates the app containers if the answer is yes
-            # the logic also starts containers of newly added apps to the device_group
-            for remote_nebula_app in remote_device_group_info["reply"]["apps"]:
-                if remote_nebula_app["app_name"] in local_device_group_info["reply"]["apps_list"]:
-                    local_app_index = local_device_group_info["reply"]["apps_list"].index(remote_nebula_app["app_name"])
-                    if remote_nebula_app["app_id"] > local_device_group_info["reply"]["apps"][local_app_index]["app_id"]:
-                        monotonic_id_increase = True
-                        if remote_nebula_app["running"] is False:
-                            print("stopping app " + remote_nebula_app["app_name"] +
-                                  " do to changes in the app configuration")
-                            stop_containers(remote_nebula_app)
-                        elif remote_nebula_app["rolling_restart"] is True and \
-                                local_device_group_info["reply"]["apps"][local_app_index]["running"] is True:
-                            print("rolling app " + remote_nebula_app["app_name"] +
-                                  " do to changes in the app configuration")
-                            roll_containers(remote_nebula_app)
-                        else:
-                            print("restarting app " + remote_nebula_app["app_name"] +
-                                  " do to changes in the app configuration")
-                            restart_containers(remote_nebula_app)
-                else:
-                    print(("restarting app " + remote_nebula_app["app_name"] + " do to changes in the app "
-                                                                               "configuration"))
-                    monotonic_id_increase = True
-                    restart_containers(remote_nebula_app)
-
-            # logic that removes containers of apps that was removed from the device_group
-            if remote_device_group_info["reply"]["device_group_id"] > local_device_group_info["reply"]["device_group_id"]:
-                monotonic_id_increase = True
-                for local_nebula_app in local_device_group_info["reply"]["apps"]:
-                    if local_nebula_app["app_name"] not in remote_device_group_info["reply"]["apps_list"]:
-                        print("removing app " + local_nebula_app["app_name"] +
-                              " do to changes in the app configuration")
-                        stop_containers(local_nebula_app)
-
-            # logic that checks if each of the cron_job_id was increased and updates the cron_job containers if the
-            # answer is yes, the logic also starts containers of newly added cron_jobs to the device_group
-            for remote_nebula_cron_job in remote_device_group_info["reply"]["cron_jobs"]:
-                if remote_nebula_cron_job["cron_job_name"] in local_device_group_info["reply"]["cron_jobs_list"]:
-                    local_cron_job_index = local_device_group_info["reply"]["cron_jobs_list"].index(remote_nebula_cron_job["cron_job_name"])
-                    if remote_nebula_cron_job["cron_job_id"] > local_device_group_info["reply"]["cron_jobs"][local_cron_job_index]["cron_job_id"]:
-                        monotonic_id_increase = True
-                        if remote_nebula_cron_job["running"] is False:
-                            print("removing cron_job " + remote_nebula_cron_job["cron_job_name"] +
-                                  " schedule do to changes in the app configuration")
-                            cron_job_object.remove_cron_job(remote_nebula_cron_job["cron_job_name"])
-                            cron_next_run_dict.pop(remote_nebula_cron_job["cron_job_name"], None)
-                        else:
-                            print("updating cron_job " + remote_nebula_cron_job["cron_job_name"] +
-                                  " schedule do to changes in the app configuration")
-                            cron_next_run_dict[remote_nebula_cron_job["cron_job_name"]] = \
-                                cron_job_object.update_cron_job(remote_nebula_cron_job["cron_job_name"],
-                                                                remote_nebula_cron_job["schedule"])
-                else:
-                    monotonic_id_increase = True
-                    print("updating cron_job " + remote_nebula_cron_job["cron_job_name"] +
-                          " schedule do to changes in the app configuration")
-                    cron_next_run_dict[remote_nebula_cron_job["cron_job_name"]] = cron_job_object.add_cron_job(
-                        remote_nebula_cron_job["cron_job_name"], remote_nebula_cron_job["schedule"])
-
-            # logic that removes containers of apps that was removed from the device_group
-            if remote_device_group_info["reply"]["device_group_id"] > local_device_group_info["reply"]["device_group_id"]:
-                monotonic_id_increase = True
-                for local_nebula_cron_job in local_device_group_info["reply"]["cron_jobs"]:
-                    if local_nebula_cron_job["cron_job_name"] not in remote_device_group_info["reply"]["cron_jobs_list"]:
-                        print("removing cron_job " + local_nebula_cron_job["cron_job_name"] +
-                              " schedule do to changes in the app configuration")
-                        cron_job_object.remove_cron_job(local_nebula_cron_job["cron_job_name"])
-                        cron_next_run_dict.pop(local_nebula_cron_job["cron_job_name"], None)
-
-            # logic that starts cron_jobs according to their next scheduled run time then updates the next runtime
-            for cron_job_name, cron_job_next_run in cron_next_run_dict.items():
-                if datetime.now() > cron_job_next_run:
-                    local_cron_job_index = remote_device_group_info["reply"]["cron_jobs_list"].index(cron_job_name)
-                    cron_job_config = remote_device_group_info["reply"]["cron_jobs"][local_cron_job_index]
-                    start_cron_job_container(cron_job_config)
-                    cron_next_run_dict[cron_job_name] = cron_job_object.return_cron_job_next_runtime(cron_job_name)
-                    # clean previous completed cron containers
-                    prune_exited_containers(filters={"label": ["orchestrator=nebula", "container_type=cron_job"]})
-
-            # logic that runs image pruning if prune_id increased
-            if remote_device_group_info["reply"]["prune_id"] > local_device_group_info["reply"]["prune_id"]:
-                print("pruning images do to changes in the app configuration")
-                monotonic_id_increase = True
-                prune_images()
+            # wait the time the check-in scheduler decided on before checking the device_group info page again
+            check_in_delay = check_in_scheduler.next_delay()
+            check_in_interval_gauge.set(check_in_delay)
+            time.sleep(check_in_delay)
+            check_in_start_time = time.monotonic()
+
+            # get the device_group configuration, if the manager fails or doesn't return it keep running the current
+            # config & retry after the scheduler backoff
+            try:
+                remote_device_group_info = get_device_group_info(nebula_connection, device_group)
+                if remote_device_group_info["status_code"] != 200:
+                    raise Exception("nebula manager returned status code " +
+                                    str(remote_device_group_info["status_code"]))
+            except ReplayFinished:
+                raise
+            except Exception as e:
+                check_in_scheduler.check_in_failed()
+                metrics.counter("nebula_worker_check_in_errors_total",
+                                "Check-ins which failed getting the device_group info").inc()
+                print(e, file=sys.stderr)
+                print("failed getting the device_group info from the nebula manager - retrying after backoff")
+                continue
+            check_in_fetch_duration = time.monotonic() - check_in_start_time
+
+            # diff the device_group configuration against the locally applied one & apply the changes it found
+            reconcile_plan, remote_device_group_index = reconcile_device_group(local_device_group_index,
+                                                                               remote_device_group_info,
+                                                                               remote_device_group_index)
+            monotonic_id_increase = reconcile_plan.changed
+            check_in_scheduler.check_in_succeeded(changed=monotonic_id_increase, duration=check_in_fetch_duration)
+
+            if app_reconcile_executor.in_flight() > 0:
+                print(str(app_reconcile_executor.in_flight()) + " app changes still in progress")
 
             # set the in memory device_group info to be the one recently received if any id increased
             if monotonic_id_increase is True:
                 local_device_group_info = remote_device_group_info
+                local_device_group_index = remote_device_group_index
+                worker_state.save(local_device_group_info)
 
             # send report to the optional kafka reporting if configured to be used
             if kafka_bootstrap_servers is not None:
@@ -482,7 +1057,7 @@ if __name__ == "__main__":
                     # otherwise we will report only if report_on_update_only is false
                     if monotonic_id_increase is True or report_on_update_only is False:
                         report = reporting_object.current_status_report(local_device_group_info, monotonic_id_increase)
-                        kafka_connection.push_report(report)
+                        report_sender.queue_report(report)
                 except Exception as e:
                     print(e, file=sys.stderr)
                     if reporting_fail_hard is False:
@@ -492,6 +1067,15 @@ if __name__ == "__main__":
                         print("failed reporting state to kafka - exiting")
                         os._exit(2)
 
+            metrics.histogram("nebula_worker_check_in_duration_seconds",
+                              "Duration of a check-in, from fetching the device_group info to queueing it's report"
+                              ).observe(time.monotonic() - check_in_start_time)
+
+    except ReplayFinished as e:
+        print(e)
+        print("finished replaying recorded traffic - exiting")
+        os._exit(0)
+
     except Exception as e:
         print(e, file=sys.stderr)
         print("failed main loop - exiting")